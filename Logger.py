@@ -1,15 +1,192 @@
 import sys
+import atexit
+import gzip
+import json
+import queue
+import threading
+import datetime
 
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+LEVEL_NAMES = {v: k for k, v in LEVELS.items()}
+FLUSH_POLL_SECONDS = 0.5  # how often flush() checks that the writer thread is still alive
+
+
+# opens a text file for appending, gzip-compressed when the name ends in .gz or compress is set
+def _open_append(filename, compress, buffering):
+    if compress or filename.endswith(".gz"):
+        return gzip.open(filename, "at", encoding="utf-8")
+    return open(filename, "a", encoding="utf-8", buffering=buffering)
+
+
+# Tees everything written to it to the terminal and to a log file.
+# Writes are handed to a background thread through a queue and written in batches, so callers
+# (and concurrent workers) never wait on disk. log()/debug()/info()/... add levels and, when
+# records_filename is given, a JSONL record per call with any extra fields passed as keywords.
+# The writer is a daemon thread, so close() also runs at exit: a campaign that crashes or is interrupted
+# still gets everything it queued. Writing to a closed Logger raises, like a closed file
 class Logger:
-    def __init__(self, filename):
+    def __init__(self, filename, buffering=65536, level=INFO, records_filename=None,
+                 compress=False, batch_size=256, terminal=True):
         self.terminal = sys.stdout
-        self.log = open(filename, "a", encoding="utf-8")
-    
+        self.level = LEVELS[level] if isinstance(level, str) else level
+        self.batch_size = batch_size
+        self.echo = terminal
+        self.log = _open_append(filename, compress, buffering) if filename else None
+        self.records = _open_append(records_filename, compress, buffering) if records_filename else None
+
+        self.queue = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self._writer, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # background thread: drains the queue and writes each batch with a single call per file
+    def _writer(self):
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._write_batch(batch):
+                return
+
+    # writes one batch; returns True when it held the stop marker of close()
+    def _write_batch(self, batch):
+        texts, records, waiters, stop = [], [], [], False
+        for entry in batch:
+            if entry is None:
+                stop = True
+            elif isinstance(entry, threading.Event):
+                waiters.append(entry)
+            elif isinstance(entry, str):
+                texts.append(entry)
+            else:
+                texts.append(entry["message"] + "\n")
+                records.append(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+        if texts:
+            text = "".join(texts)
+            if self.echo:
+                self.terminal.write(text)
+            if self.log is not None:
+                self.log.write(text)
+        if records and self.records is not None:
+            self.records.write("".join(records))
+
+        if waiters or stop:
+            self._flush_files()
+        for event in waiters:
+            event.set()
+        return stop
+
+    def _flush_files(self):
+        self.terminal.flush()
+        if self.log is not None:
+            self.log.flush()
+        if self.records is not None:
+            self.records.flush()
+
+    # file-like interface, so the Logger can replace sys.stdout
     def write(self, message):
-        self.terminal.write(message)
-        self.log.write(message)
+        if self.closed:
+            raise ValueError("I/O operation on closed Logger")
+        if message:
+            self.queue.put(message)
 
+    # blocks until everything queued so far has been written;
+    # if the writer thread has died, the rest of the queue is written from the calling thread
     def flush(self):
-        self.terminal.flush()
-        self.log.flush()
-   
\ No newline at end of file
+        if self.closed:
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        while not done.wait(FLUSH_POLL_SECONDS):
+            if not self.thread.is_alive():
+                self._write_pending()
+                return
+
+    # synchronous fallback for a dead writer thread: writes whatever is still queued
+    def _write_pending(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        self._write_batch(batch)
+
+    def is_enabled(self, level):
+        return level >= self.level
+
+    # structured log call; the record keeps the extra keyword fields (run, argument, labels, ...)
+    def log_record(self, level, message, **fields):
+        if self.closed:
+            raise ValueError("I/O operation on closed Logger")
+        if level < self.level:
+            return
+        record = {
+            "time": datetime.datetime.now().isoformat(timespec="milliseconds"),
+            "level": LEVEL_NAMES.get(level, str(level)),
+            "message": message,
+        }
+        record.update(fields)
+        self.queue.put(record)
+
+    def debug(self, message, **fields):
+        self.log_record(DEBUG, message, **fields)
+
+    def info(self, message, **fields):
+        self.log_record(INFO, message, **fields)
+
+    def warning(self, message, **fields):
+        self.log_record(WARNING, message, **fields)
+
+    def error(self, message, **fields):
+        self.log_record(ERROR, message, **fields)
+
+    def close(self):
+        if self.closed:
+            return
+        atexit.unregister(self.close)
+        self.queue.put(None)
+        self.thread.join()
+        self.closed = True
+        try:
+            if not self.queue.empty():
+                self._write_pending()
+        finally:
+            if self.log is not None:
+                self.log.close()
+            if self.records is not None:
+                self.records.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Reads back a JSONL records file (plain or .gz) and yields the records matching all the filters
+# e.g. read_records("logs/model_run.jsonl.gz", level="ERROR", run=2)
+def read_records(filename, level=None, **filters):
+    opener = gzip.open if filename.endswith(".gz") else open
+    min_level = LEVELS[level] if isinstance(level, str) else level
+    with opener(filename, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if min_level is not None and LEVELS.get(record.get("level"), 0) < min_level:
+                continue
+            if all(record.get(k) == v for k, v in filters.items()):
+                yield record
@@ -0,0 +1,92 @@
+import json
+import os
+import sys
+from analyze_results_not_binary import dimensions, encode_runs, consensus_codes, load_runs, evaluate_single_run, response_meta
+
+# label written back for each code of normalize_for_dimension, per schema
+schema_decoders = {
+    "binary_good_bad": {0: "Bad", 1: "Good"},
+    "ternary_bad_medium_good": {0: "Bad", 1: "Medium", 2: "Good"},
+    "binary_effective_ineffective": {0: "Effective", 1: "Ineffective"},
+    "numeric_1_to_5": {1: 1, 2: 2, 3: 3, 4: 4, 5: 5},
+}
+
+methods = ["majority", "weighted", "median"]
+
+
+# Turns k runs into one consensus run: a list with one label dict per argument, ready for evaluate_single_run
+# arguments where no run gave a valid label for a dimension get None for that dimension
+def aggregate_runs(all_runs, schema_name, method="majority", weights=None):
+    if weights is not None and len(weights) != len(all_runs):
+        raise ValueError(f"Expected {len(all_runs)} run weights, got {len(weights)}")
+    decoder = schema_decoders[schema_name]
+    consensus = consensus_codes(encode_runs(all_runs, schema_name), method, weights)
+    return [
+        {dim: decoder.get(int(consensus[i, d])) for d, dim in enumerate(dimensions)}
+        for i in range(consensus.shape[0])
+    ]
+
+
+# Writes the consensus next to the original file as model_responses_<name>_consensus_<method>.json
+# with a single run and the split of the original file, so every evaluator can read it
+def write_consensus_file(input_path, consensus_run, method):
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    output_path = os.path.join(os.path.dirname(input_path), f"{base_name}_consensus_{method}.json")
+    with open(output_path, "w") as f:
+        json.dump({**response_meta(input_path), "all_runs": [consensus_run]}, f, indent=2)
+    return output_path
+
+
+if __name__ == "__main__":
+    from dataset_division import test_data
+
+    schemas_map = {
+        "1": "binary_good_bad",
+        "2": "ternary_bad_medium_good",
+        "3": "binary_effective_ineffective",
+        "4": "numeric_1_to_5",
+    }
+    print("Available schemas:")
+    for key, name in schemas_map.items():
+        print(f"{key}: {name}")
+    schema_option = input("Select the label schema (1-4): ").strip()
+    if schema_option not in schemas_map:
+        print("Invalid option. Finishing execution.")
+        sys.exit(1)
+    schema_name = schemas_map[schema_option]
+
+    response_dir = "model_responses"
+    response_files = sorted(f for f in os.listdir(response_dir)
+                            if f.startswith("model_responses_") and f.endswith(".json") and "_consensus_" not in f)
+    print("Response files available:")
+    for idx, file in enumerate(response_files):
+        print(f"{idx + 1}: {file}")
+    try:
+        selected_index = int(input("Select a file by number to aggregate: ")) - 1
+    except ValueError:
+        print("Invalid input. Please enter a number.")
+        sys.exit(1)
+    if selected_index < 0 or selected_index >= len(response_files):
+        print("Invalid selection.")
+        sys.exit(1)
+
+    default_method = "median" if schema_name == "numeric_1_to_5" else "majority"
+    method = input(f"Aggregation method ({', '.join(methods)}) [{default_method}]: ").strip() or default_method
+    if method not in methods:
+        print("Invalid method.")
+        sys.exit(1)
+
+    input_path = os.path.join(response_dir, response_files[selected_index])
+    all_runs = load_runs(input_path)
+
+    weights = None
+    if method == "weighted":
+        raw = input(f"Weights for the {len(all_runs)} runs, comma separated: ").strip()
+        weights = [float(w) for w in raw.split(",")]
+
+    consensus_run = aggregate_runs(all_runs, schema_name, method, weights)
+    output_path = write_consensus_file(input_path, consensus_run, method)
+    print(f"\n--- SAVED CONSENSUS ({method}, {len(all_runs)} runs): {output_path} ---")
+
+    ground_truth = [entry["labels"] for entry in test_data]
+    evaluate_single_run(consensus_run, ground_truth, schema_name)
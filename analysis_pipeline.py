@@ -0,0 +1,253 @@
+import ast
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from analyze_results_not_binary import dimensions, load_runs
+
+RESPONSE_DIR = "model_responses"
+MANIFEST_PATH = os.path.join("evaluation", "analysis_manifest.json")  # fingerprint of every target built
+N_WORKERS = None  # None = one process per CPU, 0 = no process pool
+FT_MARKER = "ft"  # response files with this in the name also get the evaluation_ft.py report
+SCHEMA_OVERRIDES = {}  # file name -> schema, for files detect_schema gets wrong (e.g. a ternary run without Medium)
+
+# Scripts each target runs; with this file and every local module they import (target_code), editing any of
+# them rebuilds the target
+TARGET_CODE = {
+    "evaluation": ["evaluation.py", "prescreen.py"],
+    "ft_evaluation": ["evaluation_ft.py"],
+    "error_analysis": ["error_analysis.py"],
+}
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# The .py files of this folder imported by path, directly or through each other (imports inside functions too)
+def local_imports(path, found=None):
+    found = set() if found is None else found
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            module = name.split(".")[0] + ".py"
+            if os.path.exists(module) and module not in found:
+                found.add(module)
+                local_imports(module, found)
+    return found
+
+
+# Every source file a target runs: this file, its scripts and their local imports
+def target_code(target):
+    files = {"analysis_pipeline.py"}
+    for script in TARGET_CODE[target]:
+        files.add(script)
+        files |= local_imports(script)
+    return sorted(files)
+
+
+# Schema of a response file from the labels it holds
+def detect_schema(all_runs):
+    values = {str(item[dim]).strip().lower() for run in all_runs for item in run if isinstance(item, dict)
+              for dim in dimensions if item.get(dim) is not None}
+    if values & {"effective", "ineffective"}:
+        return "binary_effective_ineffective"
+    if "medium" in values:
+        return "ternary_bad_medium_good"
+    if values and all(v.replace(".", "", 1).isdigit() for v in values):
+        return "numeric_1_to_5"
+    return "binary_good_bad"
+
+
+# The split the ground truth comes from: dataset version, split ID and the stored row positions
+def split_fingerprint():
+    from dataset_division import SPLIT_DIR, SPLIT_ID, dataset_hash, get_split
+    get_split(SPLIT_ID)  # computes and stores the split the first time
+    path = os.path.join(SPLIT_DIR, dataset_hash(), f"{SPLIT_ID}.npz")
+    return f"{dataset_hash()}/{SPLIT_ID}/{_sha256(path)[:16]}"
+
+
+def thresholds():
+    from error_analysis import get_threshold
+    return {dim: get_threshold(dim) for dim in dimensions}
+
+
+# Every target of one response file: {"name", "target", "response", "schema", "outputs"}.
+# evaluation for every file, ft_evaluation for the fine-tuning files and error_analysis (Good/Bad only)
+# for the binary_good_bad ones; outputs go where the scripts put them when run by hand
+def file_targets(filename, schema):
+    path = os.path.join(RESPONSE_DIR, filename)
+    base = os.path.splitext(filename)[0].replace("model_responses_", "")
+    targets = [{"target": "evaluation", "outputs": [os.path.join("evaluation", f"evaluation_{base}.txt")]}]
+    if FT_MARKER in base:
+        targets.append({"target": "ft_evaluation",
+                        "outputs": [os.path.join("evaluation", "ft_evaluation", f"evaluation_{base}.txt")]})
+    if schema == "binary_good_bad":
+        folder = os.path.join("error_analysis_plots", f"error_{base}")
+        targets.append({"target": "error_analysis",
+                        "outputs": [os.path.join(folder, f"{dim}_error_analysis.csv") for dim in dimensions]
+                        + [os.path.join(folder, "error_severity_8plots.png")]})
+    return [{**t, "name": f"{t['target']}:{filename}", "response": path, "schema": schema} for t in targets]
+
+
+# Every target of every response file with its fingerprint: the hash of the response file, the split,
+# the schema, the thresholds and the code the target runs. A target is up to date when the manifest holds
+# the same fingerprint and all its outputs exist
+def plan_targets(manifest):
+    split = split_fingerprint()
+    limits = thresholds()
+    code = {target: {f: _sha256(f)[:16] for f in target_code(target)} for target in TARGET_CODE}
+
+    planned = []
+    for filename in sorted(f for f in os.listdir(RESPONSE_DIR) if f.startswith("model_responses_") and f.endswith(".json")):
+        path = os.path.join(RESPONSE_DIR, filename)
+        schema = SCHEMA_OVERRIDES.get(filename) or detect_schema(load_runs(path, check_split=False))
+        response_hash = _sha256(path)[:16]
+        for target in file_targets(filename, schema):
+            target["fingerprint"] = {
+                "response": response_hash,
+                "split": split,
+                "schema": schema,
+                "thresholds": limits if target["target"] == "error_analysis" else None,
+                "code": code[target["target"]],
+            }
+            previous = manifest.get(target["name"])
+            target["stale"] = (previous is None or previous["fingerprint"] != target["fingerprint"]
+                               or not all(os.path.exists(out) for out in target["outputs"]))
+            planned.append(target)
+    return planned
+
+
+# Builds one target in a worker process, the console output of the script goes to its report file
+def build_target(target):
+    from dataset_division import test_data
+    start = time.time()
+    all_runs = load_runs(target["response"])
+    ground_truth = [entry["labels"] for entry in test_data]
+    for out in target["outputs"]:
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+
+    if target["target"] == "error_analysis":
+        import warnings
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        from error_analysis import analyze_error_severity
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            analyze_error_severity(all_runs, ground_truth, os.path.dirname(target["outputs"][0]))
+        plt.close("all")
+    else:
+        with open(target["outputs"][0], "w") as f, contextlib.redirect_stdout(f):
+            print(f"Response file: {target['response']}")
+            print(f"Schema: {target['schema']}")
+            if target["target"] == "evaluation":
+                from evaluation import report_runs
+                from prescreen import round_ground_truths
+                report_runs(all_runs, round_ground_truths(ground_truth, target["schema"]), target["schema"])
+            else:
+                from evaluation_ft import report_runs
+                report_runs(all_runs, ground_truth)
+    return time.time() - start
+
+
+def load_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+# Builds the stale targets, in parallel unless n_workers is 0. The manifest is saved after every target,
+# an interrupted run keeps what it finished. Returns {name: seconds or the error message}
+def run_pipeline(targets, manifest, n_workers=N_WORKERS):
+    done = {}
+
+    def finish(target, result):
+        if isinstance(result, Exception):
+            done[target["name"]] = f"{type(result).__name__}: {result}"
+            print(f"  FAILED {target['name']}: {done[target['name']]}")
+            return
+        done[target["name"]] = result
+        manifest[target["name"]] = {"fingerprint": target["fingerprint"], "outputs": target["outputs"],
+                                    "built": time.strftime("%Y-%m-%d %H:%M:%S"), "seconds": round(result, 2)}
+        save_manifest(manifest)
+        print(f"  built {target['name']} ({result:.2f} s)")
+
+    if n_workers == 0:
+        for target in targets:
+            try:
+                result = build_target(target)
+            except Exception as e:
+                result = e
+            finish(target, result)
+        return done
+
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = {pool.submit(build_target, target): target for target in targets}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            finish(futures[future], result)
+    return done
+
+
+def print_status(targets):
+    print(f"\n{'Target':<70}{'Schema':<30}{'Status':>8}")
+    print("-" * 108)
+    for target in targets:
+        print(f"{target['name']:<70}{target['schema']:<30}{'stale' if target['stale'] else 'ok':>8}")
+
+
+def main():
+    print("1: build the out-of-date targets")
+    print("2: show the status only")
+    print("3: rebuild everything")
+    option = input("Select an option (1-3): ").strip()
+    if option not in ("1", "2", "3"):
+        print("Invalid option. Finishing execution.")
+        sys.exit(1)
+
+    start = time.time()
+    manifest = load_manifest()
+    targets = plan_targets(manifest)
+    print_status(targets)
+    if option == "2":
+        return
+
+    todo = targets if option == "3" else [t for t in targets if t["stale"]]
+    print(f"\n{len(todo)} of {len(targets)} targets to build")
+    done = run_pipeline(todo, manifest)
+    failed = [name for name, result in done.items() if isinstance(result, str)]
+    print(f"\n--- {len(done) - len(failed)} targets built, {len(failed)} failed, "
+          f"{len(targets) - len(todo)} up to date ({time.time() - start:.2f} seconds) ---")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,44 @@
+import json
 import numpy as np
-from statistics import mean
 from sklearn.metrics import confusion_matrix, classification_report
 from collections import defaultdict
 
 dimensions = ["cogency", "effectiveness", "reasonableness", "overall"]
 
+META_FIELDS = ["split", "dataset", "model", "prompt_version"]  # saved next to "all_runs" by the runners
+
+# Loads a model response file as a list of runs
+# old files are a plain list of runs; the runners save a dict with "all_runs", the split and dataset version
+# (plus "samples_per_argument" for adaptive runs, ...). Shorter runs are padded with None so every run has
+# one slot per argument. With check_split the file must come from the active split (check_response_split)
+def load_runs(path, check_split=True):
+    with open(path, "r") as f:
+        data = json.load(f)
+    if check_split:
+        check_response_split(data, path)
+    all_runs = data["all_runs"] if isinstance(data, dict) else data
+    n_args = max((len(run) for run in all_runs), default=0)
+    return [run + [None] * (n_args - len(run)) for run in all_runs]
+
+# The META_FIELDS saved with a response file, {} for the files saved as a plain list of runs
+def response_meta(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    return {k: data[k] for k in META_FIELDS if k in data} if isinstance(data, dict) else {}
+
+# The runs are paired with the test arguments of the active split by position, so a file scored on
+# another split or dataset version raises ValueError. Files that do not record their split get a warning
+def check_response_split(data, path):
+    from dataset_division import SPLIT_ID, dataset_hash
+    if not isinstance(data, dict) or "split" not in data:
+        print(f"WARNING: {path} does not record its split, it is evaluated against split {SPLIT_ID}")
+        return
+    if data["split"] != SPLIT_ID or data.get("dataset") != dataset_hash():
+        raise ValueError(f"{path} was scored on split {data['split']} of dataset {data.get('dataset')}, "
+                         f"the active split is {SPLIT_ID} of dataset {dataset_hash()} (set SPLIT_ID to evaluate it)")
+
 # normalize a value for a specific dimension based on the schema
-def normalize_for_dimension(value, schema_name, dimension_name=None):
+def normalize_for_dimension(value, schema_name, dimension_name=None, verbose=True):
     val = str(value).strip()
 
     if schema_name == "numeric_1_to_5":
@@ -45,7 +77,8 @@ def normalize_for_dimension(value, schema_name, dimension_name=None):
                 return 1  # Good
 
         except Exception as e:
-            print(f"Warning: Could not parse value '{val}' for schema 'binary_good_bad' - Error: {e}")
+            if verbose:
+                print(f"Warning: Could not parse value '{val}' for schema 'binary_good_bad' - Error: {e}")
             return None
 
 
@@ -71,7 +104,7 @@ def normalize_for_dimension(value, schema_name, dimension_name=None):
         return None
 
     elif schema_name == "binary_effective_ineffective":
-        # Model: Effective=0, Ineffective=1 ; GT similar (assumed)
+        # Model: Effective=0, Ineffective=1 ; GT: 3-5=0 (Effective), 1-2=1 (Ineffective)
         if val.lower() == "effective":
             return 0
         elif val.lower() == "ineffective":
@@ -80,9 +113,9 @@ def normalize_for_dimension(value, schema_name, dimension_name=None):
             # try to parse as integer
             try:
                 iv = int(val)
-                if iv in [1, 2]:
+                if iv in [3,4,5]:
                     return 0
-                elif iv in [3,4,5]:
+                elif iv in [1, 2]:
                     return 1
             except:
                 pass
@@ -93,17 +126,77 @@ def normalize_for_dimension(value, schema_name, dimension_name=None):
         return None
 
 # prepares scores for a specific dimension from the data
-def prepare_scores(data, dim, schema_name):
+# invalid values are returned as -1, verbose=False skips the per-value warnings
+def prepare_scores(data, dim, schema_name, verbose=True):
     scores = []
     for x in data:
-        val = normalize_for_dimension(x[dim], schema_name, dim)
+        if x is None:
+            scores.append(-1)  # argument that failed or was not sampled in this run
+            continue
+        val = normalize_for_dimension(x.get(dim), schema_name, dim, verbose)
         if val is not None:
             scores.append(val)
         else:
-            print(f"Warning: '{x[dim]}' is not in expected classes for schema '{schema_name}' and dimension '{dim}'")
+            if verbose:
+                print(f"Warning: '{x.get(dim)}' is not in expected classes for schema '{schema_name}' and dimension '{dim}'")
             scores.append(-1)
     return scores
 
+# Encodes model runs into an int array of shape (n_runs, n_args, n_dimensions) using normalize_for_dimension
+# missing arguments (None or shorter runs) and unexpected values are encoded as -1
+def encode_runs(all_runs, schema_name):
+    n_runs = len(all_runs)
+    n_args = max((len(run) for run in all_runs), default=0)
+    encoded = np.full((n_runs, n_args, len(dimensions)), -1, dtype=np.int8)
+    cache = {}  # the same few labels repeat across the whole file
+
+    for r, run in enumerate(all_runs):
+        for i, item in enumerate(run):
+            if item is None:
+                continue
+            for d, dim in enumerate(dimensions):
+                value = item.get(dim)
+                key = (d, value)
+                if key not in cache:
+                    code = normalize_for_dimension(value, schema_name, dim, verbose=False)
+                    cache[key] = -1 if code is None else code
+                encoded[r, i, d] = cache[key]
+    return encoded
+
+# Encodes the ground truth into an int array of shape (n_args, n_dimensions), invalid values are -1
+def encode_ground_truth(ground_truths, schema_name):
+    return encode_runs([ground_truths], schema_name)[0]
+
+# Vote counts per argument and dimension: returns an array (n_args, n_dimensions, n_classes)
+# codes is the (n_runs, n_args, n_dimensions) array of encode_runs, -1 values do not vote
+# weights (one per run) turns the counts into a weighted vote
+def vote_tallies(codes, n_classes, weights=None):
+    if weights is None:
+        weights = np.ones(codes.shape[0])
+    one_hot = codes[..., None] == np.arange(n_classes)
+    return np.tensordot(np.asarray(weights, dtype=float), one_hot, axes=(0, 0))
+
+# Consensus code per argument and dimension from k runs, -1 where no run gave a valid label
+# "majority" and "weighted" take the most voted class (ties go to the lowest code),
+# "median" takes the lower median of the valid codes (meant for numeric_1_to_5)
+def consensus_codes(codes, method="majority", weights=None):
+    valid = codes >= 0
+    has_votes = valid.any(axis=0)
+
+    if method == "median":
+        n_valid = valid.sum(axis=0)
+        ordered = np.sort(np.where(valid, codes, np.iinfo(codes.dtype).max), axis=0)
+        lower_median = np.take_along_axis(ordered, np.maximum(n_valid - 1, 0)[None] // 2, axis=0)[0]
+        return np.where(has_votes, lower_median, -1)
+
+    if method == "majority":
+        weights = None
+    elif method != "weighted":
+        raise ValueError(f"Unknown aggregation method '{method}'")
+    n_classes = int(codes.max(initial=0)) + 1
+    tallies = vote_tallies(codes, n_classes, weights)
+    return np.where(has_votes, np.argmax(tallies, axis=-1), -1)
+
 # prints a confusion matrix in a dynamic format
 def print_dynamic_cm(cm, labels):
     print("\nConfusion Matrix (Actual vs Predicted):")
@@ -116,29 +209,64 @@ def print_dynamic_cm(cm, labels):
         row_str = " ".join(f"{val:8.2f}" for val in row)
         print(f"{labels[i]:10}{row_str}")
 
-# Evaluates a single run against the ground truth
-def evaluate_single_run(model_outputs, ground_truths, schema_name="binary_good_bad"):
-    print("\n --- EVALUATION RESULTS (SINGLE RUN) ---\n")
+# prints a classification report given as a dict (sklearn output_dict format)
+def print_report(report):
+    print(f"{'Label':<20}{'precision':>10}{'recall':>10}{'f1-score':>10}{'support':>10}")
+    print("-" * 60)
+    for label in report:
+        m = report[label]
+        if isinstance(m, dict):
+            print(f"{label:<20}{m.get('precision', 0):10.2f}{m.get('recall', 0):10.2f}{m.get('f1-score', 0):10.2f}{m.get('support', 0):10.0f}")
+    if "accuracy" in report and not isinstance(report["accuracy"], dict):
+        print(f"\n{'accuracy':<20}{'':>20}{report['accuracy']:10.2f}")
+
+# Computes the confusion matrix and classification report of a single run for each dimension
+# returns {dim: {"cm", "labels", "report", "report_text", "n_samples", "n_invalid"}} or {dim: None} when there are
+# no valid samples; report is the sklearn dict, report_text the sklearn text the reports print
+def compute_single_run(model_outputs, ground_truths, schema_name="binary_good_bad"):
+    results = {}
     for dim in dimensions:
-        true_scores = prepare_scores(ground_truths, dim, schema_name)
-        model_scores = prepare_scores(model_outputs, dim, schema_name)
+        true_scores = prepare_scores(ground_truths, dim, schema_name, verbose=False)
+        model_scores = prepare_scores(model_outputs, dim, schema_name, verbose=False)
 
         paired = [(t, p) for t, p in zip(true_scores, model_scores) if t >= 0 and p >= 0]
         if not paired:
-            print(f"No valid samples for {dim}, skipping.")
+            results[dim] = None
             continue
 
         y_true = [t for t, p in paired]
         y_pred = [p for t, p in paired]
 
         classes = sorted(set(y_true + y_pred))
-        cm = confusion_matrix(y_true, y_pred, labels=classes)
-        report = classification_report(y_true, y_pred, labels=classes, zero_division=0)
+        results[dim] = {
+            "cm": confusion_matrix(y_true, y_pred, labels=classes),
+            "labels": [str(c) for c in classes],
+            "report": classification_report(y_true, y_pred, labels=classes, output_dict=True, zero_division=0),
+            "report_text": classification_report(y_true, y_pred, labels=classes, zero_division=0),
+            "n_samples": len(paired),
+            "n_invalid": len(true_scores) - len(paired),
+        }
+    return results
+
+# prints the results of compute_single_run
+def print_single_run(results):
+    for dim in dimensions:
+        res = results[dim]
+        if res is None:
+            print(f"No valid samples for {dim}, skipping.")
+            continue
 
         print(f"\n --- {dim.upper()} ---")
-        print_dynamic_cm(cm, [str(c) for c in classes])
+        if res["n_invalid"]:
+            print(f"Warning: {res['n_invalid']} arguments skipped (missing or unexpected labels)")
+        print_dynamic_cm(res["cm"], res["labels"])
         print("\nClassification Report:")
-        print(report)
+        print(res["report_text"])
+
+# Evaluates a single run against the ground truth
+def evaluate_single_run(model_outputs, ground_truths, schema_name="binary_good_bad"):
+    print("\n --- EVALUATION RESULTS (SINGLE RUN) ---\n")
+    print_single_run(compute_single_run(model_outputs, ground_truths, schema_name))
 
 # Confusion matrix and standard deviation across multiple runs
 def compute_avg_cm_and_std(model_outputs_runs, ground_truths, schema_name):
@@ -149,9 +277,9 @@ def compute_avg_cm_and_std(model_outputs_runs, ground_truths, schema_name):
         all_classes = set()
 
         # First: prepare all classes from the ground truth and model outputs
-        true_scores_total = prepare_scores(ground_truths, dim, schema_name)
+        true_scores_total = prepare_scores(ground_truths, dim, schema_name, verbose=False)
         for run_outputs in model_outputs_runs:
-            model_scores_total = prepare_scores(run_outputs, dim, schema_name)
+            model_scores_total = prepare_scores(run_outputs, dim, schema_name, verbose=False)
             paired_total = [(t, p) for t, p in zip(true_scores_total, model_scores_total) if t >= 0 and p >= 0]
             for t, p in paired_total:
                 all_classes.update([t, p])
@@ -165,8 +293,8 @@ def compute_avg_cm_and_std(model_outputs_runs, ground_truths, schema_name):
 
         # Second: calculate confusion matrices for each run
         for run_outputs in model_outputs_runs:
-            true_scores = prepare_scores(ground_truths, dim, schema_name)
-            model_scores = prepare_scores(run_outputs, dim, schema_name)
+            true_scores = prepare_scores(ground_truths, dim, schema_name, verbose=False)
+            model_scores = prepare_scores(run_outputs, dim, schema_name, verbose=False)
             paired = [(t, p) for t, p in zip(true_scores, model_scores) if t >= 0 and p >= 0]
             if not paired:
                 continue
@@ -188,19 +316,20 @@ def compute_avg_cm_and_std(model_outputs_runs, ground_truths, schema_name):
 
 # mean report across multiple runs
 def compute_avg_report(model_outputs_runs, ground_truths, schema_name):
-    n_runs = len(model_outputs_runs)
     avg_reports = {}
 
     for dim in dimensions:
         total_report = defaultdict(lambda: defaultdict(float))
         classes = None
+        n_used = 0  # runs with at least one valid prediction, the others are left out of the mean
 
         for run_outputs in model_outputs_runs:
-            true_scores = prepare_scores(ground_truths, dim, schema_name)
-            model_scores = prepare_scores(run_outputs, dim, schema_name)
+            true_scores = prepare_scores(ground_truths, dim, schema_name, verbose=False)
+            model_scores = prepare_scores(run_outputs, dim, schema_name, verbose=False)
             paired = [(t, p) for t, p in zip(true_scores, model_scores) if t >= 0 and p >= 0]
             if not paired:
                 continue
+            n_used += 1
             y_true = [t for t, p in paired]
             y_pred = [p for t, p in paired]
             run_classes = sorted(set(y_true + y_pred))
@@ -214,16 +343,13 @@ def compute_avg_report(model_outputs_runs, ground_truths, schema_name):
 
         averaged = {}
         for label, metrics in total_report.items():
-            averaged[label] = {k: v / n_runs for k, v in metrics.items()}
+            averaged[label] = {k: v / n_used for k, v in metrics.items()}
         avg_reports[dim] = (averaged, [str(c) for c in classes] if classes else [])
 
     return avg_reports
 
-# Evaluate multiple runs against the ground truth
-def evaluate_multiple_runs(model_outputs_runs, ground_truths, schema_name):
-    print("\n === AGGREGATED ANALYSIS OVER MULTIPLE RUNS ===\n")
-    
-    avg_cms = compute_avg_cm_and_std(model_outputs_runs, ground_truths, schema_name)
+# prints the results of compute_avg_cm_and_std and compute_avg_report
+def print_multiple_runs(avg_cms, avg_reports):
     for dim in dimensions:
         print(f"\n --- {dim.upper()} ---")
         cm_data = avg_cms[dim]
@@ -238,83 +364,99 @@ def evaluate_multiple_runs(model_outputs_runs, ground_truths, schema_name):
             print("Not enough data for this dimension.")
 
     print("\n === AVERAGE CLASSIFICATION REPORT ===")
-    avg_reports = compute_avg_report(model_outputs_runs, ground_truths, schema_name)
     for dim in dimensions:
         print(f"\n --- {dim.upper()} ---")
         report, classes = avg_reports[dim]
-        print(f"{'Label':<20}{'precision':>10}{'recall':>10}{'f1-score':>10}{'support':>10}")
-        print("-" * 60)
-        for label in report:
-            m = report[label]
-            if isinstance(m, dict):
-                print(f"{label:<20}{m.get('precision', 0):10.2f}{m.get('recall', 0):10.2f}{m.get('f1-score', 0):10.2f}{m.get('support', 0):10.0f}")
-
-# Analyze variability across runs
-def analyze_variability_across_runs(runs_outputs, ground_truths, schema_name):
-    print("\n --- VARIABILITY RESULTS BETWEEN RUNS ---\n")
-
-    n_args = len(runs_outputs[0])
-    n_runs = len(runs_outputs)
+        print_report(report)
 
+# Evaluate multiple runs against the ground truth
+def evaluate_multiple_runs(model_outputs_runs, ground_truths, schema_name):
+    print("\n === AGGREGATED ANALYSIS OVER MULTIPLE RUNS ===\n")
+    avg_cms = compute_avg_cm_and_std(model_outputs_runs, ground_truths, schema_name)
+    avg_reports = compute_avg_report(model_outputs_runs, ground_truths, schema_name)
+    print_multiple_runs(avg_cms, avg_reports)
+
+# Computes variability statistics across runs for each dimension
+# returns {dim: {...}} with the prediction matrix (rows=arguments, columns=runs, -1 = missing) and the summary numbers
+# runs may be ragged (adaptive sampling, failed arguments): each argument is measured over the samples it has
+def compute_variability_across_runs(runs_outputs, ground_truths, schema_name):
+    codes = encode_runs(runs_outputs, schema_name)
+    n_runs, n_args = codes.shape[0], codes.shape[1]
+    # like the zip pairing above, only the first n_args ground truths are compared
+    gt_codes = encode_ground_truth(ground_truths[:n_args], schema_name)
+    results = {}
+
+    for d, dim in enumerate(dimensions):
+        bin_matrix = codes[:, :, d].T  # (n_args, n_runs)
+        valid = bin_matrix >= 0
+        n_valid = valid.sum(axis=1)
+        has_preds = n_valid > 0
+        preds = np.where(valid, bin_matrix, np.nan)[has_preds]
+
+        std_by_argument = np.nanstd(preds, axis=1)
+        mean_std = float(np.mean(std_by_argument)) if has_preds.any() else 0.0
+
+        disagreement = np.zeros(n_args, dtype=bool)
+        disagreement[has_preds] = np.nanmax(preds, axis=1) != np.nanmin(preds, axis=1)
+        num_disagreements = int(disagreement.sum())
+
+        gt = gt_codes[:, d]
+        scored = has_preds & (gt >= 0)
+        matches = ((bin_matrix == gt[:, None]) & valid).sum(axis=1)
+        match_rates = matches[scored] / n_valid[scored]
+
+        total_possible = int(n_valid[gt >= 0].sum())
+        total_matches = int(matches[scored].sum())
+
+        consensus = consensus_codes(codes[:, :, d], "median" if schema_name == "numeric_1_to_5" else "majority")
+        valid_indices = np.flatnonzero(gt >= 0)
+        correct_consensus = int((consensus[valid_indices] == gt[valid_indices]).sum())
+
+        results[dim] = {
+            "n_args": n_args,
+            "n_runs": n_runs,
+            "samples_per_argument": n_valid,
+            "prediction_matrix": bin_matrix,
+            "mean_std": mean_std,
+            "num_disagreements": num_disagreements,
+            "proportion_disagreement": num_disagreements / n_args if n_args else 0,
+            "overall_accuracy": total_matches / total_possible if total_possible > 0 else 0,
+            "mean_accuracy_per_argument": float(np.mean(match_rates)) if match_rates.size else 0,
+            "std_accuracy_per_argument": float(np.std(match_rates)) if match_rates.size else 0,
+            "fully_correct": int(np.sum(matches[scored] == n_valid[scored])),
+            "medium_correct": int(np.sum((matches[scored] >= n_valid[scored] * 0.5) & (matches[scored] < n_valid[scored]))),
+            "low_correct": int(np.sum(matches[scored] < n_valid[scored] * 0.5)),
+            "accuracy_consensus": correct_consensus / len(valid_indices) if len(valid_indices) else 0,
+        }
+
+    return results
+
+# prints the results of compute_variability_across_runs
+def print_variability(results):
     for dim in dimensions:
+        res = results[dim]
+        n_args = res["n_args"]
         print(f"\n --- VARIABILITY IN {dim.upper()} ---")
-        gt_scores = prepare_scores(ground_truths, dim, schema_name)
-
-        bin_matrix = np.array([
-            [
-                normalize_for_dimension(run[i][dim], schema_name, dim)
-                for run in runs_outputs
-            ]
-            for i in range(n_args)
-        ])
-
-        std_by_argument = np.std(bin_matrix, axis=1)
-        mean_std = mean(std_by_argument)
-
-        disagreement_flags = [len(set(row)) > 1 for row in bin_matrix]
-        num_disagreements = sum(disagreement_flags)
-        proportion_disagreement = num_disagreements / n_args
 
         print(f"\nVariability between runs:")
-        print(f"Mean standard deviation per argument: {mean_std:.2f}")
-        print(f"Arguments with disagreement: {num_disagreements} / {n_args} ({proportion_disagreement:.2%})")
-
-        matches_per_argument = []
-        for i in range(n_args):
-            gt = gt_scores[i]
-            if gt < 0:
-                continue
-            run_preds = bin_matrix[i]
-            num_matches = sum(1 for pred in run_preds if pred == gt)
-            matches_per_argument.append(num_matches)
-
-        total_possible = n_runs * n_args
-        total_matches = sum(matches_per_argument)
-        overall_accuracy = total_matches / total_possible if total_possible > 0 else 0
-
-        mean_accuracy_per_argument = mean([m / n_runs for m in matches_per_argument])
-        std_accuracy_per_argument = np.std([m / n_runs for m in matches_per_argument])
+        print(f"Mean standard deviation per argument: {res['mean_std']:.2f}")
+        print(f"Arguments with disagreement: {res['num_disagreements']} / {n_args} ({res['proportion_disagreement']:.2%})")
 
-        fully_correct = sum(1 for m in matches_per_argument if m == n_runs)
-        medium_correct = sum(1 for m in matches_per_argument if n_runs * 0.5 <= m < n_runs)
-        low_correct = sum(1 for m in matches_per_argument if m < n_runs * 0.5)
-
-        print(f"\nOverall accuracy vs Ground Truth (mean across all runs and arguments): {overall_accuracy:.2%}")
-        print(f"Mean accuracy per argument: {mean_accuracy_per_argument:.2%}")
-        print(f"Standard deviation of accuracy per argument: {std_accuracy_per_argument:.2%}")
+        print(f"\nOverall accuracy vs Ground Truth (mean across all runs and arguments): {res['overall_accuracy']:.2%}")
+        print(f"Mean accuracy per argument: {res['mean_accuracy_per_argument']:.2%}")
+        print(f"Standard deviation of accuracy per argument: {res['std_accuracy_per_argument']:.2%}")
 
         print(f"\nDistribution of arguments by run accuracy rate:")
-        print(f"- {fully_correct} arguments ({fully_correct / n_args:.2%}) fully correct in 100% of runs.")
-        print(f"- {medium_correct} arguments ({medium_correct / n_args:.2%}) correct in 50% to 99% of runs.")
-        print(f"- {low_correct} arguments ({low_correct / n_args:.2%}) correct in less than 50% of runs.")
+        print(f"- {res['fully_correct']} arguments ({res['fully_correct'] / n_args:.2%}) fully correct in 100% of runs.")
+        print(f"- {res['medium_correct']} arguments ({res['medium_correct'] / n_args:.2%}) correct in 50% to 99% of runs.")
+        print(f"- {res['low_correct']} arguments ({res['low_correct'] / n_args:.2%}) correct in less than 50% of runs.")
 
         print("\nPrediction matrix by argument (rows=arguments, columns=runs):")
-        print(bin_matrix)
-
-        rounded_means = np.rint(np.mean(bin_matrix, axis=1)).astype(int)
-        valid_indices = [i for i, gt in enumerate(gt_scores) if gt >= 0]
+        print(res["prediction_matrix"])
 
-        correct_avg_preds = sum(1 for i in valid_indices if rounded_means[i] == gt_scores[i])
-        accuracy_avg_preds = correct_avg_preds / len(valid_indices) if valid_indices else 0
+        print(f"\nAccuracy of the consensus label per argument (majority vote, median for numeric) vs Ground Truth: {res['accuracy_consensus']:.2%}")
 
-        print(f"\nAccuracy using rounded average of predictions per argument vs Ground Truth: {accuracy_avg_preds:.2%}")
+# Analyze variability across runs
+def analyze_variability_across_runs(runs_outputs, ground_truths, schema_name):
+    print("\n --- VARIABILITY RESULTS BETWEEN RUNS ---\n")
+    print_variability(compute_variability_across_runs(runs_outputs, ground_truths, schema_name))
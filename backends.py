@@ -0,0 +1,417 @@
+import json
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import requests
+
+# Generation options use Ollama's names (num_predict, num_ctx, temperature, top_p, seed, stop),
+# the other backends translate the ones they support and ignore the rest.
+# generate_logprobs returns {"response": text, "logprobs": [{"token", "logprob", "top_logprobs": {token: logprob}}]}
+# with one entry per generated token, whatever the server format.
+
+
+class BackendError(Exception):
+    pass
+
+
+# Ollama server, /api/generate. url may be the server root or the full generate endpoint
+class OllamaBackend:
+    name = "ollama"
+
+    def __init__(self, model, url="http://localhost:11434", timeout=None):
+        self.model = model
+        self.base_url = url.rstrip("/").removesuffix("/api/generate")
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    # Returns Ollama's response dict ("response", "prompt_eval_count", "load_duration", ...)
+    # extra keyword arguments go to the top level of the request (keep_alive, format, ...)
+    def generate_raw(self, prompt, options=None, **payload):
+        body = {"model": self.model, "prompt": prompt, "stream": False}
+        if options:
+            body["options"] = options
+        body.update(payload)
+        res = self.session.post(f"{self.base_url}/api/generate", json=body, timeout=self.timeout)
+        if res.status_code != 200:
+            raise BackendError(res.text)
+        return res.json()
+
+    def generate(self, prompt, options=None, **payload):
+        return self.generate_raw(prompt, options, **payload).get("response", "{}")
+
+    # Ollama scores one prompt per request, the batch is sent sequentially
+    def generate_batch(self, prompts, options=None, **payload):
+        return [self.generate(prompt, options, **payload) for prompt in prompts]
+
+    # Streamed generate_raw that can be abandoned: once the cancel event is set the connection is closed at
+    # the next chunk, which makes Ollama stop generating. Returns the same dict as generate_raw
+    def generate_cancellable(self, prompt, options=None, cancel=None, **payload):
+        body = {"model": self.model, "prompt": prompt, "stream": True}
+        if options:
+            body["options"] = options
+        body.update(payload)
+        pieces, logprobs = [], []
+        with self.session.post(f"{self.base_url}/api/generate", json=body, timeout=self.timeout, stream=True) as res:
+            if res.status_code != 200:
+                raise BackendError(res.text)
+            for line in res.iter_lines():
+                if cancel is not None and cancel.is_set():
+                    raise BackendError("Cancelled")
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    raise BackendError(chunk["error"])
+                pieces.append(chunk.get("response", ""))
+                logprobs.extend(chunk.get("logprobs") or [])
+                if chunk.get("done"):
+                    chunk["response"] = "".join(pieces)
+                    if logprobs:
+                        chunk["logprobs"] = logprobs
+                    return chunk
+        raise BackendError("The stream ended before the generation was done")
+
+    # Needs an Ollama version with logprobs support in /api/generate
+    def generate_logprobs(self, prompt, options=None, top_logprobs=5, **payload):
+        data = self.generate_raw(prompt, options, logprobs=True, top_logprobs=top_logprobs, **payload)
+        return {"response": data.get("response", ""), "logprobs": ollama_logprobs(data)}
+
+    # One embedding per text from /api/embed; model overrides the generation model (e.g. nomic-embed-text)
+    def embed(self, texts, model=None):
+        body = {"model": model or self.model, "input": list(texts)}
+        res = self.session.post(f"{self.base_url}/api/embed", json=body, timeout=self.timeout)
+        if res.status_code != 200:
+            raise BackendError(res.text)
+        return res.json()["embeddings"]
+
+    def health(self):
+        try:
+            return self.session.get(f"{self.base_url}/api/tags", timeout=5).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+
+# Any OpenAI-compatible server (llama.cpp server, vLLM, ...), /v1/completions
+class OpenAICompatibleBackend:
+    name = "openai"
+
+    def __init__(self, model, url="http://localhost:8080/v1", timeout=None, api_key=None):
+        self.model = model
+        self.base_url = url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _body(self, prompt, options):
+        options = options or {}
+        body = {"model": self.model, "prompt": prompt}
+        if "num_predict" in options:
+            body["max_tokens"] = options["num_predict"]
+        for key in ["temperature", "top_p", "seed", "stop"]:
+            if key in options:
+                body[key] = options[key]
+        return body
+
+    def _post(self, body):
+        res = self.session.post(f"{self.base_url}/completions", json=body, timeout=self.timeout)
+        if res.status_code != 200:
+            raise BackendError(res.text)
+        return res.json()
+
+    # Normalized to the Ollama field names used by the runners
+    def generate_raw(self, prompt, options=None, **payload):
+        body = self._body(prompt, options)
+        body.update(payload)
+        data = self._post(body)
+        choice = data["choices"][0]
+        usage = data.get("usage", {})
+        return {
+            "response": choice.get("text", "{}"),
+            "logprobs": choice.get("logprobs"),
+            "prompt_eval_count": usage.get("prompt_tokens"),
+            "eval_count": usage.get("completion_tokens"),
+        }
+
+    def generate(self, prompt, options=None, **payload):
+        return self.generate_raw(prompt, options, **payload)["response"]
+
+    def generate_logprobs(self, prompt, options=None, top_logprobs=5):
+        data = self.generate_raw(prompt, options, logprobs=top_logprobs)
+        return {"response": data["response"], "logprobs": openai_logprobs(data["logprobs"])}
+
+    # /v1/completions takes a list of prompts, the server batches them
+    def generate_batch(self, prompts, options=None, **payload):
+        body = self._body(list(prompts), options)
+        body.update(payload)
+        choices = sorted(self._post(body)["choices"], key=lambda c: c.get("index", 0))
+        return [c.get("text", "{}") for c in choices]
+
+    def embed(self, texts, model=None):
+        body = {"model": model or self.model, "input": list(texts)}
+        res = self.session.post(f"{self.base_url}/embeddings", json=body, timeout=self.timeout)
+        if res.status_code != 200:
+            raise BackendError(res.text)
+        data = sorted(res.json()["data"], key=lambda d: d.get("index", 0))
+        return [d["embedding"] for d in data]
+
+    def health(self):
+        try:
+            return self.session.get(f"{self.base_url}/models", timeout=5).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+
+# In-process CPU engine. engine="llama_cpp" loads a GGUF file with llama-cpp-python,
+# engine="transformers" loads a Hugging Face model and generates whole batches in one call.
+# Neither package is in requirements.txt, install the one you need.
+class LocalBackend:
+    name = "local"
+
+    # timeout is accepted so the runners can build every backend the same way, in-process calls do not time out
+    def __init__(self, model, engine="llama_cpp", n_ctx=4096, n_threads=None, timeout=None):
+        self.model = model
+        self.engine = engine
+        if engine == "llama_cpp":
+            try:
+                from llama_cpp import Llama
+            except ImportError:
+                raise ImportError("The llama_cpp engine needs llama-cpp-python: pip install llama-cpp-python")
+            self.llm = Llama(model_path=model, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        elif engine == "transformers":
+            try:
+                import torch
+                from transformers import AutoModelForCausalLM, AutoTokenizer
+            except ImportError:
+                raise ImportError("The transformers engine needs torch and transformers: pip install torch transformers")
+            if n_threads:
+                torch.set_num_threads(n_threads)
+            self.torch = torch
+            self.tokenizer = AutoTokenizer.from_pretrained(model, padding_side="left")
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token
+            self.lm = AutoModelForCausalLM.from_pretrained(model)
+            self.lm.eval()
+        else:
+            raise ValueError(f"Unknown local engine '{engine}'")
+
+    def _generate_transformers(self, prompts, options):
+        options = options or {}
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        temperature = options.get("temperature", 0)
+        kwargs = {"max_new_tokens": options.get("num_predict", 128), "pad_token_id": self.tokenizer.pad_token_id}
+        if temperature > 0:
+            kwargs.update(do_sample=True, temperature=temperature, top_p=options.get("top_p", 1.0))
+        else:
+            kwargs["do_sample"] = False
+        with self.torch.no_grad():
+            output = self.lm.generate(**inputs, **kwargs)
+        new_tokens = output[:, inputs["input_ids"].shape[1]:]
+        return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+    # engine errors are raised as BackendError, like the HTTP backends, so the runners' retries catch them
+    def generate_raw(self, prompt, options=None, **payload):
+        options = options or {}
+        if self.engine == "transformers":
+            return {"response": self.generate_batch([prompt], options)[0]}
+        try:
+            out = self.llm(prompt, max_tokens=options.get("num_predict", 128),
+                           temperature=options.get("temperature", 0.8), top_p=options.get("top_p", 0.95),
+                           seed=options.get("seed", -1), stop=options.get("stop"),
+                           logprobs=payload.get("top_logprobs"))
+        except Exception as e:
+            raise BackendError(f"llama_cpp generation failed: {e}") from e
+        usage = out.get("usage", {})
+        return {
+            "response": out["choices"][0]["text"],
+            "logprobs": out["choices"][0].get("logprobs"),
+            "prompt_eval_count": usage.get("prompt_tokens"),
+            "eval_count": usage.get("completion_tokens"),
+        }
+
+    def generate(self, prompt, options=None, **payload):
+        return self.generate_raw(prompt, options, **payload)["response"]
+
+    def generate_logprobs(self, prompt, options=None, top_logprobs=5):
+        if self.engine == "transformers":
+            raise BackendError("Logprobs are only available with the llama_cpp engine")
+        data = self.generate_raw(prompt, options, top_logprobs=top_logprobs)
+        return {"response": data["response"], "logprobs": openai_logprobs(data["logprobs"])}
+
+    # transformers pads the prompts and generates them as one batch;
+    # llama-cpp-python has no multi-sequence API, so its batch runs one prompt after another
+    def generate_batch(self, prompts, options=None, **payload):
+        if self.engine == "transformers":
+            try:
+                return self._generate_transformers(list(prompts), options)
+            except Exception as e:
+                raise BackendError(f"transformers generation failed: {e}") from e
+        return [self.generate(prompt, options, **payload) for prompt in prompts]
+
+    def embed(self, texts, model=None):
+        raise BackendError("The local backend does not embed, use an ollama or openai backend for embeddings")
+
+    def health(self):
+        return True
+
+
+# Ollama format: a "logprobs" list in the /api/generate response, one {"token", "logprob", "top_logprobs"} per token
+def ollama_logprobs(data):
+    if not data.get("logprobs"):
+        raise BackendError("The server returned no logprobs, Ollama needs logprobs support in /api/generate")
+    return [
+        {"token": t["token"], "logprob": t["logprob"],
+         "top_logprobs": {c["token"]: c["logprob"] for c in t.get("top_logprobs") or []}}
+        for t in data["logprobs"]
+    ]
+
+
+# OpenAI completions format (also llama-cpp-python): parallel lists tokens, token_logprobs, top_logprobs
+def openai_logprobs(logprobs):
+    if not logprobs:
+        raise BackendError("The server returned no logprobs")
+    tops = logprobs.get("top_logprobs") or [{}] * len(logprobs["tokens"])
+    return [
+        {"token": token, "logprob": logprob, "top_logprobs": dict(top or {})}
+        for token, logprob, top in zip(logprobs["tokens"], logprobs["token_logprobs"], tops)
+    ]
+
+
+# Hedged requests over several endpoints serving the same model: a request goes to one endpoint (round
+# robin) and, if it has not finished after the `percentile` latency of the last `history` requests, a
+# duplicate goes to the next endpoint. The first valid response wins and the other request is cancelled
+# (Ollama endpoints stream and are closed; other backends cannot be interrupted, their late result is
+# dropped). No hedging until min_history latencies are known, but a primary that fails is always retried
+# on the next endpoint right away. The history holds the latencies of the primary requests only: a
+# primary cancelled because the duplicate won counts with the time it had run, a lower bound
+class HedgedBackend:
+    name = "hedged"
+
+    def __init__(self, backends, percentile=95, history=200, min_history=20):
+        self.backends = list(backends)
+        self.model = self.backends[0].model
+        self.percentile = percentile
+        self.min_history = min_history
+        self.latencies = deque(maxlen=history)  # primary-request latencies, they set the hedge delay
+        self.request_latencies = []  # end-to-end latency of every hedged call, for the report
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.next_index = 0
+        self.pool = ThreadPoolExecutor(max_workers=2 * len(self.backends) + 2)
+
+    def hedge_delay(self):
+        with self.lock:
+            if len(self.latencies) < self.min_history:
+                return None
+            return float(np.percentile(self.latencies, self.percentile))
+
+    def _call(self, backend, prompt, options, cancel, payload):
+        start = time.time()
+        if hasattr(backend, "generate_cancellable"):
+            data = backend.generate_cancellable(prompt, options, cancel, **payload)
+        else:
+            data = backend.generate_raw(prompt, options, **payload)
+        return data, time.time() - start
+
+    def generate_raw(self, prompt, options=None, **payload):
+        with self.lock:
+            first = self.next_index
+            self.next_index = (first + 1) % len(self.backends)
+            self.counts["requests"] += 1
+        start = time.time()
+        cancels = {}
+
+        def submit(index):
+            cancel = threading.Event()
+            future = self.pool.submit(self._call, self.backends[index], prompt, options, cancel, payload)
+            cancels[future] = cancel
+            return future
+
+        primary = submit(first)
+        pending = {primary}
+        hedge = None
+        delay = self.hedge_delay()
+        if len(self.backends) > 1 and delay is not None:
+            done, _ = wait(pending, timeout=delay)
+            if not done:
+                hedge = submit((first + 1) % len(self.backends))
+                pending.add(hedge)
+                with self.lock:
+                    self.counts["hedged"] += 1
+
+        result, error = None, None
+        while pending and result is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    data, elapsed = future.result()
+                except (BackendError, requests.exceptions.RequestException) as e:
+                    error = e
+                    if future is primary and hedge is None and len(self.backends) > 1:
+                        hedge = submit((first + 1) % len(self.backends))
+                        pending.add(hedge)
+                        with self.lock:
+                            self.counts["failover"] += 1
+                    continue
+                result = data
+                with self.lock:
+                    if future is primary:
+                        self.latencies.append(elapsed)
+                    elif primary in pending:
+                        self.counts["hedge_wins"] += 1
+                        self.latencies.append(time.time() - start)
+                break
+        for future in pending:
+            cancels[future].set()
+        with self.lock:
+            self.request_latencies.append(time.time() - start)
+        if result is None:
+            raise error
+        return result
+
+    def generate(self, prompt, options=None, **payload):
+        return self.generate_raw(prompt, options, **payload).get("response", "{}")
+
+    def generate_batch(self, prompts, options=None, **payload):
+        return [self.generate(prompt, options, **payload) for prompt in prompts]
+
+    def embed(self, texts, model=None):
+        return self.backends[0].embed(texts, model)
+
+    def health(self):
+        return any(backend.health() for backend in self.backends)
+
+    # Hedge rate, how often the duplicate won, the current hedge delay and the latency percentiles
+    def hedge_report(self):
+        with self.lock:
+            latencies = list(self.request_latencies)
+            counts = Counter(self.counts)
+        report = {
+            "requests": counts["requests"],
+            "hedged": counts["hedged"],
+            "hedge_rate": counts["hedged"] / counts["requests"] if counts["requests"] else 0.0,
+            "hedge_wins": counts["hedge_wins"],
+            "failover": counts["failover"],
+            "hedge_delay": self.hedge_delay(),
+        }
+        for p in (50, 95, 99):
+            report[f"p{p}"] = float(np.percentile(latencies, p)) if latencies else None
+        return report
+
+
+backend_classes = {
+    "ollama": OllamaBackend,
+    "openai": OpenAICompatibleBackend,
+    "local": LocalBackend,
+}
+
+
+# Builds a backend by name: "ollama", "openai" or "local"
+def get_backend(name, model, url=None, **kwargs):
+    if name not in backend_classes:
+        raise ValueError(f"Unknown backend '{name}', choose one of {list(backend_classes)}")
+    if url is not None and name != "local":
+        kwargs["url"] = url
+    return backend_classes[name](model, **kwargs)
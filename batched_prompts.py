@@ -0,0 +1,253 @@
+import datetime
+import json
+import os
+import re
+import sys
+import time
+import contextlib
+import requests
+from Logger import Logger
+from backends import get_backend, BackendError
+from analyze_results_not_binary import dimensions, compute_single_run
+
+BATCH_SIZES = [1, 2, 4, 8]  # K values compared by the sweep
+SWEEP_ARGUMENTS = 100  # test arguments scored for every K
+MAX_RETRIES = 5  # per argument, for the arguments a batch fails to label
+CHARS_PER_TOKEN = 4  # token estimate when the server does not report prompt_eval_count
+LOG_LEVEL = "INFO"
+LOG_DIR = "logs"
+LOG_TO_FILE = True
+# sweep response files, kept out of model_responses/ itself: they hold only the first SWEEP_ARGUMENTS arguments
+OUTPUT_DIR = os.path.join("model_responses", "batched_prompts")
+VALUE_START = re.compile(r"[\[{]")
+
+
+# The K arguments after one header, numbered so every label object can say which argument it belongs to
+def batch_prompt(header, arguments, response_marker="###YOUR RESPONSE###"):
+    numbered = "\n".join(f"###ARGUMENT {n}###\n{arg.strip()}\n" for n, arg in enumerate(arguments, 1))
+    return (f"{header}\n\nThere are {len(arguments)} arguments below, evaluate each one independently.\n\n{numbered}\n"
+            f"{response_marker} (Only respond with a JSON array of {len(arguments)} objects, one per argument "
+            f"in the same order, each with an \"argument\" field holding its number and the four dimensions)")
+
+
+# Every JSON value that starts at a "[" or "{" of the text, in order, skipping the ones inside another value.
+# Tolerates code fences and text around the JSON; the doubled braces some prompts show in their examples
+# are undone only when nothing parses as it is
+def _json_values(text):
+    decoder = json.JSONDecoder()
+    for candidate in (text, text.replace("{{", "{").replace("}}", "}")):
+        values, pos = [], 0
+        while True:
+            match = VALUE_START.search(candidate, pos)
+            if not match:
+                break
+            try:
+                value, end = decoder.raw_decode(candidate, match.start())
+            except json.JSONDecodeError:
+                pos = match.start() + 1
+                continue
+            values.append(value)
+            pos = end
+        if values:
+            return values
+    return []
+
+
+# Parses a batched response into k label dicts (None where an argument got no valid labels).
+# The response should be an array of k objects; objects outside an array are accepted too. Objects are
+# placed by their "argument" number when every one has a valid one, otherwise by order, and only when
+# there are exactly k of them (with a missing object the order says nothing about which one is missing).
+# parse_one validates a single object (the extract_labels of the runner)
+def parse_label_array(text, k, parse_one):
+    if not text:
+        return [None] * k
+    objects = []
+    for value in _json_values(text):
+        if isinstance(value, list):
+            objects.extend(v for v in value if isinstance(v, dict))
+        elif isinstance(value, dict):
+            objects.append(value)
+
+    slots = [None] * k
+    numbers = [obj.get("argument") for obj in objects]
+    if objects and all(isinstance(n, int) and 1 <= n <= k for n in numbers) and len(set(numbers)) == len(numbers):
+        for n, obj in zip(numbers, objects):
+            slots[n - 1] = obj
+    elif len(objects) == k:
+        slots = objects
+    return [parse_one(json.dumps(obj)) if obj is not None else None for obj in slots]
+
+
+# Token counts of a generate_raw response, estimated from the prompt length when the server does not say
+def prompt_tokens(data, prompt):
+    return data.get("prompt_eval_count") or len(prompt) // CHARS_PER_TOKEN
+
+
+# Scores arguments K at a time. A failed batch request or the arguments it did not label are re-queried
+# one by one with the single-argument prompt, up to MAX_RETRIES times each.
+# build_batch(args, shots) and build_single(arg, shots) give the prompts (the build_prompt signature of the
+# runners), shots is the optional per-argument few-shot list, a batch takes the shots of its first argument.
+# parse_one is the single-object parser. should_stop() is checked before every batch, once it returns True
+# the remaining arguments are left as None. on_response(i, text, attempt, **fields), if given, receives every
+# raw response: a batch response once per argument of the batch, with its batch_position and batch_size.
+# Returns the labels of every argument and counters: requests, prompt_tokens, fallback arguments and
+# scored, the number of arguments reached (len(arguments) unless stopped)
+def score_batched(backend, arguments, batch_size, build_batch, build_single, parse_one, logger, options=None,
+                  shots=None, should_stop=None, on_response=None):
+    labels = [None] * len(arguments)
+    stats = {"requests": 0, "prompt_tokens": 0, "fallback": 0, "failed": 0, "seconds": 0.0,
+             "scored": len(arguments)}
+    start = time.time()
+
+    for first in range(0, len(arguments), batch_size):
+        if should_stop is not None and should_stop():
+            stats["scored"] = first
+            break
+        chunk = list(range(first, min(first + batch_size, len(arguments))))
+        if batch_size == 1:
+            # K = 1 is the plain single-argument prompt, the baseline of the sweep
+            prompt = build_single(arguments[first], shots[first] if shots else None)
+        else:
+            prompt = build_batch([arguments[i] for i in chunk], shots[first] if shots else None)
+        batch_options = dict(options or {})
+        if "num_predict" in batch_options:
+            batch_options["num_predict"] *= len(chunk)
+        try:
+            data = backend.generate_raw(prompt, batch_options or None)
+            stats["requests"] += 1
+            stats["prompt_tokens"] += prompt_tokens(data, prompt)
+            if batch_size == 1:
+                parsed = [parse_one(data.get("response", ""))]
+            else:
+                parsed = parse_label_array(data.get("response", ""), len(chunk), parse_one)
+            if on_response is not None:
+                for n, i in enumerate(chunk):
+                    fields = {"batch_position": n, "batch_size": len(chunk)} if batch_size > 1 else {}
+                    on_response(i, data.get("response", ""), 0, **fields)
+        except (BackendError, requests.exceptions.RequestException) as e:
+            logger.error(f"Batch request for arguments {chunk[0] + 1}-{chunk[-1] + 1} failed: {e}")
+            parsed = [None] * len(chunk)
+
+        for i, item in zip(chunk, parsed):
+            labels[i] = item
+        missing = [i for i, item in zip(chunk, parsed) if item is None]
+        logger.info(f"Arguments {chunk[0] + 1}-{chunk[-1] + 1}: {len(chunk) - len(missing)} labelled by the batch",
+                    arguments=[i + 1 for i in chunk], missing=[i + 1 for i in missing])
+
+        for i in missing:
+            stats["fallback"] += 1
+            for retry in range(MAX_RETRIES):
+                prompt = build_single(arguments[i], shots[i] if shots else None)
+                try:
+                    data = backend.generate_raw(prompt, options)
+                except (BackendError, requests.exceptions.RequestException) as e:
+                    logger.error(f"Request failed: {e}")
+                    continue
+                stats["requests"] += 1
+                stats["prompt_tokens"] += prompt_tokens(data, prompt)
+                if on_response is not None:
+                    on_response(i, data.get("response", ""), retry + 1)
+                labels[i] = parse_one(data.get("response", ""))
+                if labels[i] is not None:
+                    break
+                logger.warning(f"Retry {retry + 1} for argument {i + 1} due to invalid response.",
+                               argument=i + 1, retry=retry + 1)
+            else:
+                stats["failed"] += 1
+                logger.error(f"Failed to process argument {i + 1} after {MAX_RETRIES} retries. Skipping.",
+                             argument=i + 1)
+    stats["seconds"] = time.time() - start
+    return labels, stats
+
+
+# One row per K: requests and prompt tokens per argument, the share of the K = 1 prompt tokens saved,
+# the arguments that needed the fallback and the accuracy of every dimension against the ground truth
+def compute_amortization(sweep, ground_truths, schema_name):
+    baseline = None
+    rows = []
+    for k, (labels, stats) in sorted(sweep.items()):
+        n = len(labels)
+        tokens_per_argument = stats["prompt_tokens"] / n if n else 0.0
+        if baseline is None:
+            baseline = tokens_per_argument
+        results = compute_single_run(labels, ground_truths[:n], schema_name)
+        rows.append({
+            "k": k,
+            "requests_per_argument": stats["requests"] / n if n else 0.0,
+            "tokens_per_argument": tokens_per_argument,
+            "tokens_saved": 1 - tokens_per_argument / baseline if baseline else 0.0,
+            "fallback_rate": stats["fallback"] / n if n else 0.0,
+            "failed": stats["failed"],
+            "seconds_per_argument": stats["seconds"] / n if n else 0.0,
+            "accuracy": {dim: results[dim]["report"]["accuracy"] if results[dim] else None for dim in dimensions},
+        })
+    return rows
+
+
+def print_amortization(rows):
+    print(f"\n{'K':>3}{'req/arg':>9}{'tok/arg':>9}{'saved':>8}{'fallback':>10}{'failed':>8}{'s/arg':>7}"
+          + "".join(f"{dim:>16}" for dim in dimensions))
+    base = rows[0]["accuracy"] if rows else {}
+    for row in rows:
+        acc = ""
+        for dim in dimensions:
+            a = row["accuracy"][dim]
+            if a is None:
+                acc += f"{'-':>16}"
+            elif row is rows[0] or base[dim] is None:
+                acc += f"{a:>16.2%}"
+            else:
+                acc += f"{f'{a:.2%} ({(a - base[dim]) * 100:+.1f})':>16}"
+        print(f"{row['k']:>3}{row['requests_per_argument']:>9.2f}{row['tokens_per_argument']:>9.0f}"
+              f"{row['tokens_saved']:>8.1%}{row['fallback_rate']:>10.1%}{row['failed']:>8}"
+              f"{row['seconds_per_argument']:>7.2f}{acc}")
+
+
+# Sweeps BATCH_SIZES over the first SWEEP_ARGUMENTS test arguments with the model.py prompts
+def main():
+    import model
+    from dataset_division import split_meta, test_data
+
+    print("\nSelect version of prompt (1 to 5):")
+    version = int(input("Enter version number: "))
+    if version not in model.version_schemas:
+        print("Invalid version.")
+        sys.exit(1)
+    schema_name = model.version_schemas[version]
+
+    date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+    os.makedirs(LOG_DIR, exist_ok=True)
+    logger = Logger(os.path.join(LOG_DIR, f"batched_prompts_{date}.log"), level=LOG_LEVEL)
+    backend = get_backend(model.BACKEND, model.MODEL_NAME, model.API_URL)
+    model.configure(version, logger, backend)
+
+    arguments = model.arguments[:SWEEP_ARGUMENTS]
+    ground_truths = [entry["labels"] for entry in test_data[:len(arguments)]]
+    if schema_name != "binary_good_bad":
+        from prescreen import round_ground_truths
+        ground_truths = round_ground_truths(ground_truths, schema_name)
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    sweep = {}
+    for k in BATCH_SIZES:
+        logger.info(f"\n--- K = {k} ---", batch_size=k)
+        sweep[k] = score_batched(backend, arguments, k, model.build_batch_prompt, model.build_prompt,
+                                 model.extract_labels, logger)
+        with open(os.path.join(OUTPUT_DIR, f"model_responses_batched_k{k}_{date}.json"), "w") as f:
+            json.dump({**split_meta(), "model": model.MODEL_NAME, "prompt_version": f"v{version}_batched_k{k}",
+                       "all_runs": [sweep[k][0]]}, f, indent=2)
+    logger.close()
+
+    print(f"\n--- BATCHED PROMPTS: version {version}, {len(arguments)} arguments ---")
+    print_amortization(compute_amortization(sweep, ground_truths, schema_name))
+
+
+if __name__ == "__main__":
+    if LOG_TO_FILE:
+        log_dir = "evaluation"
+        os.makedirs(log_dir, exist_ok=True)
+        date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+        with Logger(os.path.join(log_dir, f"batched_prompts_{date}.txt")) as logger, contextlib.redirect_stdout(logger):
+            main()
+    else:
+        main()
@@ -0,0 +1,220 @@
+import datetime
+import json
+import os
+import sys
+import time
+import tracemalloc
+import tempfile
+import contextlib
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")  # plots are only written to disk while benchmarking
+
+import analyze_results
+import analyze_results_not_binary
+import evaluation_ft
+import error_analysis
+
+# Benchmark sizes as (number of arguments, number of runs)
+BENCH_SIZES = [(1000, 5), (10000, 20)]
+SEED = 42
+MEASURE_MEMORY = True  # second pass under tracemalloc (slower, so timings come from the first pass)
+BENCH_DATA_DIR = "benchmark_data"
+BENCH_OUTPUT = "bench_output.txt"
+BASELINE_FILE = "bench_baseline.json"
+REGRESSION_TOLERANCE = 0.25  # flag timings more than 25% slower than the baseline
+
+dimensions = ["cogency", "effectiveness", "reasonableness", "overall"]
+
+schemas = [
+    "binary_good_bad",
+    "ternary_bad_medium_good",
+    "binary_effective_ineffective",
+    "numeric_1_to_5",
+]
+
+# label vocabulary the model answers with for each schema, ordered by the code normalize_for_dimension gives them
+schema_labels = {
+    "binary_good_bad": ["Bad", "Good"],
+    "ternary_bad_medium_good": ["Bad", "Medium", "Good"],
+    "binary_effective_ineffective": ["Effective", "Ineffective"],
+    "numeric_1_to_5": [1, 2, 3, 4, 5],
+}
+
+
+# Generates ground truth scores shaped like dataset.csv (means of three annotators)
+# Non-binary schemas only accept integer ground truth in normalize_for_dimension, so they get rounded scores
+def make_ground_truth(n_args, schema_name, rng):
+    scores = rng.integers(3, 16, size=(n_args, len(dimensions))) / 3
+    if schema_name != "binary_good_bad":
+        return [
+            {dim: int(round(scores[i, j])) for j, dim in enumerate(dimensions)}
+            for i in range(n_args)
+        ]
+    return [
+        {dim: float(scores[i, j]) for j, dim in enumerate(dimensions)}
+        for i in range(n_args)
+    ]
+
+
+# Generates n_runs noisy model runs that mostly follow the ground truth
+def make_runs(ground_truths, n_runs, schema_name, rng, noise=0.25):
+    labels = schema_labels[schema_name]
+    n_labels = len(labels)
+    gt = np.array([[g[dim] for dim in dimensions] for g in ground_truths])
+    # position of the ground truth inside the label vocabulary
+    base = np.clip(np.floor((gt - 1) / 4 * n_labels), 0, n_labels - 1).astype(int)
+
+    all_runs = []
+    for _ in range(n_runs):
+        flip = rng.random(base.shape) < noise
+        random_labels = rng.integers(0, n_labels, size=base.shape)
+        idx = np.where(flip, random_labels, base)
+        run = [
+            {dim: labels[idx[i, j]] for j, dim in enumerate(dimensions)}
+            for i in range(len(ground_truths))
+        ]
+        all_runs.append(run)
+    return all_runs
+
+
+# Writes a synthetic response file (same layout as model_responses/*.json) and its ground truth
+def write_synthetic_files(n_args, n_runs, schema_name, seed=SEED):
+    os.makedirs(BENCH_DATA_DIR, exist_ok=True)
+    base_name = f"synthetic_{schema_name}_{n_args}x{n_runs}"
+    responses_path = os.path.join(BENCH_DATA_DIR, f"model_responses_{base_name}.json")
+    gt_path = os.path.join(BENCH_DATA_DIR, f"ground_truth_{base_name}.json")
+
+    if not (os.path.exists(responses_path) and os.path.exists(gt_path)):
+        rng = np.random.default_rng(seed)
+        ground_truths = make_ground_truth(n_args, schema_name, rng)
+        all_runs = make_runs(ground_truths, n_runs, schema_name, rng)
+        with open(responses_path, "w") as f:
+            json.dump(all_runs, f)
+        with open(gt_path, "w") as f:
+            json.dump(ground_truths, f)
+
+    return responses_path, gt_path
+
+
+# Runs fn once with stdout discarded and returns (seconds, peak MiB or None)
+def measure(fn, *args):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - start
+
+        peak_mib = None
+        if MEASURE_MEMORY:
+            tracemalloc.start()
+            fn(*args)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak_mib = peak / (1024 * 1024)
+
+    return elapsed, peak_mib
+
+
+# Functions to benchmark for a schema, as (name, callable, args)
+def build_cases(schema_name, all_runs, ground_truths, output_folder):
+    cases = [
+        ("analyze_results_not_binary.evaluate_single_run",
+         analyze_results_not_binary.evaluate_single_run, (all_runs[0], ground_truths, schema_name)),
+        ("analyze_results_not_binary.evaluate_multiple_runs",
+         analyze_results_not_binary.evaluate_multiple_runs, (all_runs, ground_truths, schema_name)),
+        ("analyze_results_not_binary.analyze_variability_across_runs",
+         analyze_results_not_binary.analyze_variability_across_runs, (all_runs, ground_truths, schema_name)),
+        ("analyze_results_not_binary.compute_avg_cm_and_std",
+         analyze_results_not_binary.compute_avg_cm_and_std, (all_runs, ground_truths, schema_name)),
+    ]
+
+    # The remaining modules only understand Good/Bad labels
+    if schema_name == "binary_good_bad":
+        binary_gt = [
+            {dim: ("Good" if analyze_results_not_binary.normalize_for_dimension(g[dim], schema_name, dim) else "Bad")
+             for dim in dimensions}
+            for g in ground_truths
+        ]
+        cases += [
+            ("analyze_results.evaluate_single_run",
+             analyze_results.evaluate_single_run, (all_runs[0], binary_gt)),
+            ("analyze_results.evaluate_multiple_runs",
+             analyze_results.evaluate_multiple_runs, (all_runs, binary_gt)),
+            ("analyze_results.analyze_variability_across_runs",
+             analyze_results.analyze_variability_across_runs, (all_runs,)),
+            ("evaluation_ft.evaluate_single_run",
+             evaluation_ft.evaluate_single_run, (all_runs[0], ground_truths)),
+            ("evaluation_ft.analyze_variability_and_correlation_across_runs",
+             evaluation_ft.analyze_variability_and_correlation_across_runs, (all_runs, ground_truths)),
+            ("evaluation_ft.compute_avg_cm_and_std",
+             evaluation_ft.compute_avg_cm_and_std, (all_runs, ground_truths)),
+            ("error_analysis.analyze_error_severity",
+             error_analysis.analyze_error_severity, (all_runs, ground_truths, output_folder)),
+        ]
+    return cases
+
+
+# Compares results with the stored baseline and returns the list of regressions
+def find_regressions(results, baseline):
+    baseline_times = {(r["schema"], r["n_args"], r["n_runs"], r["function"]): r["seconds"] for r in baseline}
+    regressions = []
+    for r in results:
+        key = (r["schema"], r["n_args"], r["n_runs"], r["function"])
+        if key in baseline_times and r["seconds"] > baseline_times[key] * (1 + REGRESSION_TOLERANCE):
+            regressions.append((r, baseline_times[key]))
+    return regressions
+
+
+def run_benchmarks():
+    results = []
+    with tempfile.TemporaryDirectory() as output_folder:
+        for n_args, n_runs in BENCH_SIZES:
+            for schema_name in schemas:
+                responses_path, gt_path = write_synthetic_files(n_args, n_runs, schema_name)
+
+                load_start = time.perf_counter()
+                with open(responses_path, "r") as f:
+                    all_runs = json.load(f)
+                load_time = time.perf_counter() - load_start
+                with open(gt_path, "r") as f:
+                    ground_truths = json.load(f)
+
+                print(f"\n--- {schema_name} | {n_args} arguments x {n_runs} runs (load {load_time:.2f}s) ---")
+                for name, fn, args in build_cases(schema_name, all_runs, ground_truths, output_folder):
+                    seconds, peak_mib = measure(fn, *args)
+                    results.append({
+                        "schema": schema_name,
+                        "n_args": n_args,
+                        "n_runs": n_runs,
+                        "function": name,
+                        "seconds": seconds,
+                        "peak_mib": peak_mib,
+                    })
+                    peak_str = f"{peak_mib:10.1f} MiB" if peak_mib is not None else ""
+                    print(f"{name:<65}{seconds:10.3f} s{peak_str}")
+    return results
+
+
+if __name__ == "__main__":
+    date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+    results = run_benchmarks()
+
+    with open(BENCH_OUTPUT, "a", encoding="utf-8") as f:
+        for r in results:
+            f.write(json.dumps({"date": date, **r}) + "\n")
+    print(f"\nResults appended to {BENCH_OUTPUT}")
+
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE, "r") as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline)
+        if regressions:
+            print(f"\n--- REGRESSIONS (> {REGRESSION_TOLERANCE:.0%} slower than {BASELINE_FILE}) ---")
+            for r, base in regressions:
+                print(f"{r['schema']} {r['n_args']}x{r['n_runs']} {r['function']}: {base:.3f}s -> {r['seconds']:.3f}s")
+            sys.exit(1)
+        print("No regressions against the baseline.")
+    else:
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"No baseline found, saved current results as {BASELINE_FILE}")
@@ -0,0 +1,211 @@
+import datetime
+import sys
+import os
+import warnings
+import contextlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from Logger import Logger
+from analyze_results_not_binary import dimensions, encode_runs, encode_ground_truth, load_runs
+
+N_RESAMPLES = 10000
+CONFIDENCE = 0.95
+SEED = 42
+N_WORKERS = None  # None = one process per CPU, 0 = no process pool
+CHUNK_SIZE = 2000  # resamples per vectorized block, bounds memory for large files
+LOG_TO_FILE = True
+
+metric_names = ["accuracy", "macro_f1", "pearson", "kappa"]
+
+
+# Confusion matrices of every resample at once: returns an array (n_resamples, n_classes, n_classes)
+# y_true and y_pred are codes with -1 for invalid values, idx holds the resampled argument indices
+def resampled_confusion(y_true, y_pred, idx, n_classes):
+    valid = (y_true >= 0) & (y_pred >= 0)
+    codes = np.where(valid, y_true * n_classes + y_pred, 0)
+    n_res = idx.shape[0]
+    offsets = (np.arange(n_res) * n_classes * n_classes)[:, None]
+    counts = np.bincount((codes[idx] + offsets).ravel(), weights=valid[idx].ravel(),
+                         minlength=n_res * n_classes * n_classes)
+    return counts.reshape(n_res, n_classes, n_classes)
+
+
+# Accuracy, macro-F1, Pearson r and Cohen's kappa from a stack of confusion matrices
+# macro-F1 averages over the classes present in each resample, like classification_report does
+def metrics_from_confusion(cm):
+    values = np.arange(cm.shape[1], dtype=float)  # codes are the numeric class values
+    total = cm.sum(axis=(1, 2))
+    tp = np.diagonal(cm, axis1=1, axis2=2)
+    true_counts = cm.sum(axis=2)
+    pred_counts = cm.sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        accuracy = tp.sum(axis=1) / total
+
+        support = true_counts + pred_counts
+        present = support > 0
+        f1 = np.where(present, 2 * tp / np.where(present, support, 1), 0)
+        macro_f1 = f1.sum(axis=1) / present.sum(axis=1)
+
+        expected = (true_counts * pred_counts).sum(axis=1) / total ** 2
+        kappa = (accuracy - expected) / (1 - expected)
+
+        sx = true_counts @ values
+        sy = pred_counts @ values
+        sxx = true_counts @ values ** 2
+        syy = pred_counts @ values ** 2
+        sxy = np.einsum("bij,i,j->b", cm, values, values)
+        cov = sxy - sx * sy / total
+        var_x = sxx - sx ** 2 / total
+        var_y = syy - sy ** 2 / total
+        pearson = cov / np.sqrt(var_x * var_y)
+
+    return {"accuracy": accuracy, "macro_f1": macro_f1, "pearson": pearson, "kappa": kappa}
+
+
+# Bootstrap CIs for one dimension. runs_codes: (n_runs, n_args), gt_codes: (n_args,)
+# Arguments are resampled (the same resamples for every run) and each metric is averaged across runs,
+# matching the "average over runs" numbers of analyze_results_not_binary
+def bootstrap_dimension(runs_codes, gt_codes, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=SEED):
+    n_args = gt_codes.shape[0]
+    n_classes = int(max(runs_codes.max(initial=0), gt_codes.max(initial=0))) + 1
+    rng = np.random.default_rng(seed)
+
+    def averaged_metrics(idx):
+        per_run = [metrics_from_confusion(resampled_confusion(gt_codes, run, idx, n_classes))
+                   for run in runs_codes]
+        # nanmean of an all-NaN column (e.g. kappa with a single class) warns, the NaN is the answer
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            return {m: np.nanmean([r[m] for r in per_run], axis=0) for m in metric_names}
+
+    point = averaged_metrics(np.arange(n_args)[None, :])
+
+    samples = {m: [] for m in metric_names}
+    for start in range(0, n_resamples, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, n_resamples - start)
+        idx = rng.integers(0, n_args, size=(size, n_args))
+        chunk = averaged_metrics(idx)
+        for m in metric_names:
+            samples[m].append(chunk[m])
+
+    alpha = (1 - confidence) / 2
+    results = {}
+    for m in metric_names:
+        values = np.concatenate(samples[m])
+        values = values[~np.isnan(values)]
+        low, high = (np.quantile(values, [alpha, 1 - alpha]) if values.size else (np.nan, np.nan))
+        results[m] = {"estimate": float(point[m][0]), "low": float(low), "high": float(high)}
+    return results
+
+
+# Bootstrap CIs for every dimension of one response file (already loaded)
+def bootstrap_runs(all_runs, ground_truths, schema_name, n_resamples=N_RESAMPLES, confidence=CONFIDENCE, seed=SEED):
+    runs_codes = encode_runs(all_runs, schema_name)
+    gt_codes = encode_ground_truth(ground_truths[:runs_codes.shape[1]], schema_name)
+    return {
+        dim: bootstrap_dimension(runs_codes[:, :, d], gt_codes[:, d], n_resamples, confidence, seed)
+        for d, dim in enumerate(dimensions)
+    }
+
+
+def _bootstrap_task(task):
+    runs_codes, gt_codes, n_resamples, confidence, seed = task
+    return bootstrap_dimension(runs_codes, gt_codes, n_resamples, confidence, seed)
+
+
+# Bootstrap CIs for several response files, one (file, dimension) task per worker process
+# returns {path: {dim: {metric: {"estimate", "low", "high"}}}}
+def bootstrap_files(paths, ground_truths, schema_name, n_resamples=N_RESAMPLES, confidence=CONFIDENCE,
+                    seed=SEED, n_workers=N_WORKERS):
+    keys, tasks = [], []
+    for path in paths:
+        all_runs = load_runs(path)
+        runs_codes = encode_runs(all_runs, schema_name)
+        gt_codes = encode_ground_truth(ground_truths[:runs_codes.shape[1]], schema_name)
+        for d, dim in enumerate(dimensions):
+            keys.append((path, dim))
+            tasks.append((runs_codes[:, :, d], gt_codes[:, d], n_resamples, confidence, seed))
+
+    if n_workers == 0:
+        outputs = map(_bootstrap_task, tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            outputs = list(pool.map(_bootstrap_task, tasks))
+
+    results = {}
+    for (path, dim), res in zip(keys, outputs):
+        results.setdefault(path, {})[dim] = res
+    return results
+
+
+# prints the results of bootstrap_runs (one file)
+def print_bootstrap(results, confidence=CONFIDENCE):
+    for dim in dimensions:
+        print(f"\n --- {dim.upper()} ---")
+        print(f"{'Metric':<12}{'estimate':>10}{f'{confidence:.0%} CI':>22}")
+        print("-" * 44)
+        for m in metric_names:
+            r = results[dim][m]
+            print(f"{m:<12}{r['estimate']:10.3f}   [{r['low']:7.3f}, {r['high']:7.3f}]")
+
+
+def main():
+    from dataset_division import test_data
+
+    print("Available schemas:")
+    print("1: binary_good_bad")
+    print("2: ternary_bad_medium_good")
+    print("3: binary_effective_ineffective")
+    print("4: numeric_1_to_5")
+    schemas_map = {
+        "1": "binary_good_bad",
+        "2": "ternary_bad_medium_good",
+        "3": "binary_effective_ineffective",
+        "4": "numeric_1_to_5",
+    }
+    schema_option = input("Select the label schema (1-4): ").strip()
+    if schema_option not in schemas_map:
+        print("Invalid option. Finishing execution.")
+        sys.exit(1)
+    schema_name = schemas_map[schema_option]
+
+    response_dir = "model_responses"
+    response_files = sorted(f for f in os.listdir(response_dir) if f.startswith("model_responses_") and f.endswith(".json"))
+    if not response_files:
+        print("No model response files found in the 'model_responses' directory.")
+        sys.exit(1)
+
+    print("Response files available:")
+    for idx, file in enumerate(response_files):
+        print(f"{idx + 1}: {file}")
+    selection = input("Select files by number separated by commas, or 'all': ").strip()
+    try:
+        if selection.lower() == "all":
+            selected = response_files
+        else:
+            selected = [response_files[int(x) - 1] for x in selection.split(",")]
+    except (ValueError, IndexError):
+        print("Invalid selection.")
+        sys.exit(1)
+
+    ground_truth = [entry["labels"] for entry in test_data]
+    paths = [os.path.join(response_dir, f) for f in selected]
+    print(f"\nBootstrapping {len(paths)} file(s) with {N_RESAMPLES} resamples, schema {schema_name}")
+    results = bootstrap_files(paths, ground_truth, schema_name)
+
+    for path in paths:
+        print(f"\n=== {os.path.basename(path)} ===")
+        print_bootstrap(results[path])
+
+
+if __name__ == "__main__":
+    if LOG_TO_FILE:
+        log_dir = "evaluation"
+        os.makedirs(log_dir, exist_ok=True)
+        date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+        log_filename = os.path.join(log_dir, f"bootstrap_{date}.txt")
+        with Logger(log_filename) as logger, contextlib.redirect_stdout(logger):
+            main()
+    else:
+        main()
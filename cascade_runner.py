@@ -0,0 +1,226 @@
+import datetime
+import json
+import os
+import sys
+import time
+from collections import Counter
+import requests
+from Logger import Logger
+from backends import get_backend, BackendError
+from checkpoint import CHECKPOINT_DIR, open_checkpoint, write_checkpoint
+from batched_prompts import prompt_tokens, CHARS_PER_TOKEN
+from analyze_results_not_binary import dimensions
+from dataset_division import split_meta
+import model
+
+BACKEND = "ollama"
+API_URL = None  # None = the default of BACKEND (ollama http://localhost:11434, openai http://localhost:8080/v1)
+SMALL_MODEL = "llama3.2:3b"  # fast first pass
+LARGE_MODEL = "gemma2:9b"  # only for the uncertain arguments
+CONFIDENCE = "agreement"  # "agreement" of SMALL_RUNS samples or "probability" of the label (needs logprobs)
+SMALL_RUNS = 3
+AGREEMENT_THRESHOLD = 1.0  # a dimension escalates when less than this share of the small runs agree
+PROBABILITY_THRESHOLD = 0.9  # a dimension escalates when P(label) of the small model is below this
+N_RUNS = 5  # runs of the saved file; escalated dimensions get one large-model sample per run, the others
+# their small-model samples (SMALL_RUNS, or 1 with CONFIDENCE = "probability") and None in the runs after them
+MAX_RETRIES = 5
+# relative cost per 1000 tokens (prompt + generated) of each model, e.g. GPU seconds or price
+MODEL_COSTS = {SMALL_MODEL: 1.0, LARGE_MODEL: 4.0}
+LOG_LEVEL = "INFO"
+LOG_DIR = "logs"
+
+
+# Sends one prompt and parses it with the model.py parser, retrying invalid responses. Adds the
+# tokens and the cost of every attempt to meter; returns the labels or None after MAX_RETRIES
+def query_labels(backend, prompt, meter, logger, options=None):
+    for retry in range(MAX_RETRIES):
+        try:
+            data = backend.generate_raw(prompt, options)
+        except (BackendError, requests.exceptions.RequestException) as e:
+            logger.error(f"Request to {backend.model} failed: {e}", model=backend.model)
+            continue
+        text = data.get("response", "")
+        tokens = prompt_tokens(data, prompt) + (data.get("eval_count") or len(text) // CHARS_PER_TOKEN)
+        meter[backend.model] += tokens
+        labels = model.extract_labels(text)
+        if labels is not None:
+            return labels
+        logger.warning(f"Retry {retry + 1} with {backend.model} due to invalid response.", model=backend.model)
+    return None
+
+
+# First pass of the small model: (labels per dimension, confidence per dimension, the valid samples).
+# agreement: majority label of SMALL_RUNS samples, confidence = share of the valid samples that agree
+# probability: one temperature 0 sample, confidence = P(label) from the token logprobs
+def small_pass(backend, prompt, schema_name, meter, logger):
+    if CONFIDENCE == "probability":
+        from soft_labels import soft_labels
+        for retry in range(MAX_RETRIES):
+            try:
+                generation = backend.generate_logprobs(prompt, {"temperature": 0}, top_logprobs=model.TOP_LOGPROBS)
+            except (BackendError, requests.exceptions.RequestException) as e:
+                logger.error(f"Request to {backend.model} failed: {e}", model=backend.model)
+                continue
+            meter[backend.model] += len(prompt) // CHARS_PER_TOKEN + len(generation["logprobs"])
+            labels = model.extract_labels(generation["response"])
+            if labels is None:
+                continue
+            probabilities = soft_labels(generation, schema_name)
+            confidence = {}
+            for dim in dimensions:
+                probs = probabilities[dim] or {}
+                confidence[dim] = probs.get(str(labels[dim]), 0.0)
+            return labels, confidence, [labels]
+        return None, {dim: 0.0 for dim in dimensions}, []
+
+    samples = [query_labels(backend, prompt, meter, logger) for _ in range(SMALL_RUNS)]
+    samples = [s for s in samples if s is not None]
+    if not samples:
+        return None, {dim: 0.0 for dim in dimensions}, []
+    labels, confidence = {}, {}
+    for dim in dimensions:
+        label, count = Counter(str(s[dim]) for s in samples).most_common(1)[0]
+        labels[dim] = next(s[dim] for s in samples if str(s[dim]) == label)
+        confidence[dim] = count / len(samples)
+    return labels, confidence, samples
+
+
+def needs_escalation(confidence):
+    threshold = PROBABILITY_THRESHOLD if CONFIDENCE == "probability" else AGREEMENT_THRESHOLD
+    return [dim for dim in dimensions if confidence[dim] < threshold]
+
+
+# Scores every argument with the cascade, the pre-screened ones (model.PRESCREEN) cost nothing.
+# Returns all_runs (N_RUNS runs, the usual layout, every item with a "provenance" field {dimension: model})
+# and the cost, tokens, prompt tokens and escalated dimensions of every argument. A dimension that is not
+# escalated keeps one small-model sample per run, so its variability across runs is the real one of the
+# small model rather than one label repeated N_RUNS times
+def run_cascade(arguments, small, large, schema_name, logger, checkpoint_file):
+    all_runs = [[None] * len(arguments) for _ in range(N_RUNS)]
+    per_argument = []
+
+    for i, arg in enumerate(arguments):
+        if model.prescreened[i] is not None:
+            item = {**model.prescreened[i], "provenance": {dim: "prescreen" for dim in dimensions}}
+            for r in range(N_RUNS):
+                all_runs[r][i] = item
+                write_checkpoint(checkpoint_file, r, i, item, source="prescreen")
+            per_argument.append({"escalated": [], "tokens": {}, "prompt_tokens": 0, "cost": 0.0})
+            continue
+
+        start = time.time()
+        meter = Counter()
+        prompt = model.build_prompt(arg, model.few_shots[i] if model.few_shots else None)
+        small_labels, confidence, small_samples = small_pass(small, prompt, schema_name, meter, logger)
+        escalated = needs_escalation(confidence)
+        large_runs = [query_labels(large, prompt, meter, logger) for _ in range(N_RUNS)] if escalated else []
+
+        for r in range(N_RUNS):
+            labels = {}
+            provenance = {}
+            for dim in dimensions:
+                if dim in escalated:
+                    labels[dim] = large_runs[r][dim] if large_runs[r] is not None else None
+                    provenance[dim] = LARGE_MODEL
+                else:
+                    labels[dim] = small_samples[r][dim] if r < len(small_samples) else None
+                    provenance[dim] = SMALL_MODEL
+            item = None if all(v is None for v in labels.values()) else {**labels, "provenance": provenance}
+            all_runs[r][i] = item
+            write_checkpoint(checkpoint_file, r, i, item, source="cascade")
+
+        cost = sum(tokens / 1000 * MODEL_COSTS.get(name, 1.0) for name, tokens in meter.items())
+        per_argument.append({"escalated": escalated, "tokens": dict(meter),
+                             "prompt_tokens": len(prompt) // CHARS_PER_TOKEN, "cost": cost})
+        logger.info(f"Argument {i + 1}: confidence {confidence}, escalated {escalated or 'none'} "
+                    f"({time.time() - start:.2f} seconds, cost {cost:.2f})",
+                    argument=i + 1, confidence=confidence, escalated=escalated, tokens=dict(meter), cost=round(cost, 4))
+    return all_runs, per_argument
+
+
+# Average cost per argument of the cascade, against sending every argument to the large model, and the
+# escalation rate per dimension. The all-large cost is an estimate: the large-model tokens per prompt token of
+# the escalated arguments, applied to the prompt of every argument (the escalated ones are not a fair sample,
+# long or hard arguments escalate more often, so their cost per argument would overstate it)
+def compute_cost_report(per_argument):
+    n = len(per_argument)
+    escalated = [a for a in per_argument if a["escalated"]]
+    large_tokens = sum(a["tokens"].get(LARGE_MODEL, 0) for a in escalated)
+    escalated_prompt_tokens = sum(a["prompt_tokens"] for a in escalated)
+    all_large = None
+    if escalated_prompt_tokens:
+        per_prompt_token = large_tokens / escalated_prompt_tokens
+        all_large = sum(per_prompt_token * a["prompt_tokens"] / 1000 * MODEL_COSTS[LARGE_MODEL]
+                        for a in per_argument) / n
+    cascade = sum(a["cost"] for a in per_argument) / n if n else 0.0
+    return {
+        "n_arguments": n,
+        "escalated_arguments": len(escalated),
+        "escalation_rate": {dim: sum(dim in a["escalated"] for a in per_argument) / n if n else 0.0
+                            for dim in dimensions},
+        "cost_per_argument": cascade,
+        "all_large_cost_per_argument": all_large,
+        "saving": 1 - cascade / all_large if all_large else None,
+    }
+
+
+def log_cost_report(report, logger):
+    logger.info(f"\n--- CASCADE COST ({SMALL_MODEL} -> {LARGE_MODEL}, confidence: {CONFIDENCE}) ---")
+    logger.info(f"Escalated arguments: {report['escalated_arguments']} of {report['n_arguments']}",
+                escalated=report["escalated_arguments"])
+    for dim, rate in report["escalation_rate"].items():
+        logger.info(f"  {dim:<16}{rate:>8.1%} escalated", dimension=dim, escalation_rate=round(rate, 4))
+    logger.info(f"Average cost per argument: {report['cost_per_argument']:.3f}",
+                cost_per_argument=round(report["cost_per_argument"], 4))
+    if report["all_large_cost_per_argument"] is not None:
+        logger.info(f"Every argument on {LARGE_MODEL}: {report['all_large_cost_per_argument']:.3f} per argument "
+                    f"(estimated from the large-model tokens per prompt token of the {report['escalated_arguments']} "
+                    f"escalated arguments), the cascade saves {report['saving']:.1%}")
+
+
+def main():
+    print("\nSelect version of prompt (1 to 5):")
+    version = int(input("Enter version number: "))
+    if version not in model.version_schemas:
+        print("Invalid version.")
+        sys.exit(1)
+    if CONFIDENCE not in ("agreement", "probability"):
+        print(f"Unknown CONFIDENCE '{CONFIDENCE}'.")
+        sys.exit(1)
+
+    date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+    os.makedirs(LOG_DIR, exist_ok=True)
+    logger = Logger(os.path.join(LOG_DIR, f"cascade_run_{date}.log"), level=LOG_LEVEL,
+                    records_filename=os.path.join(LOG_DIR, f"cascade_run_{date}.jsonl.gz"))
+    small = get_backend(BACKEND, SMALL_MODEL, API_URL)
+    large = get_backend(BACKEND, LARGE_MODEL, API_URL)
+    model.configure(version, logger, small)
+    model.prepare_arguments()
+
+    checkpoint_file = open_checkpoint(os.path.join(CHECKPOINT_DIR, f"checkpoint_{date}.jsonl"))
+    all_runs, per_argument = run_cascade(model.arguments, small, large, model.version_schemas[version],
+                                         logger, checkpoint_file)
+    checkpoint_file.close()
+    report = compute_cost_report(per_argument)
+
+    output_filename = f"model_responses_cascade_{date}.json"
+    with open(output_filename, "w") as f:
+        json.dump({
+            **split_meta(),
+            "model": f"{SMALL_MODEL}+{LARGE_MODEL}",
+            "prompt_version": f"v{version}",
+            "mode": "cascade",
+            "small_model": SMALL_MODEL,
+            "large_model": LARGE_MODEL,
+            "confidence": CONFIDENCE,
+            "cost": report,
+            "all_runs": all_runs,
+        }, f, indent=2)
+
+    log_cost_report(report, logger)
+    logger.info(f"\n--- SAVED RESPONSES: {output_filename} ---", output=output_filename)
+    logger.close()
+
+
+if __name__ == "__main__":
+    main()
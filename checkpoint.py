@@ -0,0 +1,76 @@
+import json
+import os
+import time
+
+CHECKPOINT_DIR = "checkpoints"
+
+
+# Opens a checkpoint file for appending, line buffered so every result reaches the disk right away
+def open_checkpoint(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    return open(path, "a", encoding="utf-8", buffering=1)
+
+
+# Appends one (run, argument) result; run and argument are 0-based indices into all_runs
+def write_checkpoint(f, run_idx, arg_idx, labels, **fields):
+    record = {"run": run_idx, "argument": arg_idx, "labels": labels}
+    record.update(fields)
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+# Yields the records of a checkpoint file. With follow=True it keeps waiting for new lines
+# (like tail -f) until idle_timeout seconds pass without new data or should_stop() returns True
+def tail_checkpoint(path, follow=False, poll_interval=1.0, idle_timeout=None, should_stop=None):
+    while follow and not os.path.exists(path):
+        time.sleep(poll_interval)
+
+    with open(path, "r", encoding="utf-8") as f:
+        partial = ""
+        last_data = time.time()
+        while True:
+            line = f.readline()
+            if line:
+                partial += line
+                if not partial.endswith("\n"):
+                    continue  # the runner is still writing this line
+                record, partial = partial.strip(), ""
+                last_data = time.time()
+                if record:
+                    yield json.loads(record)
+                continue
+
+            if not follow:
+                return
+            if should_stop is not None and should_stop():
+                return
+            if idle_timeout is not None and time.time() - last_data > idle_timeout:
+                return
+            time.sleep(poll_interval)
+
+
+# Rebuilds the all_runs layout from checkpoint records, arguments that were never written are None
+def checkpoint_to_runs(records, n_runs=None, n_args=None):
+    records = list(records)
+    if n_runs is None:
+        n_runs = max((r["run"] for r in records), default=-1) + 1
+    if n_args is None:
+        n_args = max((r["argument"] for r in records), default=-1) + 1
+
+    all_runs = [[None] * n_args for _ in range(n_runs)]
+    for r in records:
+        all_runs[r["run"]][r["argument"]] = r["labels"]
+    return all_runs
+
+
+# An evaluator asks a runner to stop by creating <checkpoint>.stop next to the checkpoint file
+def stop_file(path):
+    return path + ".stop"
+
+
+def request_stop(path, reason=""):
+    with open(stop_file(path), "w", encoding="utf-8") as f:
+        f.write(reason + "\n")
+
+
+def stop_requested(path):
+    return os.path.exists(stop_file(path))
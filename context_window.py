@@ -0,0 +1,121 @@
+import math
+import re
+from collections import Counter
+from aggregate_runs import aggregate_runs
+
+CTX_BUCKETS = [2048, 4096, 8192, 16384, 32768]  # num_ctx values used, few values = few model reloads
+CHARS_PER_TOKEN = 3.5  # conservative for English text: overestimates the prompt a little, never underestimates much
+SAFETY_MARGIN = 64  # tokens for the chat template and special tokens
+RESPONSE_TOKENS = 128  # room for the JSON answer when the runner does not set num_predict
+MAX_ARGUMENT_TOKENS = 1024  # longer arguments go through TRUNCATION_POLICY
+TRUNCATION_POLICY = "head_tail"  # "head_tail" keeps the start and the end, "chunk" scores every part and aggregates
+HEAD_SHARE = 0.6  # share of the kept tokens taken from the start of the argument
+TRUNCATION_MARK = "\n[...]\n"
+
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+# Smallest bucket that holds n_tokens, the largest one when none does
+def context_bucket(n_tokens, buckets=CTX_BUCKETS):
+    for size in sorted(buckets):
+        if size >= n_tokens:
+            return size
+    return max(buckets)
+
+
+# First HEAD_SHARE and last part of the text within max_tokens, cut at word boundaries
+def head_tail(text, max_tokens, head_share=HEAD_SHARE):
+    max_chars = int(max_tokens * CHARS_PER_TOKEN) - len(TRUNCATION_MARK)
+    if len(text) <= max_chars:
+        return text
+    head_chars = int(max_chars * head_share)
+    head = text[:head_chars].rsplit(" ", 1)[0]
+    tail = text[len(text) - (max_chars - head_chars):].split(" ", 1)[-1]
+    return head.rstrip() + TRUNCATION_MARK + tail.lstrip()
+
+
+# Splits a text into parts of at most max_tokens, on paragraph, then sentence, then word boundaries
+def split_chunks(text, max_tokens):
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    pieces = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in re.split(r"(?<=[.!?])\s+", paragraph):
+            while len(sentence) > max_chars:
+                cut = sentence[:max_chars].rsplit(" ", 1)[0] or sentence[:max_chars]
+                pieces.append(cut)
+                sentence = sentence[len(cut):].lstrip()
+            pieces.append(sentence)
+
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current}\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# Decides, per argument, what is sent and with which num_ctx. build_prompt(argument, shots) is the prompt
+# builder of the runner, num_predict its response budget. A plan is
+#   {"num_ctx", "policy": "none" | "head_tail" | "chunk", "argument_tokens", "pieces": [text sent per request]}
+class ContextPlanner:
+    def __init__(self, build_prompt, num_predict=None, policy=TRUNCATION_POLICY, max_argument_tokens=MAX_ARGUMENT_TOKENS):
+        if policy not in ("head_tail", "chunk"):
+            raise ValueError(f"Unknown truncation policy '{policy}', choose 'head_tail' or 'chunk'")
+        self.build_prompt = build_prompt
+        self.num_predict = num_predict or RESPONSE_TOKENS
+        self.policy = policy
+        self.max_argument_tokens = max_argument_tokens
+
+    def plan(self, argument, shots=None):
+        tokens = estimate_tokens(argument)
+        if tokens <= self.max_argument_tokens:
+            policy, pieces = "none", [argument]
+        elif self.policy == "head_tail":
+            policy, pieces = "head_tail", [head_tail(argument, self.max_argument_tokens)]
+        else:
+            policy, pieces = "chunk", split_chunks(argument, self.max_argument_tokens)
+        needed = max(estimate_tokens(self.build_prompt(piece, shots)) for piece in pieces)
+        return {
+            "num_ctx": context_bucket(needed + self.num_predict + SAFETY_MARGIN),
+            "policy": policy,
+            "argument_tokens": tokens,
+            "pieces": pieces,
+        }
+
+
+# What the policy did to an argument, saved with its labels; None when the argument was sent whole
+def truncation_record(plan):
+    if plan["policy"] == "none":
+        return None
+    record = {"policy": plan["policy"], "argument_tokens": plan["argument_tokens"]}
+    if plan["policy"] == "chunk":
+        record["chunks"] = len(plan["pieces"])
+    else:
+        record["kept_tokens"] = estimate_tokens(plan["pieces"][0])
+    return record
+
+
+# One label dict from the labels of the chunks of an argument: majority per dimension
+# (ties go to the lowest code of the schema), None when no chunk was labelled
+def aggregate_chunks(chunk_labels, schema_name):
+    valid = [labels for labels in chunk_labels if labels is not None]
+    if not valid:
+        return None
+    return aggregate_runs([[labels] for labels in valid], schema_name)[0]
+
+
+# Arguments per num_ctx bucket and per policy, for the run log
+def plan_summary(plans):
+    return {
+        "num_ctx": dict(sorted(Counter(plan["num_ctx"] for plan in plans).items())),
+        "policy": dict(Counter(plan["policy"] for plan in plans)),
+    }
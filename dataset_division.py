@@ -1,19 +1,89 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split
+import os
+import re
+import numpy as np
+from sklearn.model_selection import train_test_split, StratifiedKFold
+from dataset_store import open_store
 
-# Load the dataset
-data = pd.read_csv('./dataset.csv')
+DATASET_PATH = './dataset.csv'
+SPLIT_DIR = './splits'
+# Split IDs:
+#   holdout_s<seed>              plain train/val/test split (40/36/24 %), holdout_s42 is the original split
+#   strat_s<seed>                the same proportions, stratified on the binarized labels
+#   kfold<k>_s<seed>_f<fold>     stratified k-fold: fold f is the test set, fold f+1 the validation set
+# the split is picked with the SPLIT_ID environment variable, every runner and evaluator gets the same one
+DEFAULT_SPLIT = 'holdout_s42'
+SPLIT_ID = os.environ.get('SPLIT_ID', DEFAULT_SPLIT)
+MIN_STRATUM = 10  # label combinations with fewer arguments are stratified on the overall label only
 
-# Select necesary columns
-columns_of_interest = ['text', 'cogency_mean', 'effectiveness_mean', 'reasonableness_mean', 'overall_mean']
-data = data[columns_of_interest]
+# Load the dataset: converted once into a memory-mapped store (dataset_store.py), only the
+# label columns are loaded here, the text of each argument is read when it is used
+store = open_store(DATASET_PATH)
+data = store.labels_frame()
 
-seed = 42
+# Content hash of the dataset, splits are stored per dataset version
+def dataset_hash():
+    return store.meta['source_sha1'][:12]
 
-# Split the data into train and test sets
-data_train, data_temp = train_test_split(data, test_size=0.6, random_state=seed)
-data_val, data_test = train_test_split(data_temp, test_size=0.4, random_state=seed)
+# Good/Bad pattern of the four dimensions (same thresholds as binary_good_bad), e.g. "1011"
+# rare patterns fall back to the overall label so every stratum can be split
+def strata(df):
+    bits = [
+        (df[f'{dim}_mean'] >= (3 if dim == 'reasonableness' else 3.3)).astype(int).astype(str)
+        for dim in ['cogency', 'effectiveness', 'reasonableness', 'overall']
+    ]
+    keys = bits[0] + bits[1] + bits[2] + bits[3]
+    counts = keys.map(keys.value_counts())
+    return keys.where(counts >= MIN_STRATUM, 'overall_' + bits[3]).to_numpy()
+
+# Row positions of (train, val, test) for a split ID
+def make_split(df, split_id):
+    match = re.fullmatch(r'(holdout|strat)_s(\d+)', split_id)
+    if match:
+        kind, seed = match.group(1), int(match.group(2))
+        positions = np.arange(len(df))
+        stratify = strata(df) if kind == 'strat' else None
+        train, temp = train_test_split(positions, test_size=0.6, random_state=seed, stratify=stratify)
+        stratify = strata(df.iloc[temp]) if kind == 'strat' else None
+        val, test = train_test_split(temp, test_size=0.4, random_state=seed, stratify=stratify)
+        return train, val, test
+
+    match = re.fullmatch(r'kfold(\d+)_s(\d+)_f(\d+)', split_id)
+    if match:
+        k, seed, fold = (int(g) for g in match.groups())
+        if fold >= k:
+            raise ValueError(f"Fold {fold} does not exist in a {k}-fold split")
+        folds = [test for _, test in StratifiedKFold(k, shuffle=True, random_state=seed).split(df, strata(df))]
+        test, val = folds[fold], folds[(fold + 1) % k]
+        train = np.sort(np.concatenate([f for i, f in enumerate(folds) if i not in (fold, (fold + 1) % k)]))
+        return train, val, test
+
+    raise ValueError(f"Unknown split ID '{split_id}'")
+
+# Loads a split from splits/<dataset hash>/<split_id>.npz, computing and saving it the first time
+# only the row positions are stored, the text stays in dataset.csv
+def get_split(split_id=SPLIT_ID):
+    path = os.path.join(SPLIT_DIR, dataset_hash(), f'{split_id}.npz')
+    if os.path.exists(path):
+        saved = np.load(path)
+        return saved['train'], saved['val'], saved['test']
+
+    train, val, test = make_split(data, split_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, train=train, val=val, test=test)
+    return train, val, test
+
+# Saved with the runs of every response file, the evaluators check it against the active split
+def split_meta(split_id=SPLIT_ID):
+    return {'split': split_id, 'dataset': dataset_hash()}
 
+# IDs of a family of splits, e.g. every fold of a 5-fold split or the same split over several seeds
+def kfold_split_ids(k=5, seed=42):
+    return [f'kfold{k}_s{seed}_f{fold}' for fold in range(k)]
+
+def multi_seed_split_ids(seeds, stratified=True):
+    return [f"{'strat' if stratified else 'holdout'}_s{seed}" for seed in seeds]
+
+# list of {'text', 'labels'} records of a DataFrame with the columns of interest
 def get_text_and_labels(df):
     return [
         {
@@ -28,11 +98,34 @@ def get_text_and_labels(df):
         for _, row in df.iterrows()
     ]
 
+# DataFrames (text + label columns) of a split, in the order the split stores them
+def split_frames(split_id=SPLIT_ID):
+    return tuple(store.frame(positions) for positions in get_split(split_id))
+
+# {'text', 'labels'} records of a split, read lazily from the store
+def split_records(split_id=SPLIT_ID):
+    return tuple(store.view(positions) for positions in get_split(split_id))
+
+
+train_data, val_data, test_data = split_records(SPLIT_ID)
+
+
+if __name__ == '__main__':
+    dims = ['cogency', 'effectiveness', 'reasonableness', 'overall']
 
-test_data = get_text_and_labels(data_test)
+    def good_ratios(df):
+        return [np.mean(df[f'{dim}_mean'] >= (3 if dim == 'reasonableness' else 3.3)) for dim in dims]
 
+    print(f"Dataset {dataset_hash()}: {len(data)} arguments, selected split {SPLIT_ID}")
+    print(f"\nGood ratio per dimension in the test set of each split:")
+    print(f"{'split':<20}{'test':>6}" + ''.join(f'{dim:>16}' for dim in dims))
+    print(f"{'(all data)':<20}{len(data):>6}" + ''.join(f'{r:>16.2%}' for r in good_ratios(data)))
+    for split_id in [DEFAULT_SPLIT] + multi_seed_split_ids([42, 43, 44]) + kfold_split_ids(5, 42):
+        test = data.iloc[get_split(split_id)[2]]
+        print(f"{split_id:<20}{len(test):>6}" + ''.join(f'{r:>16.2%}' for r in good_ratios(test)))
 
-# Save the splits to CSV files
-data_train.to_csv('./data/data_train.csv', index=False)
-data_val.to_csv('./data/data_val.csv', index=False)
-data_test.to_csv('./data/data_test.csv', index=False)
\ No newline at end of file
+    # Save the selected split to CSV files (fine_tuning.py reads them)
+    train, val, test = split_frames(SPLIT_ID)
+    train.to_csv('./data/data_train.csv', index=False)
+    val.to_csv('./data/data_val.csv', index=False)
+    test.to_csv('./data/data_test.csv', index=False)
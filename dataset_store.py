@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from analyze_results_not_binary import dimensions
+
+STORE_DIR = "dataset_store"
+CHUNK_SIZE = 10000  # CSV rows read at a time while building the store
+STORE_VERSION = 2  # bumped when the layout changes, older stores are rebuilt (2: float64 labels)
+label_columns = [f"{dim}_mean" for dim in dimensions]
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+# Converts a dataset CSV once into a store directory:
+#   text.bin      the UTF-8 texts one after another
+#   offsets.npy   int64 (n + 1,), text i is text.bin[offsets[i]:offsets[i + 1]]
+#   labels.npy    float64 (n, 4), the *_mean columns in the order of `dimensions`, exactly as in the CSV
+#   meta.json     store version, row count, source size/mtime and source sha1
+# the CSV is read in chunks, so the build never holds the whole file in memory
+def build_store(csv_path, store_dir=STORE_DIR, chunk_size=CHUNK_SIZE):
+    os.makedirs(store_dir, exist_ok=True)
+    sha1 = hashlib.sha1()
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+
+    offsets, labels = [0], []
+    with open(os.path.join(store_dir, "text.bin"), "wb") as blob:
+        for chunk in pd.read_csv(csv_path, usecols=["text"] + label_columns, chunksize=chunk_size):
+            for text in chunk["text"].fillna("").astype(str):
+                encoded = text.encode("utf-8")
+                blob.write(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+            labels.append(chunk[label_columns].to_numpy(dtype=np.float64))
+
+    np.save(os.path.join(store_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    np.save(os.path.join(store_dir, "labels.npy"),
+            np.concatenate(labels) if labels else np.zeros((0, len(dimensions)), np.float64))
+    meta = {"version": STORE_VERSION, "source": os.path.abspath(csv_path), "n_rows": len(offsets) - 1, "source_sha1": sha1.hexdigest(),
+            **_source_stat(csv_path)}
+    with open(os.path.join(store_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# Read-only access to a store. Offsets, labels and text are memory mapped: opening it reads nothing,
+# each record reads only its own bytes. Records keep the {'text', 'labels'} layout of get_text_and_labels
+class ArgumentStore:
+    def __init__(self, store_dir=STORE_DIR):
+        with open(os.path.join(store_dir, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(os.path.join(store_dir, "offsets.npy"), mmap_mode="r")
+        self.labels = np.load(os.path.join(store_dir, "labels.npy"), mmap_mode="r")
+        text_path = os.path.join(store_dir, "text.bin")
+        # np.memmap cannot map an empty file
+        self.blob = np.memmap(text_path, dtype=np.uint8, mode="r") if os.path.getsize(text_path) else np.zeros(0, np.uint8)
+
+    def __len__(self):
+        return self.meta["n_rows"]
+
+    def text(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def record(self, i):
+        return {"text": self.text(i), "labels": {dim: float(v) for dim, v in zip(dimensions, self.labels[i])}}
+
+    def __getitem__(self, i):
+        return self.record(i)
+
+    # Streams the records of rows start..stop
+    def iter_records(self, start=0, stop=None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        for i in range(start, stop):
+            yield self.record(i)
+
+    # Records of the given row positions, loaded lazily
+    def view(self, positions):
+        return StoreView(self, positions)
+
+    # Label columns as a DataFrame (no text), enough to split and stratify
+    def labels_frame(self):
+        return pd.DataFrame(np.asarray(self.labels), columns=label_columns)
+
+    # Text + label columns of some rows, like the columns_of_interest DataFrame of dataset_division
+    def frame(self, positions):
+        positions = np.asarray(positions)
+        df = pd.DataFrame(np.asarray(self.labels[positions]), columns=label_columns)
+        df.insert(0, "text", [self.text(i) for i in positions])
+        return df
+
+
+# List-like selection of store rows (a split), every item is read from the store when accessed
+class StoreView:
+    def __init__(self, store, positions):
+        self.store = store
+        self.positions = np.asarray(positions)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.store.record(p) for p in self.positions[i]]
+        return self.store.record(self.positions[i])
+
+    def __iter__(self):
+        for p in self.positions:
+            yield self.store.record(p)
+
+
+# Opens the store of a CSV, building it first when it is missing, out of date or the CSV changed
+def open_store(csv_path, store_dir=STORE_DIR):
+    meta_path = os.path.join(store_dir, "meta.json")
+    meta = None
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    if meta is None or meta.get("version") != STORE_VERSION or meta.get("source") != os.path.abspath(csv_path) or \
+            {k: meta.get(k) for k in ("size", "mtime_ns")} != _source_stat(csv_path):
+        build_store(csv_path, store_dir)
+    return ArgumentStore(store_dir)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "./dataset.csv"
+    start = time.time()
+    meta = build_store(csv_path)
+    print(f"Built {STORE_DIR}/ from {csv_path}: {meta['n_rows']} rows in {time.time() - start:.2f} s")
+    store = ArgumentStore()
+    print(f"Text blob: {store.blob.nbytes / 1e6:.1f} MB, labels: {store.labels.nbytes / 1e3:.1f} KB")
@@ -0,0 +1,313 @@
+import datetime
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from Logger import Logger
+from backends import get_backend, BackendError
+from checkpoint import CHECKPOINT_DIR, open_checkpoint, write_checkpoint
+from aggregate_runs import schema_decoders
+from dataset_division import split_meta
+import model
+
+BACKEND = "ollama"
+MODEL_NAME = "llama3.1"
+ENDPOINTS = [
+    "http://gpu-1:11434",
+    "http://gpu-2:11434",
+    "http://gpu-3:11434",
+]
+N_RUNS = 5
+WORKERS_PER_ENDPOINT = 2  # requests in flight per host
+MAX_ATTEMPTS = 5  # per work item across all hosts, then the item is saved as None
+TIMEOUT = 120
+HEALTH_INTERVAL = 10  # seconds between health checks of every host
+DOWN_TIMEOUT = 300  # give up on the remaining items when no host is healthy for this long
+STEAL_AFTER = 3.0  # an idle worker duplicates an item in flight for longer than STEAL_AFTER x the median latency
+MIN_LATENCIES = 5  # completed items needed before the median latency is trusted for stealing
+LOG_LEVEL = "INFO"
+LOG_DIR = "logs"
+
+# local stand-ins for testing: one per port, (delay in seconds, failure rate)
+STAND_IN_PORTS = [11501, 11502, 11503]
+STAND_IN_PROFILES = [(0.05, 0.0), (0.05, 0.2), (0.5, 0.0)]  # fast, flaky, slow
+
+
+# Shards (run, argument) work items over several inference hosts. Every host gets WORKERS_PER_ENDPOINT
+# worker threads pulling from one shared queue, so fast hosts simply take more items. Failed items are
+# re-queued, hosts that fail a request or a health check stop pulling until they are healthy again, and
+# idle workers steal (duplicate) items that have been in flight on another host for too long
+class Coordinator:
+    def __init__(self, endpoints, items, build_prompt, parse, logger, checkpoint_file=None):
+        self.endpoints = list(endpoints)
+        self.build_prompt = build_prompt
+        self.parse = parse
+        self.logger = logger
+        self.checkpoint_file = checkpoint_file
+
+        self.pending = deque(items)
+        self.total = len(self.pending)
+        self.in_flight = {}  # item -> [(endpoint, start time)]
+        self.results = {}
+        self.attempts = Counter()
+        self.latencies = []
+        self.healthy = {url: True for url in self.endpoints}
+        self.failed_at = {url: 0.0 for url in self.endpoints}  # last host error of a request
+        self.stats = {url: Counter() for url in self.endpoints}
+        self.cond = threading.Condition()
+        self.finished = self.total == 0
+        self.stop_event = threading.Event()  # wakes the health monitor up when the run ends
+        self.last_healthy = time.time()
+
+    def _finish_item(self, item, labels, url, **fields):
+        self.results[item] = labels
+        if self.checkpoint_file is not None:
+            write_checkpoint(self.checkpoint_file, item[0], item[1], labels, endpoint=url, **fields)
+        if len(self.results) == self.total:
+            self.finished = True
+            self.stop_event.set()
+
+    # Result given without an LLM call (e.g. the pre-screen)
+    def resolve(self, item, labels, source):
+        with self.cond:
+            self.pending.remove(item)
+            self._finish_item(item, labels, None, source=source)
+
+    def _steal_candidate(self, url):
+        if len(self.latencies) < MIN_LATENCIES:
+            return None
+        limit = STEAL_AFTER * statistics.median(self.latencies)
+        now = time.time()
+        oldest = None
+        for item, copies in self.in_flight.items():
+            if len(copies) == 1 and copies[0][0] != url and now - copies[0][1] > limit:
+                if oldest is None or copies[0][1] < self.in_flight[oldest][0][1]:
+                    oldest = item
+        return oldest
+
+    # Next item for a worker of url, None when everything is done
+    def next_item(self, url):
+        with self.cond:
+            while not self.finished:
+                if self.healthy[url]:
+                    while self.pending:
+                        item = self.pending.popleft()
+                        if item not in self.results:
+                            self.in_flight.setdefault(item, []).append((url, time.time()))
+                            return item
+                    item = self._steal_candidate(url)
+                    if item is not None:
+                        self.stats[url]["stolen"] += 1
+                        self.in_flight[item].append((url, time.time()))
+                        self.logger.debug(f"{url} steals run {item[0] + 1} argument {item[1] + 1}",
+                                          endpoint=url, run=item[0] + 1, argument=item[1] + 1)
+                        return item
+                self.cond.wait(0.2)
+            return None
+
+    def _drop_copy(self, item, url):
+        copies = [c for c in self.in_flight.get(item, []) if c[0] != url]
+        if copies:
+            self.in_flight[item] = copies
+        else:
+            self.in_flight.pop(item, None)
+        return copies
+
+    def done(self, item, url, labels, elapsed):
+        with self.cond:
+            self._drop_copy(item, url)
+            self.stats[url]["done"] += 1
+            self.stats[url]["seconds"] += elapsed
+            self.latencies.append(elapsed)
+            if item in self.results:
+                self.stats[url]["wasted"] += 1  # the other copy of a stolen item won
+            else:
+                self._finish_item(item, labels, url, seconds=round(elapsed, 3))
+            self.cond.notify_all()
+
+    # host_error: the host itself failed (connection, timeout, HTTP error) and is marked unhealthy;
+    # otherwise the response was just invalid and the item is retried
+    def failed(self, item, url, reason, host_error):
+        with self.cond:
+            copies = self._drop_copy(item, url)
+            self.stats[url]["failed"] += 1
+            self.attempts[item] += 1
+            if host_error:
+                self.failed_at[url] = time.time()
+                if self.healthy[url]:
+                    self.healthy[url] = False
+                    self.logger.warning(f"{url} marked unhealthy: {reason}", endpoint=url)
+            if item not in self.results and not copies:
+                if self.attempts[item] >= MAX_ATTEMPTS:
+                    self.logger.error(f"Run {item[0] + 1} argument {item[1] + 1} failed {MAX_ATTEMPTS} times, saved as None",
+                                      run=item[0] + 1, argument=item[1] + 1)
+                    self._finish_item(item, None, url, error=reason)
+                else:
+                    self.pending.appendleft(item)
+            self.cond.notify_all()
+
+    def worker(self, url):
+        backend = get_backend(BACKEND, MODEL_NAME, url, timeout=TIMEOUT)
+        while True:
+            item = self.next_item(url)
+            if item is None:
+                return
+            start = time.time()
+            try:
+                labels = self.parse(backend.generate(self.build_prompt(item)))
+            except (BackendError, requests.exceptions.RequestException) as e:
+                self.failed(item, url, str(e), host_error=True)
+                continue
+            if labels is None:
+                self.failed(item, url, "invalid response", host_error=False)
+            else:
+                self.done(item, url, labels, time.time() - start)
+
+    # A host that failed a request stays unhealthy for at least HEALTH_INTERVAL even if its health check
+    # passes (the check does not generate), the workers are only woken up when a host changes state
+    def health_monitor(self):
+        backends = {url: get_backend(BACKEND, MODEL_NAME, url, timeout=TIMEOUT) for url in self.endpoints}
+        while not self.finished:
+            status = {url: backends[url].health() for url in self.endpoints}
+            with self.cond:
+                changed = False
+                for url, ok in status.items():
+                    if ok and time.time() - self.failed_at[url] < HEALTH_INTERVAL:
+                        continue
+                    if ok != self.healthy[url]:
+                        self.logger.info(f"{url} is {'healthy' if ok else 'unhealthy'}", endpoint=url, healthy=ok)
+                        self.healthy[url] = ok
+                        changed = True
+                if any(status.values()):
+                    self.last_healthy = time.time()
+                elif time.time() - self.last_healthy > DOWN_TIMEOUT:
+                    self.logger.error(f"No healthy host for {DOWN_TIMEOUT} s, the remaining items are saved as None")
+                    for item in list(self.pending) + list(self.in_flight):
+                        if item not in self.results:
+                            self._finish_item(item, None, None, error="no healthy host")
+                    self.finished = True
+                    changed = True
+                if changed:
+                    self.cond.notify_all()
+            self.stop_event.wait(HEALTH_INTERVAL)
+
+    def run(self):
+        threads = [threading.Thread(target=self.health_monitor, daemon=True)]
+        threads += [threading.Thread(target=self.worker, args=(url,), daemon=True)
+                    for url in self.endpoints for _ in range(WORKERS_PER_ENDPOINT)]
+        for t in threads:
+            t.start()
+        with self.cond:
+            self.cond.notify_all()
+            while not self.finished:
+                self.cond.wait(1.0)
+        self.stop_event.set()
+        return self.results
+
+
+# Results back to the all_runs layout (runs x arguments), missing items are None
+def merge_results(results, n_runs, n_args):
+    return [[results.get((r, i)) for i in range(n_args)] for r in range(n_runs)]
+
+
+# Per-host table (done, failed, stolen, wasted duplicates, mean latency), to the log and the terminal
+def log_endpoint_stats(stats, logger):
+    logger.info(f"\n{'endpoint':<32}{'done':>6}{'failed':>8}{'stolen':>8}{'wasted':>8}{'mean s':>8}")
+    for url, s in stats.items():
+        mean = s["seconds"] / s["done"] if s["done"] else 0
+        logger.info(f"{url:<32}{s['done']:>6}{s['failed']:>8}{s['stolen']:>8}{s['wasted']:>8}{mean:>8.2f}",
+                    endpoint=url, done=s["done"], failed=s["failed"], stolen=s["stolen"], wasted=s["wasted"],
+                    mean_seconds=round(mean, 3))
+
+
+# Stand-in for an Ollama host: answers /api/generate with random labels of the schema after `delay`
+# seconds, and fails with HTTP 500 at `failure_rate`
+def start_stand_in_server(port, schema_name, delay=0.05, failure_rate=0.0):
+    values = list(schema_decoders[schema_name].values())
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status, body):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps(body).encode("utf-8"))
+
+        def do_GET(self):
+            self._reply(200, {"models": [{"name": MODEL_NAME}]})
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            if random.random() < failure_rate:
+                self._reply(500, {"error": "stand-in failure"})
+                return
+            labels = {dim: random.choice(values) for dim in model.expected_dims}
+            self._reply(200, {"response": json.dumps(labels), "done": True})
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    print("\nSelect version of prompt (1 to 5):")
+    version = int(input("Enter version number: "))
+    if version not in model.version_schemas:
+        print("Invalid version.")
+        sys.exit(1)
+
+    endpoints = ENDPOINTS
+    if input("Use local stand-in servers instead of ENDPOINTS? (y/n): ").strip().lower() == "y":
+        endpoints = []
+        for port, (delay, failure_rate) in zip(STAND_IN_PORTS, STAND_IN_PROFILES):
+            start_stand_in_server(port, model.version_schemas[version], delay, failure_rate)
+            endpoints.append(f"http://127.0.0.1:{port}")
+
+    date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+    os.makedirs(LOG_DIR, exist_ok=True)
+    logger = Logger(os.path.join(LOG_DIR, f"distributed_run_{date}.log"), level=LOG_LEVEL,
+                    records_filename=os.path.join(LOG_DIR, f"distributed_run_{date}.jsonl.gz"))
+    model.configure(version, logger)
+    model.prepare_arguments()
+    arguments = model.arguments
+
+    def build_prompt(item):
+        i = item[1]
+        return model.build_prompt(arguments[i], model.few_shots[i] if model.few_shots else None)
+
+    items = [(r, i) for r in range(N_RUNS) for i in range(len(arguments))]
+    checkpoint_file = open_checkpoint(os.path.join(CHECKPOINT_DIR, f"checkpoint_{date}.jsonl"))
+    coordinator = Coordinator(endpoints, items, build_prompt, model.extract_labels, logger, checkpoint_file)
+    for r, i in items:
+        if model.prescreened[i] is not None:
+            coordinator.resolve((r, i), model.prescreened[i], "prescreen")
+
+    logger.info(f"{len(items)} work items over {len(endpoints)} endpoints", items=len(items), endpoints=endpoints)
+    start = time.time()
+    results = coordinator.run()
+    checkpoint_file.close()
+
+    all_runs = merge_results(results, N_RUNS, len(arguments))
+    output_filename = f"model_responses_distributed_{date}.json"
+    with open(output_filename, "w") as f:
+        json.dump({**split_meta(), "model": MODEL_NAME, "prompt_version": f"v{version}", "all_runs": all_runs},
+                  f, indent=2)
+
+    logger.info(f"Finished in {time.time() - start:.1f} s, "
+                f"{sum(v is None for v in results.values())} items failed", output=output_filename)
+    log_endpoint_stats(coordinator.stats, logger)
+    logger.info(f"\n--- SAVED RESPONSES: {output_filename} ---", output=output_filename)
+    logger.close()
+
+
+if __name__ == "__main__":
+    main()
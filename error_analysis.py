@@ -3,7 +3,7 @@ import os
 import numpy as np
 import matplotlib.pyplot as plt
 import csv
-from dataset_division import test_data
+from analyze_results_not_binary import load_runs
 
 dimensions = ["cogency", "effectiveness", "reasonableness", "overall"]
 
@@ -47,7 +47,9 @@ def analyze_error_severity(model_runs, ground_truths, output_folder):
                 if pred_item is None:
                     continue
                 gt_val = ground_truths[i][dim]
-                pred_label = pred_item[dim]
+                pred_label = pred_item.get(dim)
+                if not isinstance(pred_label, str):
+                    continue
 
                 try:
                     gt_float = float(gt_val)
@@ -126,34 +128,40 @@ def analyze_error_severity(model_runs, ground_truths, output_folder):
 
 
 # --------- MAIN ----------
-response_dir = "model_responses"
-response_files = [f for f in os.listdir(response_dir) if f.startswith("model_responses_") and f.endswith(".json")]
-if not response_files:
-    print("No model response files found.")
-    exit()
-
-print("\nAvailable model responses files:")
-for i, f in enumerate(response_files):
-    print(f"{i + 1}: {f}")
-
-selected_idx = int(input("Select a file by number: ")) - 1
-if selected_idx < 0 or selected_idx >= len(response_files):
-    print("Invalid selection.")
-    exit()
-
-selected_filename = response_files[selected_idx]
-with open(os.path.join(response_dir, selected_filename), 'r') as f:
-    all_runs = json.load(f)
-
-ground_truths = [entry["labels"] for entry in test_data]
-print(f"\nLoaded {len(all_runs)} runs with {len(all_runs[0])} predictions each.")
-
-# Generate subfolder name
-base_name = os.path.splitext(selected_filename)[0].replace("model_responses_", "")
-output_folder = os.path.join("error_analysis_plots", f"error_{base_name}")
-os.makedirs(output_folder, exist_ok=True)
-
-analyze_error_severity(all_runs, ground_truths, output_folder)
-
-print(f"\n--- Error severity analysis finished ---")
-print(f"CSV files and plot saved in folder: {output_folder}")
+if __name__ == "__main__":
+    from dataset_division import test_data
+
+    response_dir = "model_responses"
+    response_files = [f for f in os.listdir(response_dir) if f.startswith("model_responses_") and f.endswith(".json")]
+    if not response_files:
+        print("No model response files found.")
+        exit()
+
+    print("\nAvailable model responses files:")
+    for i, f in enumerate(response_files):
+        print(f"{i + 1}: {f}")
+
+    selected_idx = int(input("Select a file by number: ")) - 1
+    if selected_idx < 0 or selected_idx >= len(response_files):
+        print("Invalid selection.")
+        exit()
+
+    selected_filename = response_files[selected_idx]
+    try:
+        all_runs = load_runs(os.path.join(response_dir, selected_filename))
+    except ValueError as e:
+        print(e)
+        exit()
+
+    ground_truths = [entry["labels"] for entry in test_data]
+    print(f"\nLoaded {len(all_runs)} runs with {len(all_runs[0])} predictions each.")
+
+    # Generate subfolder name
+    base_name = os.path.splitext(selected_filename)[0].replace("model_responses_", "")
+    output_folder = os.path.join("error_analysis_plots", f"error_{base_name}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    analyze_error_severity(all_runs, ground_truths, output_folder)
+
+    print(f"\n--- Error severity analysis finished ---")
+    print(f"CSV files and plot saved in folder: {output_folder}")
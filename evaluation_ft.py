@@ -1,23 +1,18 @@
 import datetime
 import sys
+import contextlib
 import json
 import os
 import numpy as np
 from scipy.stats import pearsonr
 from sklearn.metrics import confusion_matrix, classification_report
 from collections import defaultdict
-from dataset_division import test_data
 from Logger import Logger
+from analyze_results_not_binary import load_runs
 
 dimensions = ["cogency", "effectiveness", "reasonableness", "overall"]
 
-log_dir = "evaluation"
-os.makedirs(log_dir, exist_ok=True)
-date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
-log_filename = os.path.join(log_dir, f"evaluation_{date}.txt")
-sys.stdout = Logger(log_filename)
-
-def normalize_for_dimension(value, dimension_name=None):
+def normalize_for_dimension(value, dimension_name=None, verbose=True):
     if value is None:
         return None
     try:
@@ -39,17 +34,22 @@ def normalize_for_dimension(value, dimension_name=None):
             return 1  # Good
     
     except Exception as e:
-        print(f"Warning: Could not parse value '{value}' for dimension '{dimension_name}' - Error: {e}")
+        if verbose:
+            print(f"Warning: Could not parse value '{value}' for dimension '{dimension_name}' - Error: {e}")
         return None
 
-def prepare_scores(data, dim):
+def prepare_scores(data, dim, verbose=True):
     scores = []
     for x in data:
-        val = normalize_for_dimension(x[dim], dim)
+        if x is None:
+            scores.append(-1)  # argument that failed or was not sampled in this run
+            continue
+        val = normalize_for_dimension(x.get(dim), dim, verbose)
         if val is not None:
             scores.append(val)
         else:
-            print(f"Warning: '{x[dim]}' not valid for dimension '{dim}'")
+            if verbose:
+                print(f"Warning: '{x.get(dim)}' not valid for dimension '{dim}'")
             scores.append(-1)
     return scores
 
@@ -64,90 +64,142 @@ def print_dynamic_cm(cm, labels):
         row_str = " ".join(f"{val:8.2f}" for val in row)
         print(f"{labels[i]:10}{row_str}")
 
-def evaluate_single_run(model_outputs, ground_truths):
-    print("\n--- SINGLE RUN EVALUATION ---\n")
+# Confusion matrix, classification report and Pearson correlation of a single run, per dimension
+def compute_single_run(model_outputs, ground_truths):
+    results = {}
     for dim in dimensions:
-        true_scores = prepare_scores(ground_truths, dim)
-        model_scores = prepare_scores(model_outputs, dim)
+        true_scores = prepare_scores(ground_truths, dim, verbose=False)
+        model_scores = prepare_scores(model_outputs, dim, verbose=False)
 
         paired = [(t, p) for t, p in zip(true_scores, model_scores) if t >= 0 and p >= 0]
         if not paired:
-            print(f"No valid samples for {dim}, skipping.")
+            results[dim] = None
             continue
 
         y_true = [t for t, _ in paired]
         y_pred = [p for _, p in paired]
 
         classes = sorted(set(y_true + y_pred))
-        cm = confusion_matrix(y_true, y_pred, labels=classes)
-        report = classification_report(y_true, y_pred, labels=classes, zero_division=0)
+        corr, pval = pearsonr(y_true, y_pred)
+        results[dim] = {
+            "cm": confusion_matrix(y_true, y_pred, labels=classes),
+            "labels": [str(c) for c in classes],
+            "report": classification_report(y_true, y_pred, labels=classes, output_dict=True, zero_division=0),
+            "report_text": classification_report(y_true, y_pred, labels=classes, zero_division=0),
+            "pearson": corr,
+            "pearson_p": pval,
+        }
+    return results
+
+# prints a classification report given as a dict (sklearn output_dict format)
+def print_report(report):
+    print(f"{'Label':<15} {'Precision':>9} {'Recall':>7} {'F1-score':>9} {'Support':>8}")
+    print("-" * 50)
+    for label in report:
+        metrics = report[label]
+        if isinstance(metrics, dict):
+            print(f"{label:<15} {metrics.get('precision', 0):9.2f} {metrics.get('recall', 0):7.2f} {metrics.get('f1-score', 0):9.2f} {metrics.get('support', 0):8.0f}")
+    if "accuracy" in report and not isinstance(report["accuracy"], dict):
+        print(f"{'accuracy':<15} {'':>27} {report['accuracy']:8.2f}")
+
+def print_single_run(results):
+    for dim in dimensions:
+        res = results[dim]
+        if res is None:
+            print(f"No valid samples for {dim}, skipping.")
+            continue
 
         print(f"\n--- {dim.upper()} ---")
-        print_dynamic_cm(cm, [str(c) for c in classes])
+        print_dynamic_cm(res["cm"], res["labels"])
         print("\nClassification Report:")
-        print(report)
+        print(res["report_text"])
+        print(f"Pearson correlation for {dim}: {res['pearson']:.4f} (p={res['pearson_p']:.4f})")
 
-        # Calcular correlación Pearson
-        corr, pval = pearsonr(y_true, y_pred)
-        print(f"Pearson correlation for {dim}: {corr:.4f} (p={pval:.4f})")
-
-def analyze_variability_and_correlation_across_runs(all_runs, ground_truths):
-    print("\n--- VARIABILITY AND CORRELATION ACROSS RUNS ---\n")
+def evaluate_single_run(model_outputs, ground_truths):
+    print("\n--- SINGLE RUN EVALUATION ---\n")
+    print_single_run(compute_single_run(model_outputs, ground_truths))
 
+# Variability between runs and Pearson correlation per run and for the mean prediction, per dimension
+def compute_variability_and_correlation_across_runs(all_runs, ground_truths):
     n_args = len(all_runs[0])
     n_runs = len(all_runs)
+    results = {}
 
     for dim in dimensions:
-        print(f"\n--- DIMENSION: {dim.upper()} ---")
+        gt_scores = np.array(prepare_scores(ground_truths[:n_args], dim, verbose=False))
 
-        gt_scores = prepare_scores(ground_truths, dim)
+        # Matriz (args x runs) con predicciones normalizadas, NaN where the run has no valid label
+        # (failed arguments, or arguments that got fewer samples in adaptive mode)
+        preds_matrix = np.array([prepare_scores(run, dim, verbose=False) for run in all_runs], dtype=float).T
+        preds_matrix[preds_matrix < 0] = np.nan
+        has_preds = ~np.all(np.isnan(preds_matrix), axis=1)
 
-        # Matriz (args x runs) con predicciones normalizadas
-        preds_matrix = np.array([
-            [normalize_for_dimension(all_runs[run_idx][arg_idx][dim], dim) for run_idx in range(n_runs)]
-            for arg_idx in range(n_args)
-        ])
-
-        std_by_arg = np.std(preds_matrix, axis=1)
-        mean_std = np.mean(std_by_arg)
+        std_by_arg = np.nanstd(preds_matrix[has_preds], axis=1)
 
         # Discrepancias
-        disagreement_flags = [len(set(preds_matrix[i])) > 1 for i in range(n_args)]
-        num_disagreements = sum(disagreement_flags)
-        proportion_disagreement = num_disagreements / n_args
-
-        print(f"Mean std deviation per argument: {mean_std:.4f}")
-        print(f"Arguments with disagreement: {num_disagreements} / {n_args} ({proportion_disagreement:.2%})")
+        num_disagreements = int(np.sum(np.nanmax(preds_matrix[has_preds], axis=1) != np.nanmin(preds_matrix[has_preds], axis=1)))
 
-        # Correlación Pearson para cada run vs GT
-        print("\nPearson correlation per run:")
+        # Correlación Pearson para cada run vs GT (None when there is no valid data)
+        run_correlations = []
         for run_idx in range(n_runs):
             run_preds = preds_matrix[:, run_idx]
-            valid_mask = (run_preds >= 0) & (np.array(gt_scores) >= 0)
+            valid_mask = ~np.isnan(run_preds) & (gt_scores >= 0)
             if np.sum(valid_mask) == 0:
-                print(f" Run {run_idx+1}: No valid data")
+                run_correlations.append(None)
                 continue
-            corr, pval = pearsonr(np.array(gt_scores)[valid_mask], run_preds[valid_mask])
-            print(f" Run {run_idx+1}: correlation = {corr:.4f} (p={pval:.4f})")
+            run_correlations.append(pearsonr(gt_scores[valid_mask], run_preds[valid_mask]))
 
         # Correlación general: media de predicciones por argumento vs GT
-        mean_preds = np.mean(preds_matrix, axis=1)
-        valid_mask = (mean_preds >= 0) & (np.array(gt_scores) >= 0)
-        if np.sum(valid_mask) > 0:
-            corr, pval = pearsonr(np.array(gt_scores)[valid_mask], mean_preds[valid_mask])
+        mean_preds = np.full(n_args, np.nan)
+        mean_preds[has_preds] = np.nanmean(preds_matrix[has_preds], axis=1)
+        valid_mask = ~np.isnan(mean_preds) & (gt_scores >= 0)
+        overall_correlation = pearsonr(gt_scores[valid_mask], mean_preds[valid_mask]) if np.sum(valid_mask) > 0 else None
+
+        results[dim] = {
+            "n_args": n_args,
+            "prediction_matrix": preds_matrix,
+            "mean_std": np.mean(std_by_arg) if std_by_arg.size else 0.0,
+            "num_disagreements": num_disagreements,
+            "proportion_disagreement": num_disagreements / n_args,
+            "run_correlations": run_correlations,
+            "overall_correlation": overall_correlation,
+        }
+
+    return results
+
+def print_variability_and_correlation(results):
+    for dim in dimensions:
+        res = results[dim]
+        print(f"\n--- DIMENSION: {dim.upper()} ---")
+        print(f"Mean std deviation per argument: {res['mean_std']:.4f}")
+        print(f"Arguments with disagreement: {res['num_disagreements']} / {res['n_args']} ({res['proportion_disagreement']:.2%})")
+
+        print("\nPearson correlation per run:")
+        for run_idx, corr in enumerate(res["run_correlations"]):
+            if corr is None:
+                print(f" Run {run_idx+1}: No valid data")
+                continue
+            print(f" Run {run_idx+1}: correlation = {corr[0]:.4f} (p={corr[1]:.4f})")
+
+        if res["overall_correlation"] is not None:
+            corr, pval = res["overall_correlation"]
             print(f"\nOverall Pearson correlation (mean across runs): {corr:.4f} (p={pval:.4f})")
         else:
             print("\nNo valid data for overall Pearson correlation.")
 
+def analyze_variability_and_correlation_across_runs(all_runs, ground_truths):
+    print("\n--- VARIABILITY AND CORRELATION ACROSS RUNS ---\n")
+    print_variability_and_correlation(compute_variability_and_correlation_across_runs(all_runs, ground_truths))
+
 def compute_avg_cm_and_std(all_runs, ground_truth):
     n_runs = len(all_runs)
     avg_cms = {}
 
     for dim in dimensions:
         all_classes = set()
-        true_scores_total = prepare_scores(ground_truth, dim)
+        true_scores_total = prepare_scores(ground_truth, dim, verbose=False)
         for run in all_runs:
-            model_scores_total = prepare_scores(run, dim)
+            model_scores_total = prepare_scores(run, dim, verbose=False)
             paired = [(t, p) for t, p in zip(true_scores_total, model_scores_total) if t >= 0 and p >= 0]
             for t, p in paired:
                 all_classes.update([t, p])
@@ -155,8 +207,8 @@ def compute_avg_cm_and_std(all_runs, ground_truth):
 
         cm_stack = []
         for run in all_runs:
-            true_scores = prepare_scores(ground_truth, dim)
-            model_scores = prepare_scores(run, dim)
+            true_scores = prepare_scores(ground_truth, dim, verbose=False)
+            model_scores = prepare_scores(run, dim, verbose=False)
             paired = [(t, p) for t, p in zip(true_scores, model_scores) if t >= 0 and p >= 0]
             if not paired:
                 continue
@@ -189,19 +241,20 @@ def print_avg_cm(avg_cms):
         print_dynamic_cm(std_cm, [str(l) for l in labels])
 
 def compute_avg_classification_report(all_runs, ground_truth):
-    n_runs = len(all_runs)
     avg_reports = {}
 
     for dim in dimensions:
         total_report = defaultdict(lambda: defaultdict(float))
         classes = None
+        n_used = 0  # runs with at least one valid prediction, the others are left out of the mean
 
         for run in all_runs:
-            true_scores = prepare_scores(ground_truth, dim)
-            model_scores = prepare_scores(run, dim)
+            true_scores = prepare_scores(ground_truth, dim, verbose=False)
+            model_scores = prepare_scores(run, dim, verbose=False)
             paired = [(t, p) for t, p in zip(true_scores, model_scores) if t >= 0 and p >= 0]
             if not paired:
                 continue
+            n_used += 1
             y_true = [t for t, _ in paired]
             y_pred = [p for _, p in paired]
             run_classes = sorted(set(y_true + y_pred))
@@ -217,7 +270,7 @@ def compute_avg_classification_report(all_runs, ground_truth):
         # Promediar
         averaged = {}
         for label, metrics in total_report.items():
-            averaged[label] = {k: v / n_runs for k, v in metrics.items()}
+            averaged[label] = {k: v / n_used for k, v in metrics.items()}
         avg_reports[dim] = (averaged, classes)
 
     return avg_reports
@@ -229,54 +282,72 @@ def print_avg_classification_report(avg_reports):
         if not report:
             print("No data to display.")
             continue
-        print(f"{'Label':<15} {'Precision':>9} {'Recall':>7} {'F1-score':>9} {'Support':>8}")
-        print("-" * 50)
-        for label in report:
-            metrics = report[label]
-            if isinstance(metrics, dict):
-                print(f"{label:<15} {metrics.get('precision', 0):9.2f} {metrics.get('recall', 0):7.2f} {metrics.get('f1-score', 0):9.2f} {metrics.get('support', 0):8.0f}")
+        print_report(report)
 
 
 
 # --- Main ---
 
-print(f"Loaded {len(test_data)} test arguments")
+LOG_TO_FILE = True  # copy the console output to evaluation/evaluation_<date>.txt
+
+# Full report of one response file (also used by analysis_pipeline.py)
+def report_runs(all_runs, ground_truth):
+    print(f"\nLoaded {len(all_runs)} runs with {len(all_runs[0])} arguments each.")
 
-response_dir = "model_responses"
-response_files = [f for f in os.listdir(response_dir) if f.startswith("model_responses_") and f.endswith(".json")]
-if not response_files:
-    print("No response files found.")
-    sys.exit(1)
+    # Evaluar cada ejecución individual
+    for i, run in enumerate(all_runs):
+        print(f"\n=== Evaluation for run {i+1} ===")
+        evaluate_single_run(run, ground_truth)
 
-print("Available model response files:")
-for i, f in enumerate(response_files):
-    print(f" {i+1}: {f}")
+    # Análisis y correlaciones across runs
+    analyze_variability_and_correlation_across_runs(all_runs, ground_truth)
 
-selected_idx = int(input("Select response file number: ")) - 1
-if selected_idx < 0 or selected_idx >= len(response_files):
-    print("Invalid selection.")
-    sys.exit(1)
+    avg_cms = compute_avg_cm_and_std(all_runs, ground_truth)
+    print_avg_cm(avg_cms)
 
-with open(response_files[selected_idx], "r") as f:
-    all_runs = json.load(f)
+    avg_reports = compute_avg_classification_report(all_runs, ground_truth)
+    print_avg_classification_report(avg_reports)
 
-ground_truth = [entry["labels"] for entry in test_data]
+def main():
+    from dataset_division import test_data
 
-print(f"\nLoaded {len(all_runs)} runs with {len(all_runs[0])} arguments each.")
+    print(f"Loaded {len(test_data)} test arguments")
 
-# Evaluar cada ejecución individual
-for i, run in enumerate(all_runs):
-    print(f"\n=== Evaluation for run {i+1} ===")
-    evaluate_single_run(run, ground_truth)
+    response_dir = "model_responses"
+    response_files = [f for f in os.listdir(response_dir) if f.startswith("model_responses_") and f.endswith(".json")]
+    if not response_files:
+        print("No response files found.")
+        sys.exit(1)
+
+    print("Available model response files:")
+    for i, f in enumerate(response_files):
+        print(f" {i+1}: {f}")
+
+    selected_idx = int(input("Select response file number: ")) - 1
+    if selected_idx < 0 or selected_idx >= len(response_files):
+        print("Invalid selection.")
+        sys.exit(1)
+
+    try:
+        all_runs = load_runs(os.path.join(response_dir, response_files[selected_idx]))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
 
-# Análisis y correlaciones across runs
-analyze_variability_and_correlation_across_runs(all_runs, ground_truth)
+    ground_truth = [entry["labels"] for entry in test_data]
 
-avg_cms = compute_avg_cm_and_std(all_runs, ground_truth)
-print_avg_cm(avg_cms)
+    report_runs(all_runs, ground_truth)
 
-avg_reports = compute_avg_classification_report(all_runs, ground_truth)
-print_avg_classification_report(avg_reports)
+    print("\n--- Evaluation finished ---")
 
 
-print("\n--- Evaluation finished ---")
+if __name__ == "__main__":
+    if LOG_TO_FILE:
+        log_dir = "evaluation"
+        os.makedirs(log_dir, exist_ok=True)
+        date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+        log_filename = os.path.join(log_dir, f"evaluation_{date}.txt")
+        with Logger(log_filename) as logger, contextlib.redirect_stdout(logger):
+            main()
+    else:
+        main()
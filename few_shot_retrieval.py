@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import numpy as np
+from analyze_results_not_binary import dimensions, encode_ground_truth
+from aggregate_runs import schema_decoders
+from backends import get_backend
+from prescreen import load_training_data, round_ground_truths
+
+EMBED_BACKEND = "ollama"
+EMBED_URL = None  # None = the default of EMBED_BACKEND
+EMBED_MODEL = "nomic-embed-text"
+EMBED_BATCH_SIZE = 64
+INDEX_DIR = "few_shot_index"
+FEW_SHOT_K = 3
+MAX_EXAMPLE_WORDS = 120  # longer training arguments are never used as examples, keeps the prompts short
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _model_slug(model):
+    return model.replace("/", "_").replace(":", "_")
+
+
+# Embeddings stored on disk by text hash, so reruns only embed texts that were never seen
+class EmbeddingCache:
+    def __init__(self, model=EMBED_MODEL, backend=None, cache_dir=INDEX_DIR):
+        self.model = model
+        self.backend = backend or get_backend(EMBED_BACKEND, model, EMBED_URL)
+        self.path = os.path.join(cache_dir, f"cache_{_model_slug(model)}.npz")
+        self.rows = {}
+        self.vectors = []
+        if os.path.exists(self.path):
+            data = np.load(self.path)
+            self.rows = {key: i for i, key in enumerate(data["keys"].tolist())}
+            self.vectors = list(data["vectors"])
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        keys = np.array(list(self.rows), dtype=str)
+        np.savez(self.path, keys=keys, vectors=np.asarray(self.vectors, dtype=np.float32))
+
+    # Unit-norm embeddings (n_texts, dim), embedding only the texts missing from the cache
+    def embed(self, texts):
+        hashes = [text_hash(t) for t in texts]
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in self.rows and h not in missing:
+                missing[h] = t
+
+        pending = list(missing.items())
+        for start in range(0, len(pending), EMBED_BATCH_SIZE):
+            batch = pending[start:start + EMBED_BATCH_SIZE]
+            for (h, _), vector in zip(batch, self.backend.embed([t for _, t in batch], model=self.model)):
+                vector = np.asarray(vector, dtype=np.float32)
+                self.rows[h] = len(self.vectors)
+                self.vectors.append(vector / (np.linalg.norm(vector) or 1.0))
+        if pending:
+            self.save()
+
+        return np.stack([self.vectors[self.rows[h]] for h in hashes]) if hashes else np.zeros((0, 0), np.float32)
+
+
+# Flat inner-product index over the labeled training arguments of the split, saved as index_<model>.npz.
+# It is rebuilt when the training texts change (the "source" hash no longer matches)
+def load_index(cache):
+    texts, ground_truths = load_training_data(include_val=False)
+    source = text_hash("\n".join(texts))
+    path = os.path.join(INDEX_DIR, f"index_{_model_slug(cache.model)}.npz")
+
+    if os.path.exists(path):
+        data = np.load(path)
+        if str(data["source"]) == source:
+            return data["vectors"], texts, ground_truths
+
+    vectors = cache.embed(texts)
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    np.savez(path, vectors=vectors, source=np.array(source))
+    return vectors, texts, ground_truths
+
+
+# Picks the k nearest labeled training arguments of each argument and formats them as prompt examples
+class FewShotRetriever:
+    def __init__(self, schema_name, k=FEW_SHOT_K, model=EMBED_MODEL, backend=None):
+        self.schema_name = schema_name
+        self.k = k
+        self.cache = EmbeddingCache(model, backend)
+        self.vectors, self.texts, ground_truths = load_index(self.cache)
+        self.hashes = np.array([text_hash(t) for t in self.texts])
+
+        # examples need a valid label in every dimension and must be short
+        self.codes = encode_ground_truth(round_ground_truths(ground_truths, schema_name), schema_name)
+        short = np.array([len(t.split()) <= MAX_EXAMPLE_WORDS for t in self.texts])
+        self.candidates = (self.codes >= 0).all(axis=1) & short
+
+    # Indices of the k nearest examples per argument, nearest first: one array per argument, shorter than k
+    # when the pool of candidates is smaller (empty without candidates, the runners then keep their examples)
+    def nearest(self, arguments):
+        k = min(self.k, int(self.candidates.sum()))
+        if k == 0 or not arguments:
+            return [np.zeros(0, dtype=int) for _ in arguments]
+        scores = self.cache.embed(arguments) @ self.vectors.T
+        scores[:, ~self.candidates] = -np.inf
+        # an argument never gets itself as an example
+        scores[np.array([text_hash(a) for a in arguments])[:, None] == self.hashes[None, :]] = -np.inf
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        ranked = np.take_along_axis(top, order, axis=1)
+        # with a pool of k candidates an argument of the pool gets itself back, that slot is dropped
+        return [row[np.isfinite(scores[i, row])] for i, row in enumerate(ranked)]
+
+    def format_example(self, idx):
+        decoder = schema_decoders[self.schema_name]
+        labels = {dim: decoder[int(self.codes[idx, d])] for d, dim in enumerate(dimensions)}
+        return f"###EXAMPLE###\nEXAMPLE argument:\n{self.texts[idx].strip()}\n\nEXAMPLE OUTPUT:\n{json.dumps(labels, indent=4)}\n"
+
+    # The examples block of each argument, same layout as the hard-coded examples of the runners
+    def examples(self, arguments):
+        return ["\n".join(self.format_example(idx) for idx in row) for row in self.nearest(arguments)]
@@ -1,10 +1,15 @@
 import datetime
 import time
-from dataset_division import test_data
+from dataset_division import SPLIT_ID, split_meta, test_data
 import requests
 from collections import Counter
 import re
 import json
+import os
+from Logger import Logger
+from backends import get_backend, BackendError
+from model_session import ModelSession, log_session_report
+from checkpoint import CHECKPOINT_DIR, open_checkpoint, write_checkpoint, stop_requested
 
 
 #date in YYYY-MM-DD-HH-MM format
@@ -12,13 +17,37 @@ date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
 
 global_start = time.time() #total time
 
-API_URL = "http://localhost:11434/api/generate"
+BACKEND = "ollama"  # "ollama", "openai" (llama.cpp server, vLLM) or "local" (in-process, MODEL_NAME is a model path)
+API_URL = None  # None = the default of BACKEND (ollama http://localhost:11434, openai http://localhost:8080/v1)
 MODEL_NAME = "llama3.1"
+SWEEP_MODELS = []  # several models one after another (the next one is loaded during the last run), [] = MODEL_NAME
 N_RUNS = 5
 VERSION = 4 # chose between 4 versions
+ADAPTIVE = False  # schedule runs per argument and stop sampling arguments whose first runs agree
+MIN_AGREE_RUNS = 2  # k: runs that must agree on all four dimensions before an argument stops
+MAX_SAMPLES_PER_ARGUMENT = 10
+PRESCREEN = False  # cascade: arguments the pre-screen classifier is confident about skip the LLM
+PRESCREEN_THRESHOLD = 0.9
+REUSE_NEAR_DUPLICATES = False  # near-duplicate arguments reuse the labels of their cluster representative
+FEW_SHOT_K = 0  # 0 = the hard-coded examples of the version, k > 0 = the k most similar training arguments
+BATCH_SIZE = 1  # K > 1 scores K arguments per request after a single header (batched_prompts.py)
+CONTEXT_WINDOW = False  # num_ctx per prompt from its length, long arguments follow the policy of context_window.py
+ARCHIVE_RESPONSES = False  # every raw response goes to response_archive/ for re-parsing without the LLM
+SOFT_LABELS = False  # one deterministic pass that also keeps P(label) per dimension from the token logprobs
+TOP_LOGPROBS = 10  # candidate tokens per position, enough to cover every label of the schema
+LOG_LEVEL = "INFO"  # "DEBUG" also logs the argument text and the raw response of every argument
+LOG_DIR = "logs"
 
 arguments = [entry["text"] for entry in test_data]
 
+# set by main() (or configure() when another script reuses the prompts and the parser)
+version = VERSION
+logger = None
+backend = None
+checkpoint_path = None
+checkpoint_file = None
+archive = None
+
 common_intro1 = """
 ####ROLE###
 You are an Argument Annotator AI.
@@ -293,11 +322,6 @@ EXAMPLE OUTPUT:
     "overall": "Good"
 }}
 """
-# --- Selector desde línea de comandos o input ---
-print("\nSelect version of prompt (1 to 5):")
-version = int(input("Enter version number: "))
-print(f"\n✅ Using prompt version {version}...\n")
-
 # --- Diccionarios para seleccionar automáticamente ---
 common_intros = {
     1: common_intro1,
@@ -315,37 +339,102 @@ examples = {
     5: example5
 }
 
+# label schema of each prompt version, used by the pre-screen
+version_schemas = {
+    1: "numeric_1_to_5",
+    2: "ternary_bad_medium_good",
+    3: "binary_good_bad",
+    4: "binary_effective_ineffective",
+    5: "binary_good_bad"
+}
+
+# Pre-screen labels for the arguments that do not need the LLM, None for the rest
+prescreened = [None] * len(arguments)
+# representative[i] is the near-duplicate argument whose labels argument i reuses
+representative = list(range(len(arguments)))
+scored = {}  # (run, argument) -> labels, for the reuse
+# few-shot examples picked per argument from the training set, None = the hard-coded examples
+few_shots = None
+# num_ctx and truncation plan per argument (context_window.py), None = server defaults, whole arguments
+context_plans = None
+
+
+# Selects the prompt version and the logger used by build_prompt, extract_labels and query_model
+def configure(version_number, run_logger, run_backend=None):
+    global version, logger, backend
+    version = version_number
+    logger = run_logger
+    backend = run_backend
+
+
+# Pre-screen, near-duplicate reuse, few-shot retrieval and context planning, each enabled by its constant
+def prepare_arguments():
+    global prescreened, representative, few_shots, context_plans
+    if PRESCREEN:
+        from prescreen import train_prescreen
+        prescreened = train_prescreen(version_schemas[version]).screen(arguments, PRESCREEN_THRESHOLD)
+        n_screened = sum(labels is not None for labels in prescreened)
+        logger.info(f"Pre-screen labels {n_screened} of {len(arguments)} arguments, the LLM scores the rest",
+                    prescreened=n_screened)
+
+    if REUSE_NEAR_DUPLICATES:
+        from near_duplicates import near_duplicate_clusters
+        representative = near_duplicate_clusters(arguments)[0]
+        n_reused = sum(r != i for i, r in enumerate(representative))
+        logger.info(f"{n_reused} near-duplicate arguments reuse the labels of their cluster representative",
+                    near_duplicates=n_reused)
+
+    if FEW_SHOT_K > 0:
+        from few_shot_retrieval import FewShotRetriever
+        few_shots = FewShotRetriever(version_schemas[version], FEW_SHOT_K).examples(arguments)
+
+    if CONTEXT_WINDOW:
+        from context_window import ContextPlanner, plan_summary
+        planner = ContextPlanner(build_prompt)
+        context_plans = [planner.plan(arg, few_shots[i] if few_shots else None) for i, arg in enumerate(arguments)]
+        summary = plan_summary(context_plans)
+        logger.info(f"Context plan: arguments per num_ctx {summary['num_ctx']}, per policy {summary['policy']}",
+                    **summary)
+
 # --- Prompt Builder según versión ---
-def build_prompt(argument):
+# shots replaces the hard-coded examples of the version, the expected output block is kept
+def build_prompt(argument, shots=None):
     selected_intro = common_intros.get(version, common_intro1)
     selected_example = examples.get(version, example1)
+    if shots:
+        selected_example = selected_example.split("###EXAMPLE###")[0] + shots
     return f"{selected_intro}\n{dimensions}\n{selected_example}\n\n###argument###\n{argument}###YOUR RESPONSE### (Only respond with the JSON object)"
 
 
+# K arguments after one header, shots are the retrieved examples of the first argument of the batch
+def build_batch_prompt(batch, shots=None):
+    from batched_prompts import batch_prompt
+    selected_intro = common_intros.get(version, common_intro1)
+    selected_example = examples.get(version, example1)
+    if shots:
+        selected_example = selected_example.split("###EXAMPLE###")[0] + shots
+    return batch_prompt(f"{selected_intro}\n{dimensions}\n{selected_example}", batch)
+
+
 # This function sends the prompt to the API and returns the response it also measures the response time
-def query_model(prompt):
+def query_model(prompt, options=None):
     try:
-        res = requests.post(API_URL, json={
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": False
-        })
+        return backend.generate(prompt, options)
 
-        if res.status_code != 200:
-            print("Error from API:", res.text)
-            return None
+    except BackendError as e:
+        logger.error(f"Error from API: {e}")
+        return None
 
-        return res.json().get("response", "{}")
-    
     except requests.exceptions.RequestException as e:
-        print("Request failed:", e)
+        logger.error(f"Request failed: {e}")
         return None
     
 def extract_labels(text):
     try:
         match = re.search(r'(\{{1,2})(.*?)(\}{1,2})', text, re.DOTALL)
         if not match:
-            print("❌ No JSON-like object found in response. ")
+            logger.warning("❌ No JSON-like object found in response. ")
+            logger.debug(f"Raw response: {text}", response=text)
             return None  
         
         json_text = match.group(0)
@@ -368,52 +457,337 @@ def extract_labels(text):
             return None  # Missing keys
 
     except Exception as e:
-        print("Error parsing response:", text)
+        logger.warning(f"Error parsing response: {text}", response=text)
         return None  # Invalid format
 
     
 MAX_RETRIES = 5
 error_counter = Counter()
-all_runs = []
-for run_ind in range(N_RUNS):
-    run_start = time.time()
-    print(f"\n--- RUN {run_ind + 1} ---")
-    run = []
-    local_errors = 0
+local_errors = 0
+expected_dims = ["cogency", "effectiveness", "reasonableness", "overall"]
+
+# Sends the prompt of one argument (or one part of it), retrying invalid responses;
+# returns the labels or None after MAX_RETRIES
+def request_labels(arg, i, run_ind, options=None, part=0):
+    global local_errors
+    retries = 0
+    labels = None
+
+    while retries < MAX_RETRIES:
+        prompt = build_prompt(arg, few_shots[i] if few_shots else None)
+        response = query_model(prompt, options)
+        if archive is not None and response is not None:
+            archive.write(run_ind, i, response, attempt=retries, part=part, model=backend.model, version=version)
+        labels = extract_labels(response)
+
+        if labels and all(dim in labels for dim in expected_dims):
+            break
+        retries += 1
+        local_errors += 1
+        error_counter[f"arg_{i+1}_retry_{retries}"] += 1
+        logger.warning(f"Retry {retries} for argument {i+1} due to invalid response.",
+                       run=run_ind + 1, argument=i + 1, retry=retries)
+        time.sleep(1)
+    else:
+        logger.error(f"Failed to process argument {i+1} after {MAX_RETRIES} retries. Skipping.",
+                     run=run_ind + 1, argument=i + 1)
+        labels = None  # o gunmen marcador tipo 'None'
+    return labels
+
+
+# Scores one argument (pre-screen, near-duplicate reuse or the LLM with its context plan);
+# returns the labels or None after MAX_RETRIES
+def score_argument(i, arg, run_ind):
+    if prescreened[i] is not None:
+        write_checkpoint(checkpoint_file, run_ind, i, prescreened[i], source="prescreen")
+        return prescreened[i]
+    if representative[i] != i and (run_ind, representative[i]) in scored:
+        labels = scored[(run_ind, representative[i])]
+        write_checkpoint(checkpoint_file, run_ind, i, labels, source="near_duplicate")
+        return labels
+
+    arg_start = time.time()
+    if context_plans:
+        from context_window import aggregate_chunks, truncation_record
+        plan = context_plans[i]
+        options = {"num_ctx": plan["num_ctx"]}
+        chunk_labels = [request_labels(piece, i, run_ind, options, part) for part, piece in enumerate(plan["pieces"])]
+        labels = chunk_labels[0] if len(chunk_labels) == 1 else aggregate_chunks(chunk_labels, version_schemas[version])
+        truncation = truncation_record(plan)
+        if labels is not None and truncation is not None:
+            labels = {**labels, "truncation": truncation}
+    else:
+        labels = request_labels(arg, i, run_ind)
+
+    arg_time = time.time() - arg_start
+    logger.debug(f"Argument {i + 1}:\n{arg}\n", run=run_ind + 1, argument=i + 1)
+    logger.info(f"Argument {i + 1}: {labels} ({arg_time:.2f} seconds)",
+                run=run_ind + 1, argument=i + 1, labels=labels, seconds=round(arg_time, 3))
+    write_checkpoint(checkpoint_file, run_ind, i, labels)
+    if REUSE_NEAR_DUPLICATES:
+        scored[(run_ind, i)] = labels
+    time.sleep(0.5)  # optional cooldown
+    return labels
+
+
+# An argument needs more samples until its first MIN_AGREE_RUNS samples agree on all four
+# dimensions, or until it reaches MAX_SAMPLES_PER_ARGUMENT
+def needs_more_samples(samples):
+    if len(samples) < MIN_AGREE_RUNS:
+        return True
+    if len(samples) >= MAX_SAMPLES_PER_ARGUMENT:
+        return False
+    first = samples[:MIN_AGREE_RUNS]
+    if any(s is None for s in first):
+        return True
+    return any(len({str(s[dim]) for s in first}) > 1 for dim in expected_dims)
+
+
+# Adaptive mode: runs are scheduled per argument instead of per pass. Each pass samples every
+# argument that still needs samples, so arguments that agree early stop after MIN_AGREE_RUNS and
+# the rest of the N_RUNS * len(arguments) budget goes to the ones that disagree
+def run_adaptive():
+    budget = N_RUNS * len(arguments)
+    samples = [[] for _ in arguments]
+    used = 0
+    pending = list(range(len(arguments)))
+    pass_ind = 0
+
+    while pending and used < budget and not stop_requested(checkpoint_path):
+        logger.info(f"\n--- ADAPTIVE PASS {pass_ind + 1} ({len(pending)} arguments, {budget - used} samples left) ---",
+                    run=pass_ind + 1)
+        for i in pending:
+            if used >= budget or stop_requested(checkpoint_path):
+                break
+            samples[i].append(score_argument(i, arguments[i], len(samples[i])))
+            used += 1
+        pending = [i for i in range(len(arguments)) if needs_more_samples(samples[i])]
+        pass_ind += 1
+
+    # back to the all_runs layout, arguments with fewer samples are padded with None
+    n_runs = max((len(s) for s in samples), default=0)
+    all_runs = [[s[r] if r < len(s) else None for s in samples] for r in range(n_runs)]
+    return all_runs, [len(s) for s in samples]
+
+
+# Soft-label mode: a single temperature 0 pass, the labels come from the generated JSON and
+# P(label) per dimension from the logprobs of the token where each value starts (soft_labels.py)
+def run_soft_labels():
+    from soft_labels import soft_labels
+    from context_window import truncation_record
+    schema_name = version_schemas[version]
+    labels_run, probabilities = [], []
 
     for i, arg in enumerate(arguments):
-        retries = 0
-        success = False
-
-        while retries < MAX_RETRIES and not success:
-            arg_start = time.time()
-            prompt = build_prompt(arg)
-            response = query_model(prompt)
-            labels = extract_labels(response)
-
-            if labels and all(dim in labels for dim in ["cogency", "effectiveness", "reasonableness", "overall"]):
-                run.append(labels)
-                success = True
-            else:
-                retries += 1
-                local_errors += 1
-                error_counter[f"arg_{i+1}_retry_{retries}"] += 1
-                print(f"Retry {retries} for argument {i+1} due to invalid response.")
-                time.sleep(1)
-
-        if not success:
-            print(f"Failed to process argument {i+1} after {MAX_RETRIES} retries. Skipping.")
-            run.append(None)  # o gunmen marcador tipo 'None'
+        if stop_requested(checkpoint_path):
+            break
+        if prescreened[i] is not None:
+            write_checkpoint(checkpoint_file, 0, i, prescreened[i], source="prescreen")
+            labels_run.append(prescreened[i])
+            probabilities.append(None)
+            continue
+
+        arg_start = time.time()
+        labels, probs = None, None
+        # one pass per argument: a long argument is sent as the first piece of its plan (the head + tail cut,
+        # or only the first chunk with the chunk policy)
+        options = {"temperature": 0}
+        truncation = None
+        if context_plans:
+            plan = context_plans[i]
+            arg = plan["pieces"][0]
+            options["num_ctx"] = plan["num_ctx"]
+            truncation = truncation_record(plan)
+            if truncation is not None and plan["policy"] == "chunk":
+                truncation["scored_chunks"] = 1
+        for retry in range(MAX_RETRIES):
+            try:
+                generation = backend.generate_logprobs(build_prompt(arg, few_shots[i] if few_shots else None),
+                                                       options, top_logprobs=TOP_LOGPROBS)
+            except (BackendError, requests.exceptions.RequestException) as e:
+                logger.error(f"Request failed: {e}")
+                generation = None
+            if archive is not None and generation is not None:
+                archive.write(0, i, generation["response"], attempt=retry, model=backend.model, version=version)
+            labels = extract_labels(generation["response"]) if generation else None
+            if labels is not None:
+                probs = soft_labels(generation, schema_name)
+                break
+            logger.warning(f"Retry {retry + 1} for argument {i+1} due to invalid response.",
+                           argument=i + 1, retry=retry + 1)
+            time.sleep(1)
+        else:
+            logger.error(f"Failed to process argument {i+1} after {MAX_RETRIES} retries. Skipping.", argument=i + 1)
+        if labels is not None and truncation is not None:
+            labels = {**labels, "truncation": truncation}
 
-        print(f"Argument {i + 1}:\n{arg}\nResponse: {run[-1]}\n")
         arg_time = time.time() - arg_start
-        print(f"Time for argument {i + 1}: {arg_time:.2f} seconds")
-        time.sleep(0.5)  # optional cooldown
+        logger.info(f"Argument {i + 1}: {labels} ({arg_time:.2f} seconds)",
+                    argument=i + 1, labels=labels, probabilities=probs, seconds=round(arg_time, 3))
+        write_checkpoint(checkpoint_file, 0, i, labels, probabilities=probs)
+        labels_run.append(labels)
+        probabilities.append(probs)
+    return [labels_run], probabilities
+
+
+# One run in batches of BATCH_SIZE: the arguments the LLM has to score go out K per request,
+# then the pre-screened and near-duplicate ones are filled in by score_argument.
+# Returns the run and, when the evaluator stopped it, the number of arguments scored (else None)
+def run_batched(run_ind):
+    from batched_prompts import score_batched
+    to_score = [i for i in range(len(arguments))
+                if prescreened[i] is None and (not REUSE_NEAR_DUPLICATES or representative[i] == i)]
+
+    # raw responses are archived under the campaign index of the argument, not its position in to_score
+    def archive_response(position, text, attempt, **fields):
+        archive.write(run_ind, to_score[position], text, attempt=attempt, model=backend.model, version=version, **fields)
+
+    labels, stats = score_batched(backend, [arguments[i] for i in to_score], BATCH_SIZE, build_batch_prompt,
+                                  build_prompt, extract_labels, logger,
+                                  shots=[few_shots[i] for i in to_score] if few_shots else None,
+                                  should_stop=lambda: stop_requested(checkpoint_path),
+                                  on_response=archive_response if archive is not None else None)
+    run = [None] * len(arguments)
+    for i, item in zip(to_score[:stats["scored"]], labels):
+        run[i] = item
+        write_checkpoint(checkpoint_file, run_ind, i, item)
+        scored[(run_ind, i)] = item
+    logger.info(f"{stats['requests']} requests for {stats['scored']} arguments, {stats['fallback']} re-queried alone",
+                run=run_ind + 1, **stats)
+    if stats["scored"] < len(to_score):
+        return run, stats["scored"]
+    batched = set(to_score)
+    for i in range(len(arguments)):
+        if i not in batched:
+            run[i] = score_argument(i, arguments[i], run_ind)
+    return run, None
+
+
+# One campaign (every run of every argument) with the model of session. next_session, if any, is
+# loaded in the background during the last run so the next campaign of a sweep starts warm
+def run_campaign(version_number, session, next_session=None):
+    global checkpoint_path, checkpoint_file, archive, local_errors
+    tag = f"{session.model.replace(':', '_')}_{date}" if SWEEP_MODELS else date
+
+    os.makedirs(LOG_DIR, exist_ok=True)
+    run_logger = Logger(os.path.join(LOG_DIR, f"model_run_{tag}.log"), level=LOG_LEVEL,
+                        records_filename=os.path.join(LOG_DIR, f"model_run_{tag}.jsonl.gz"))
+    configure(version_number, run_logger, session)
+    session.open()
+    logger.info(f"Model {session.model} loaded in {session.stats['load_seconds']:.2f} s",
+                model=session.model, load_seconds=round(session.stats["load_seconds"], 3))
+
+    # one JSON line per (run, argument) result, followed by streaming_evaluation.py
+    checkpoint_path = os.path.join(CHECKPOINT_DIR, f"checkpoint_{tag}.jsonl")
+    checkpoint_file = open_checkpoint(checkpoint_path)
+    logger.info(f"Split {SPLIT_ID}: {len(arguments)} test arguments", split=SPLIT_ID)
+    if ARCHIVE_RESPONSES:
+        from response_archive import ResponseArchive
+        archive = ResponseArchive(tag, **split_meta(), prompt_version=f"v{version_number}")
+
+    # the archive and the checkpoint are closed even when a campaign fails, the last block of raw
+    # responses would be lost otherwise
+    try:
+        scored.clear()
+        error_counter.clear()
+        local_errors = 0
+        prepare_arguments()
+
+        all_runs = []
+        if SOFT_LABELS:
+            if next_session:
+                next_session.prewarm()
+            all_runs, probabilities = run_soft_labels()
+        elif ADAPTIVE:
+            if next_session:
+                next_session.prewarm()
+            all_runs, samples_per_argument = run_adaptive()
+            logger.info(f"Adaptive sampling used {sum(samples_per_argument)} of {N_RUNS * len(arguments)} samples")
+        else:
+            if BATCH_SIZE > 1 and context_plans:
+                logger.warning("BATCH_SIZE > 1 sends whole arguments with the server num_ctx, the context plan "
+                               "only applies to the arguments scored one by one")
+            for run_ind in range(N_RUNS):
+                run_start = time.time()
+                logger.info(f"\n--- RUN {run_ind + 1} ---", run=run_ind + 1)
+                if next_session and run_ind == N_RUNS - 1:
+                    next_session.prewarm()
+                run = []
+                stopped_at = None
+                local_errors = 0
+
+                if BATCH_SIZE > 1:
+                    run, stopped_at = run_batched(run_ind)
+                else:
+                    # arguments grouped by num_ctx, so the server reloads the model at most once per bucket
+                    order = range(len(arguments))
+                    if context_plans:
+                        order = sorted(order, key=lambda i: context_plans[i]["num_ctx"])
+                    run = [None] * len(arguments)
+                    for n_done, i in enumerate(order):
+                        if stop_requested(checkpoint_path):
+                            stopped_at = n_done
+                            break
+                        run[i] = score_argument(i, arguments[i], run_ind)
+
+                # an incomplete run would be padded with None and counted as invalid predictions by the
+                # evaluators, it is only kept when it is the first one (its results stay in the checkpoint),
+                # cut at the first argument it did not score, like the short runs of model_1by1.py
+                if stopped_at is not None and all_runs:
+                    logger.warning(f"Dropping run {run_ind + 1}, stopped after {stopped_at} of {len(arguments)} arguments",
+                                   run=run_ind + 1, scored=stopped_at)
+                else:
+                    if stopped_at is not None:
+                        run = run[:next((i for i, item in enumerate(run) if item is None), len(run))]
+                    all_runs.append(run)
+                logger.info(f"\n--- Run {run_ind + 1} completed in {time.time() - run_start:.2f} seconds, "
+                            f"{local_errors} invalid responses ---", run=run_ind + 1, local_errors=local_errors)
+                if stop_requested(checkpoint_path):
+                    logger.warning("Stop requested by the evaluator, ending the runs early.")
+                    break
+    finally:
+        checkpoint_file.close()
+        if archive is not None:
+            archive.close()
+            archive = None
+
+    # split, model and prompt version, read by the evaluators and results_warehouse.py
+    meta = {**split_meta(), "model": session.model, "prompt_version": f"v{version_number}"}
+    output_filename = f"model_responses_{tag}.json"
+    with open(output_filename, "w") as f:
+        if SOFT_LABELS:
+            json.dump({**meta, "mode": "soft", "all_runs": all_runs, "probabilities": probabilities}, f, indent=2)
+        elif ADAPTIVE:
+            json.dump({
+                **meta,
+                "mode": "adaptive",
+                "min_agree_runs": MIN_AGREE_RUNS,
+                "budget": N_RUNS * len(arguments),
+                "samples_per_argument": samples_per_argument,
+                "all_runs": all_runs,
+            }, f, indent=2)
+        else:
+            json.dump({**meta, "all_runs": all_runs}, f, indent=2)
+
+    logger.info(f"\n--- SAVED RESPONSES: {output_filename} ---", output=output_filename)
+    session.close()
+    log_session_report(session, logger)
+    logger.close()
+
+
+def main():
+    # --- Selector desde línea de comandos o input ---
+    print("\nSelect version of prompt (1 to 5):")
+    version_number = int(input("Enter version number: "))
+    print(f"\n✅ Using prompt version {version_number}...\n")
 
-    all_runs.append(run)
+    sessions = [ModelSession(get_backend(BACKEND, name, API_URL)) for name in SWEEP_MODELS or [MODEL_NAME]]
+    for k, session in enumerate(sessions):
+        try:
+            run_campaign(version_number, session, sessions[k + 1] if k + 1 < len(sessions) else None)
+        finally:
+            session.close()
 
-output_filename = f"model_responses_{date}.json"
-with open(output_filename, "w") as f:
-    json.dump(all_runs, f, indent=2)
 
-print(f"\n--- SAVED RESPONSES: {output_filename} ---")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
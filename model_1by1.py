@@ -1,22 +1,60 @@
 import datetime
 import time
-from dataset_division import test_data
+from dataset_division import SPLIT_ID, split_meta, test_data
 import requests
 from collections import Counter
 import re
 import json
+import os
+import atexit
+from Logger import Logger
+from backends import get_backend, BackendError, HedgedBackend
+from model_session import ModelSession, log_session_report
+from checkpoint import CHECKPOINT_DIR, open_checkpoint, write_checkpoint, stop_requested
+from response_archive import ResponseArchive
 
 
 #date in YYYY-MM-DD-HH-MM format
 date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
 global_start = time.time() #total time
 
-API_URL = "http://localhost:11434/api/generate"
+BACKEND = "ollama"  # "ollama", "openai" (llama.cpp server, vLLM) or "local" (in-process, MODEL_NAME is a model path)
+API_URL = None  # None = the default of BACKEND (ollama http://localhost:11434, openai http://localhost:8080/v1)
 MODEL_NAME = "qwen3:8b"
 N_RUNS = 3
+HEDGE_URLS = []  # other instances serving MODEL_NAME; with any, slow requests get a duplicate on the next one
+HEDGE_PERCENTILE = 95  # a request still running after this percentile of the recent latencies is hedged
+LOG_LEVEL = "INFO"  # "DEBUG" also logs the argument text and the raw response of every argument
+LOG_DIR = "logs"
+ARCHIVE_RESPONSES = False  # every raw response goes to response_archive/ for re-parsing without the LLM
 
 arguments = [entry["text"] for entry in test_data]
 
+os.makedirs(LOG_DIR, exist_ok=True)
+logger = Logger(os.path.join(LOG_DIR, f"model_run_{date}.log"), level=LOG_LEVEL,
+                records_filename=os.path.join(LOG_DIR, f"model_run_{date}.jsonl.gz"))
+
+# one JSON line per (run, argument) result, followed by streaming_evaluation.py
+checkpoint_path = os.path.join(CHECKPOINT_DIR, f"checkpoint_{date}.jsonl")
+checkpoint_file = open_checkpoint(checkpoint_path)
+logger.info(f"Split {SPLIT_ID}: {len(arguments)} test arguments", split=SPLIT_ID)
+
+archive = ResponseArchive(date, **split_meta(), prompt_version="1by1") if ARCHIVE_RESPONSES else None
+if archive is not None:
+    atexit.register(archive.close)
+
+backend = get_backend(BACKEND, MODEL_NAME, API_URL)
+if HEDGE_URLS:
+    backend = HedgedBackend([backend] + [get_backend(BACKEND, MODEL_NAME, url) for url in HEDGE_URLS], HEDGE_PERCENTILE)
+
+# loaded before the first argument, pinned with keep_alive for the whole campaign and unloaded on exit
+session = ModelSession(backend)
+atexit.register(session.close)
+session.open()
+logger.info(f"Model {MODEL_NAME} loaded in {session.stats['load_seconds']:.2f} s",
+            model=MODEL_NAME, load_seconds=round(session.stats["load_seconds"], 3))
+backend = session
+
 
 dimensions_prompts = {
     "cogency": """
@@ -87,27 +125,21 @@ def build_prompt_by_dimension(argument, dimension):
 # This function sends the prompt to the API and returns the response it also measures the response time
 def query_model(prompt):
     try:
-        res = requests.post(API_URL, json={
-            "model": MODEL_NAME,
-            "prompt": prompt,
-            "stream": False
-        })
-
-        if res.status_code != 200:
-            print("Error from API:", res.text)
-            return None
+        return backend.generate(prompt)
+
+    except BackendError as e:
+        logger.error(f"Error from API: {e}")
+        return None
 
-        return res.json().get("response", "{}")
-    
     except requests.exceptions.RequestException as e:
-        print("Request failed:", e)
+        logger.error(f"Request failed: {e}")
         return None
     
 def extract_labels(text):
     try:
         match = re.search(r'\{.*?\}', text, re.DOTALL)
         if not match:
-            print("No JSON found in response:", text)
+            logger.warning(f"No JSON found in response: {text}", response=text)
             return None
         
         parsed = json.loads(match.group())
@@ -120,7 +152,7 @@ def extract_labels(text):
             return None
 
     except Exception as e:
-        print("Error parsing response:", text)
+        logger.warning(f"Error parsing response: {text}", response=text)
         return None
 
     
@@ -129,11 +161,13 @@ error_counter = Counter()
 all_runs = []
 for run_ind in range(N_RUNS):
     run_start = time.time()
-    print(f"\n--- RUN {run_ind + 1} ---")
+    logger.info(f"\n--- RUN {run_ind + 1} ---", run=run_ind + 1)
     run = []
     local_errors = 0
 
     for i, arg in enumerate(arguments):
+        if stop_requested(checkpoint_path):
+            break
         arg_start = time.time()
         labels = {}
 
@@ -144,6 +178,8 @@ for run_ind in range(N_RUNS):
             while retries < MAX_RETRIES and not dim_success:
                 prompt = build_prompt_by_dimension(arg, dimension)
                 response = query_model(prompt)
+                if archive is not None and response is not None:
+                    archive.write(run_ind, i, response, dimension=dimension, attempt=retries, model=MODEL_NAME)
                 dim_labels = extract_labels(response)
 
                 if dim_labels and dimension in dim_labels:
@@ -153,27 +189,53 @@ for run_ind in range(N_RUNS):
                     retries += 1
                     local_errors += 1
                     error_counter[f"arg_{i+1}_{dimension}_retry_{retries}"] += 1
-                    print(f"Retry {retries} for argument {i+1}, dimension {dimension} due to invalid response.")
+                    logger.warning(f"Retry {retries} for argument {i+1}, dimension {dimension} due to invalid response.",
+                                   run=run_ind + 1, argument=i + 1, dimension=dimension, retry=retries)
                     time.sleep(1)
 
             if not dim_success:
-                print(f"Failed to process argument {i+1}, dimension {dimension} after {MAX_RETRIES} retries. Skipping.")
+                logger.error(f"Failed to process argument {i+1}, dimension {dimension} after {MAX_RETRIES} retries. Skipping.",
+                             run=run_ind + 1, argument=i + 1, dimension=dimension)
                 labels[dimension] = None  # marcador tipo 'None'
 
         run.append(labels)
 
-        print(f"\nArgument {i + 1}:\n{arg}\nResponse: {labels}")
         arg_time = time.time() - arg_start
-        print(f"Time for argument {i+1}: {arg_time:.3f} seconds")
+        logger.debug(f"\nArgument {i + 1}:\n{arg}", run=run_ind + 1, argument=i + 1)
+        logger.info(f"Argument {i + 1}: {labels} ({arg_time:.3f} seconds)",
+                    run=run_ind + 1, argument=i + 1, labels=labels, seconds=round(arg_time, 3))
+        write_checkpoint(checkpoint_file, run_ind, i, labels)
         time.sleep(0.5)
 
-    all_runs.append(run)
-    print(f"\n--- Run {run_ind + 1} completed in {time.time() - run_start:.2f} seconds ---")
+    # an incomplete run would be padded with None and counted as invalid predictions by the
+    # evaluators, it is only kept when it is the first one (its results stay in the checkpoint)
+    if len(run) < len(arguments) and all_runs:
+        logger.warning(f"Dropping run {run_ind + 1}, stopped after {len(run)} of {len(arguments)} arguments",
+                       run=run_ind + 1, scored=len(run))
+    else:
+        all_runs.append(run)
+    logger.info(f"\n--- Run {run_ind + 1} completed in {time.time() - run_start:.2f} seconds ---", run=run_ind + 1)
+    if stop_requested(checkpoint_path):
+        logger.warning("Stop requested by the evaluator, ending the runs early.")
+        break
+
+checkpoint_file.close()
+if archive is not None:
+    archive.close()
 
 output_filename = f"model_responses_{date}.json"
 with open(output_filename, "w") as f:
-    json.dump(all_runs, f, indent=2)
-
-print(f"\n--- SAVED RESPONSES IN: {output_filename} ---")
-print(f"Total time: {time.time() - global_start:.2f} seconds")
-print(f"Total local errors: {local_errors}")
\ No newline at end of file
+    json.dump({**split_meta(), "model": MODEL_NAME, "prompt_version": "1by1", "all_runs": all_runs}, f, indent=2)
+
+logger.info(f"\n--- SAVED RESPONSES IN: {output_filename} ---", output=output_filename)
+logger.info(f"Total time: {time.time() - global_start:.2f} seconds")
+logger.info(f"Total local errors: {local_errors}")
+hedging = session.backend.hedge_report() if HEDGE_URLS else None
+if hedging and hedging["requests"]:
+    logger.info(f"Hedged {hedging['hedged']} of {hedging['requests']} requests ({hedging['hedge_rate']:.1%}), "
+                f"the duplicate won {hedging['hedge_wins']} times, {hedging['failover']} failed requests retried "
+                f"on the next instance; latency p50 {hedging['p50']:.2f} s, "
+                f"p95 {hedging['p95']:.2f} s, p99 {hedging['p99']:.2f} s", **hedging)
+session.close()
+log_session_report(session, logger)
+logger.close()
\ No newline at end of file
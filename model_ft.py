@@ -1,23 +1,60 @@
 import datetime
 import time
-from dataset_division import test_data
+from dataset_division import SPLIT_ID, split_meta, test_data
 import requests
 from collections import Counter
 import re
 import json
+import os
+import atexit
+from Logger import Logger
+from backends import get_backend, BackendError
+from model_session import ModelSession, log_session_report
+from checkpoint import CHECKPOINT_DIR, open_checkpoint, write_checkpoint, stop_requested
+from response_archive import ResponseArchive
 
 # Fecha para el nombre de archivo
 date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
 global_start = time.time()
 
-API_URL = "http://localhost:11434/api/generate"
+BACKEND = "ollama"  # "ollama", "openai" (llama.cpp server, vLLM) or "local" (in-process, MODEL_NAME is a model path)
+API_URL = None  # None = the default of BACKEND (ollama http://localhost:11434, openai http://localhost:8080/v1)
 MODEL_NAME = "gemma2:9b"
 N_RUNS = 5
 MAX_RETRIES = 5
 TIMEOUT = 30
 NUM_PREDICT = 100
+FEW_SHOT_K = 0  # 0 = the hard-coded examples, k > 0 = the k most similar training arguments
+CONTEXT_WINDOW = False  # num_ctx per prompt from its length, long arguments are cut head + tail (context_window.py)
+BATCH_SIZE = 1  # K > 1 scores K arguments per request after a single header (batched_prompts.py)
+LOG_LEVEL = "INFO"  # "DEBUG" also logs the argument text and the raw response of every argument
+LOG_DIR = "logs"
+ARCHIVE_RESPONSES = False  # every raw response goes to response_archive/ for re-parsing without the LLM
 arguments = [entry["text"] for entry in test_data]
 
+os.makedirs(LOG_DIR, exist_ok=True)
+logger = Logger(os.path.join(LOG_DIR, f"model_run_{date}.log"), level=LOG_LEVEL,
+                records_filename=os.path.join(LOG_DIR, f"model_run_{date}.jsonl.gz"))
+
+# one JSON line per (run, argument) result, followed by streaming_evaluation.py
+checkpoint_path = os.path.join(CHECKPOINT_DIR, f"checkpoint_{date}.jsonl")
+checkpoint_file = open_checkpoint(checkpoint_path)
+logger.info(f"Split {SPLIT_ID}: {len(arguments)} test arguments", split=SPLIT_ID)
+
+archive = ResponseArchive(date, **split_meta(), prompt_version="ft") if ARCHIVE_RESPONSES else None
+if archive is not None:
+    atexit.register(archive.close)
+
+backend = get_backend(BACKEND, MODEL_NAME, API_URL, timeout=TIMEOUT)
+
+# loaded before the first argument, pinned with keep_alive for the whole campaign and unloaded on exit
+session = ModelSession(backend)
+atexit.register(session.close)
+session.open()
+logger.info(f"Model {MODEL_NAME} loaded in {session.stats['load_seconds']:.2f} s",
+            model=MODEL_NAME, load_seconds=round(session.stats["load_seconds"], 3))
+backend = session
+
 # Prompt idéntico al usado en el fine-tuning
 prompt_intro = """
 ###ROLE### You are an Argument Annotator AI.
@@ -120,34 +157,41 @@ EXAMPLE OUTPUT:
 
 ###ARGUMENT###
 """
-def build_prompt(argument):
-    return f"{prompt_intro}\n{example}\n{argument}\n###OUTPUT###"
-
-def query_model(prompt):
+# few-shot retrieval: examples picked per argument from the training set
+few_shots = None
+if FEW_SHOT_K > 0:
+    from few_shot_retrieval import FewShotRetriever
+    few_shots = FewShotRetriever("binary_good_bad", FEW_SHOT_K).examples(arguments)
+
+# shots replaces the hard-coded examples, the expected output block and the ###ARGUMENT### header are kept
+def build_prompt(argument, shots=None):
+    selected_example = example.split("###EXAMPLE###")[0] + shots + "\n###ARGUMENT###" if shots else example
+    return f"{prompt_intro}\n{selected_example}\n{argument}\n###OUTPUT###"
+
+# K arguments after the same header, without the trailing ###ARGUMENT### marker of the example
+def build_batch_prompt(batch, shots=None):
+    from batched_prompts import batch_prompt
+    selected_example = example.split("###EXAMPLE###")[0] + shots if shots else example
+    header = f"{prompt_intro}\n{selected_example}".rstrip().removesuffix("###ARGUMENT###")
+    return batch_prompt(header, batch, "###OUTPUT###")
+
+def query_model(prompt, num_ctx=None):
+    options = {"num_predict": NUM_PREDICT}
+    if num_ctx:
+        options["num_ctx"] = num_ctx
     try:
-        res = requests.post(
-            API_URL,
-            json={
-                "model": MODEL_NAME,
-                "prompt": prompt,
-                "num_predict": NUM_PREDICT,
-                "stream": False
-            },
-            timeout=TIMEOUT
-        )
-
-        if res.status_code != 200:
-            print("Error from API:", res.text)
-            return None
+        return backend.generate(prompt, options=options)
 
-        return res.json().get("response", "{}")
+    except BackendError as e:
+        logger.error(f"Error from API: {e}")
+        return None
 
     except requests.exceptions.Timeout:
-        print("Request timed out after", TIMEOUT, "seconds.")
+        logger.error(f"Request timed out after {TIMEOUT} seconds.")
         return None
 
     except requests.exceptions.RequestException as e:
-        print("Request failed:", e)
+        logger.error(f"Request failed: {e}")
         return None
 
 
@@ -155,7 +199,8 @@ def extract_labels(text):
     try:
         match = re.search(r'(\{{1,2})(.*?)(\}{1,2})', text, re.DOTALL)
         if not match:
-            print("No JSON-like object found in response.")
+            logger.warning("No JSON-like object found in response.")
+            logger.debug(f"Raw response: {text}", response=text)
             return None
         
         json_text = match.group(0)
@@ -172,51 +217,103 @@ def extract_labels(text):
             return None
 
     except Exception as e:
-        print("Error parsing response:", text)
+        logger.warning(f"Error parsing response: {text}", response=text)
         return None
 
+# num_ctx and head + tail truncation per argument; the chunk policy needs aggregation and is only in model.py
+context_plans = None
+if CONTEXT_WINDOW:
+    from context_window import ContextPlanner, truncation_record, plan_summary
+    planner = ContextPlanner(build_prompt, NUM_PREDICT, policy="head_tail")
+    context_plans = [planner.plan(arg, few_shots[i] if few_shots else None) for i, arg in enumerate(arguments)]
+    summary = plan_summary(context_plans)
+    logger.info(f"Context plan: arguments per num_ctx {summary['num_ctx']}, per policy {summary['policy']}", **summary)
+    if BATCH_SIZE > 1:
+        logger.warning("BATCH_SIZE > 1 sends whole arguments with the server num_ctx, the context plan is not applied")
+
 error_counter = Counter()
 all_runs = []
 
 for run_ind in range(N_RUNS):
     run_start = time.time()
-    print(f"\n--- RUN {run_ind + 1} ---")
+    logger.info(f"\n--- RUN {run_ind + 1} ---", run=run_ind + 1)
     run = []
     local_errors = 0
 
-    for i, arg in enumerate(arguments):
-        retries = 0
-        success = False
-
-        while retries < MAX_RETRIES and not success:
-            arg_start = time.time()
-            prompt = build_prompt(arg)
-            response = query_model(prompt)
-            labels = extract_labels(response)
-
-            if labels and all(dim in labels for dim in ["cogency", "effectiveness", "reasonableness", "overall"]):
-                run.append(labels)
-                success = True
-            else:
-                retries += 1
-                local_errors += 1
-                error_counter[f"arg_{i+1}_retry_{retries}"] += 1
-                print(f"Retry {retries} for argument {i+1} due to invalid response.")
-                time.sleep(1)
-
-        if not success:
-            print(f"Failed to process argument {i+1} after {MAX_RETRIES} retries. Skipping.")
-            run.append(None)
-
-        print(f"Argument {i + 1}:\n{arg}\nResponse: {run[-1]}\n")
-        arg_time = time.time() - arg_start
-        print(f"Time for argument {i + 1}: {arg_time:.2f} seconds")
-        time.sleep(0.5)
-
-    all_runs.append(run)
+    if BATCH_SIZE > 1:
+        from batched_prompts import score_batched
+        run, stats = score_batched(backend, arguments, BATCH_SIZE, build_batch_prompt, build_prompt, extract_labels,
+                                   logger, {"num_predict": NUM_PREDICT}, few_shots,
+                                   should_stop=lambda: stop_requested(checkpoint_path),
+                                   on_response=(lambda i, text, attempt, **fields: archive.write(
+                                       run_ind, i, text, attempt=attempt, model=MODEL_NAME, **fields))
+                                   if archive is not None else None)
+        run = run[:stats["scored"]]
+        for i, labels in enumerate(run):
+            write_checkpoint(checkpoint_file, run_ind, i, labels)
+        logger.info(f"{stats['requests']} requests for {stats['scored']} arguments, {stats['fallback']} re-queried alone",
+                    run=run_ind + 1, **stats)
+    else:
+        for i, arg in enumerate(arguments):
+            if stop_requested(checkpoint_path):
+                break
+            retries = 0
+            success = False
+            plan = context_plans[i] if context_plans else None
+
+            while retries < MAX_RETRIES and not success:
+                arg_start = time.time()
+                prompt = build_prompt(plan["pieces"][0] if plan else arg, few_shots[i] if few_shots else None)
+                response = query_model(prompt, plan["num_ctx"] if plan else None)
+                if archive is not None and response is not None:
+                    archive.write(run_ind, i, response, attempt=retries, model=MODEL_NAME)
+                labels = extract_labels(response)
+
+                if labels and all(dim in labels for dim in ["cogency", "effectiveness", "reasonableness", "overall"]):
+                    run.append(labels)
+                    success = True
+                else:
+                    retries += 1
+                    local_errors += 1
+                    error_counter[f"arg_{i+1}_retry_{retries}"] += 1
+                    logger.warning(f"Retry {retries} for argument {i+1} due to invalid response.",
+                                   run=run_ind + 1, argument=i + 1, retry=retries)
+                    time.sleep(1)
+
+            if not success:
+                logger.error(f"Failed to process argument {i+1} after {MAX_RETRIES} retries. Skipping.",
+                             run=run_ind + 1, argument=i + 1)
+                run.append(None)
+            elif plan and truncation_record(plan):
+                run[-1] = {**run[-1], "truncation": truncation_record(plan)}
+
+            arg_time = time.time() - arg_start
+            logger.debug(f"Argument {i + 1}:\n{arg}\n", run=run_ind + 1, argument=i + 1)
+            logger.info(f"Argument {i + 1}: {run[-1]} ({arg_time:.2f} seconds)",
+                        run=run_ind + 1, argument=i + 1, labels=run[-1], seconds=round(arg_time, 3))
+            write_checkpoint(checkpoint_file, run_ind, i, run[-1])
+            time.sleep(0.5)
+
+    # an incomplete run would be padded with None and counted as invalid predictions by the
+    # evaluators, it is only kept when it is the first one (its results stay in the checkpoint)
+    if len(run) < len(arguments) and all_runs:
+        logger.warning(f"Dropping run {run_ind + 1}, stopped after {len(run)} of {len(arguments)} arguments",
+                       run=run_ind + 1, scored=len(run))
+    else:
+        all_runs.append(run)
+    if stop_requested(checkpoint_path):
+        logger.warning("Stop requested by the evaluator, ending the runs early.")
+        break
+
+checkpoint_file.close()
+if archive is not None:
+    archive.close()
 
 output_filename = f"model_responses_{date}.json"
 with open(output_filename, "w") as f:
-    json.dump(all_runs, f, indent=2)
+    json.dump({**split_meta(), "model": MODEL_NAME, "prompt_version": "ft", "all_runs": all_runs}, f, indent=2)
 
-print(f"\n--- SAVED RESPONSES: {output_filename} ---")
+logger.info(f"\n--- SAVED RESPONSES: {output_filename} ---", output=output_filename)
+session.close()
+log_session_report(session, logger)
+logger.close()
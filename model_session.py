@@ -0,0 +1,146 @@
+import threading
+import time
+import requests
+from backends import BackendError, ollama_logprobs
+
+KEEP_ALIVE = -1  # Ollama keep_alive while the session is open, negative = never unload
+RELOAD_THRESHOLD = 0.5  # seconds of load_duration in a response that count as a reload of the model
+WARMUP_OPTIONS = {"num_predict": 1}  # backends without an explicit load get one tiny generation instead
+LOAD_TIMEOUT = 600  # seconds allowed for loading, the request timeout of the runners is meant for inference
+
+
+# Wraps a backend for one campaign: loads the model before the first argument (so the load time is not
+# charged to it), pins it with keep_alive on every request, counts the load time apart from the inference
+# time and unloads the model on close. Ollama only for pinning and unloading: the other backends are
+# warmed up with one short generation and left as they are. Works as a backend in place of the wrapped one
+class ModelSession:
+    def __init__(self, backend, keep_alive=KEEP_ALIVE):
+        self.backend = backend
+        self.model = backend.model
+        self.name = backend.name
+        self.targets = getattr(backend, "backends", [backend])  # every endpoint of a HedgedBackend
+        self.ollama = all(target.name == "ollama" for target in self.targets)
+        self.keep_alive = keep_alive
+        self.lock = threading.Lock()
+        self.warming = None
+        self.loaded = False
+        self.closed = False
+        self.stats = {"load_seconds": 0.0, "requests": 0, "inference_seconds": 0.0, "reloads": 0, "reload_seconds": 0.0}
+
+    # Loads the model on every endpoint and returns the seconds it took. With Ollama an empty prompt
+    # only loads the model
+    def load(self):
+        with self.lock:
+            if self.loaded:
+                return self.stats["load_seconds"]
+            start = time.time()
+            for target in self.targets:
+                timeout = getattr(target, "timeout", None)
+                target.timeout = LOAD_TIMEOUT
+                try:
+                    if self.ollama:
+                        target.generate_raw("", keep_alive=self.keep_alive)
+                    else:
+                        target.generate_raw("Hello", WARMUP_OPTIONS)
+                finally:
+                    target.timeout = timeout
+            self.stats["load_seconds"] = time.time() - start
+            self.loaded = True
+            return self.stats["load_seconds"]
+
+    def _load_quietly(self):
+        try:
+            self.load()
+        except (BackendError, requests.exceptions.RequestException):
+            pass  # the campaign loads it again when it starts
+
+    # Starts loading in the background, e.g. the next model of a sweep while the current one finishes
+    def prewarm(self):
+        if self.warming is None and not self.loaded:
+            self.warming = threading.Thread(target=self._load_quietly, daemon=True)
+            self.warming.start()
+
+    # Waits for a prewarm in progress, or loads now
+    def open(self):
+        if self.warming is not None:
+            self.warming.join()
+        self.load()
+        return self
+
+    # Unloads the model (Ollama keep_alive 0). Safe to call more than once
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if not self.ollama:
+            return
+        for target in self.targets:
+            try:
+                target.generate_raw("", keep_alive=0)
+            except (BackendError, requests.exceptions.RequestException):
+                pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _payload(self, payload):
+        if self.ollama:
+            payload.setdefault("keep_alive", self.keep_alive)
+        return payload
+
+    # Ollama reports the load time of every request in load_duration (nanoseconds): a large one means the
+    # model was unloaded in between and loaded again, it is counted apart from the inference time
+    def _account(self, data, elapsed):
+        load = (data.get("load_duration") or 0) / 1e9
+        with self.lock:
+            self.stats["requests"] += 1
+            self.stats["inference_seconds"] += max(elapsed - load, 0.0)
+            if load > RELOAD_THRESHOLD:
+                self.stats["reloads"] += 1
+                self.stats["reload_seconds"] += load
+
+    def generate_raw(self, prompt, options=None, **payload):
+        start = time.time()
+        data = self.backend.generate_raw(prompt, options, **self._payload(payload))
+        self._account(data, time.time() - start)
+        return data
+
+    def generate(self, prompt, options=None, **payload):
+        return self.generate_raw(prompt, options, **payload).get("response", "{}")
+
+    def generate_batch(self, prompts, options=None, **payload):
+        if self.ollama:
+            return [self.generate(prompt, options, **payload) for prompt in prompts]
+        return self.backend.generate_batch(prompts, options, **payload)
+
+    # Ollama endpoints (also behind a HedgedBackend) go through generate_raw, with its keep_alive and accounting
+    def generate_logprobs(self, prompt, options=None, top_logprobs=5):
+        if self.ollama:
+            data = self.generate_raw(prompt, options, logprobs=True, top_logprobs=top_logprobs)
+            return {"response": data.get("response", ""), "logprobs": ollama_logprobs(data)}
+        start = time.time()
+        generation = self.backend.generate_logprobs(prompt, options, top_logprobs)
+        self._account({}, time.time() - start)
+        return generation
+
+    def embed(self, texts, model=None):
+        return self.backend.embed(texts, model)
+
+    def health(self):
+        return self.backend.health()
+
+    def report(self):
+        with self.lock:
+            return {"model": self.model, **self.stats}
+
+
+# One line for the run log: load time, inference time and the reloads seen during the campaign
+def log_session_report(session, logger):
+    report = session.report()
+    mean = report["inference_seconds"] / report["requests"] if report["requests"] else 0.0
+    logger.info(f"Model {report['model']}: loaded in {report['load_seconds']:.2f} s, {report['requests']} requests, "
+                f"{report['inference_seconds']:.1f} s of inference ({mean:.2f} s per request), "
+                f"{report['reloads']} reloads ({report['reload_seconds']:.1f} s)", **report)
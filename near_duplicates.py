@@ -0,0 +1,150 @@
+import os
+import zlib
+import numpy as np
+import pandas as pd
+
+SHINGLE_SIZE = 5  # words per shingle
+NUM_PERM = 128  # MinHash permutations
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows, candidate pairs start around Jaccard 0.7
+SIMILARITY_THRESHOLD = 0.8  # Jaccard similarity of the shingle sets to call two arguments near-duplicates
+SEED = 42
+
+_PRIME = (1 << 31) - 1
+
+
+# Set of hashed word shingles of a text, lowercased and whitespace normalized
+def shingles(text, size=SHINGLE_SIZE):
+    words = str(text).lower().split()
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode("utf-8")) % _PRIME}
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) % _PRIME for i in range(len(words) - size + 1)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+# MinHash signatures (n_texts, num_perm) with the universal hashes (a * x + b) mod 2^31 - 1
+def minhash_signatures(shingle_sets, num_perm=NUM_PERM, seed=SEED):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+    signatures = np.empty((len(shingle_sets), num_perm), dtype=np.uint64)
+    for i, s in enumerate(shingle_sets):
+        x = np.fromiter(s, dtype=np.uint64, count=len(s))
+        signatures[i] = ((x[:, None] * a + b) % _PRIME).min(axis=0)
+    return signatures
+
+
+# Candidate pairs (i, j), i < j, that share at least one LSH band
+def lsh_candidates(signatures, bands=BANDS):
+    rows = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = {}
+        for i, key in enumerate(signatures[:, band * rows:(band + 1) * rows]):
+            buckets.setdefault(key.tobytes(), []).append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+    return pairs
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+# Groups near-identical texts. Returns (representative, pairs): representative[i] is the smallest index
+# of the cluster of text i (i itself when it has no near-duplicate), pairs are the verified (i, j, jaccard)
+def near_duplicate_clusters(texts, threshold=SIMILARITY_THRESHOLD):
+    shingle_sets = [shingles(t) for t in texts]
+    candidates = lsh_candidates(minhash_signatures(shingle_sets))
+
+    parent = list(range(len(texts)))
+    pairs = []
+    for i, j in sorted(candidates):
+        similarity = jaccard(shingle_sets[i], shingle_sets[j])
+        if similarity >= threshold:
+            pairs.append((i, j, similarity))
+            ri, rj = _find(parent, i), _find(parent, j)
+            parent[max(ri, rj)] = min(ri, rj)
+    representative = [_find(parent, i) for i in range(len(texts))]
+    return representative, pairs
+
+
+# How much work duplicates account for: the runner only needs one LLM call per cluster
+def duplicate_report(representative):
+    n = len(representative)
+    sizes = pd.Series(representative).value_counts()
+    n_clusters = len(sizes)
+    return {
+        "n_texts": n,
+        "n_clusters": n_clusters,
+        "n_duplicate_clusters": int((sizes > 1).sum()),
+        "n_texts_in_duplicate_clusters": int(sizes[sizes > 1].sum()),
+        "largest_cluster": int(sizes.max()) if n else 0,
+        "calls_saved": 1 - n_clusters / n if n else 0.0,
+    }
+
+
+def print_duplicate_report(report):
+    print(f"Texts: {report['n_texts']}, clusters: {report['n_clusters']}")
+    print(f"Clusters with near-duplicates: {report['n_duplicate_clusters']} "
+          f"({report['n_texts_in_duplicate_clusters']} texts, largest {report['largest_cluster']})")
+    print(f"LLM calls saved by scoring one representative per cluster: {report['calls_saved']:.2%}")
+
+
+# Near-duplicate pairs that cross the train/val/test sets of a split (dataset_division split ID),
+# e.g. a test argument that is almost a training argument
+# returns a list of dicts with the set and row position of both sides and their similarity
+def split_leakage(split_id=None, threshold=SIMILARITY_THRESHOLD):
+    from dataset_division import SPLIT_ID, split_frames
+    owners, texts = [], []
+    for split, frame in zip(["train", "val", "test"], split_frames(split_id or SPLIT_ID)):
+        split_texts = frame["text"].tolist()
+        owners += [(split, i) for i in range(len(split_texts))]
+        texts += split_texts
+
+    _, pairs = near_duplicate_clusters(texts, threshold)
+    leaks = []
+    for i, j, similarity in pairs:
+        (split_a, row_a), (split_b, row_b) = owners[i], owners[j]
+        if split_a != split_b:
+            leaks.append({"split_a": split_a, "row_a": row_a, "split_b": split_b, "row_b": row_b,
+                          "similarity": similarity})
+    return leaks
+
+
+def print_leakage(leaks):
+    if not leaks:
+        print("No near-duplicates across splits.")
+        return
+    counts = pd.Series([f"{l['split_a']}-{l['split_b']}" for l in leaks]).value_counts()
+    print(f"{len(leaks)} near-duplicate pairs across splits:")
+    for name, count in counts.items():
+        print(f"- {name}: {count}")
+    for l in sorted(leaks, key=lambda l: -l["similarity"])[:20]:
+        print(f"  {l['split_a']}[{l['row_a']}] ~ {l['split_b']}[{l['row_b']}]  jaccard {l['similarity']:.2f}")
+
+
+if __name__ == "__main__":
+    print(f"Near-duplicates: {SHINGLE_SIZE}-word shingles, {NUM_PERM} permutations, {BANDS} bands, "
+          f"Jaccard >= {SIMILARITY_THRESHOLD}")
+
+    if os.path.exists("dataset.csv"):
+        print("\n--- DATASET (dataset.csv) ---")
+        dataset_texts = pd.read_csv("dataset.csv")["text"].tolist()
+        print_duplicate_report(duplicate_report(near_duplicate_clusters(dataset_texts)[0]))
+
+    from dataset_division import SPLIT_ID, test_data
+
+    print(f"\n--- TEST SET OF SPLIT {SPLIT_ID} (what the runners score) ---")
+    test_texts = [entry["text"] for entry in test_data]
+    print_duplicate_report(duplicate_report(near_duplicate_clusters(test_texts)[0]))
+
+    print(f"\n--- TRAIN / VAL / TEST LEAKAGE IN SPLIT {SPLIT_ID} ---")
+    print_leakage(split_leakage())
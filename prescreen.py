@@ -0,0 +1,184 @@
+import datetime
+import os
+import sys
+import contextlib
+import numpy as np
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import make_pipeline
+from Logger import Logger
+from analyze_results_not_binary import dimensions, encode_runs, encode_ground_truth, load_runs
+from aggregate_runs import schema_decoders
+from dataset_division import SPLIT_ID, train_data, val_data
+
+CONFIDENCE_THRESHOLD = 0.9  # an argument skips the LLM when every dimension is at least this confident
+THRESHOLDS = [0.55, 0.6, 0.65, 0.7, 0.8, 0.9, 0.95]  # swept by the cascade report
+CALIBRATION_FOLDS = 5
+LOG_TO_FILE = True
+
+
+# The annotated scores are means of several annotators (2.67, 3.33, ...). binary_good_bad thresholds
+# them directly, the other schemas expect whole scores, so the means are rounded first
+def round_ground_truths(ground_truths, schema_name):
+    if schema_name == "binary_good_bad":
+        return ground_truths
+    return [{dim: int(round(float(labels[dim]))) for dim in dimensions} for labels in ground_truths]
+
+
+# Training (and validation) arguments of the selected split as (texts, label dicts)
+def load_training_data(include_val=True):
+    records = list(train_data) + (list(val_data) if include_val else [])
+    return [r["text"] for r in records], [r["labels"] for r in records]
+
+
+# One calibrated linear text classifier per dimension: TF-IDF word 1-2 grams + logistic regression,
+# with sigmoid calibration so predict_proba can be thresholded
+class PreScreen:
+    def __init__(self, schema_name):
+        self.schema_name = schema_name
+        self.models = {}
+
+    def fit(self, texts, ground_truths):
+        codes = encode_ground_truth(round_ground_truths(ground_truths, self.schema_name), self.schema_name)
+        for d, dim in enumerate(dimensions):
+            valid = codes[:, d] >= 0
+            y = codes[valid, d]
+            if len(np.unique(y)) < 2:
+                raise ValueError(f"Only one class in the training labels of {dim} for schema {self.schema_name}")
+            pipeline = make_pipeline(
+                TfidfVectorizer(ngram_range=(1, 2), min_df=2, sublinear_tf=True),
+                LogisticRegression(max_iter=1000, class_weight="balanced"),
+            )
+            model = CalibratedClassifierCV(pipeline, method="sigmoid", cv=CALIBRATION_FOLDS)
+            model.fit([t for t, v in zip(texts, valid) if v], y)
+            self.models[dim] = model
+        return self
+
+    # Predicted codes and their calibrated probability, two arrays (n_texts, n_dimensions)
+    def predict(self, texts):
+        codes = np.zeros((len(texts), len(dimensions)), dtype=np.int8)
+        confidence = np.zeros((len(texts), len(dimensions)))
+        for d, dim in enumerate(dimensions):
+            model = self.models[dim]
+            proba = model.predict_proba(texts)
+            best = np.argmax(proba, axis=1)
+            codes[:, d] = model.classes_[best]
+            confidence[:, d] = proba[np.arange(len(texts)), best]
+        return codes, confidence
+
+    # Labels in the model response format for the arguments that are confident in every dimension,
+    # None for the ones that still have to go to the LLM
+    def screen(self, texts, threshold=CONFIDENCE_THRESHOLD):
+        codes, confidence = self.predict(texts)
+        confident = (confidence >= threshold).all(axis=1)
+        decoder = schema_decoders[self.schema_name]
+        return [
+            {dim: decoder[int(codes[i, d])] for d, dim in enumerate(dimensions)} if confident[i] else None
+            for i in range(len(texts))
+        ]
+
+
+def train_prescreen(schema_name):
+    texts, ground_truths = load_training_data()
+    return PreScreen(schema_name).fit(texts, ground_truths)
+
+
+# Simulates the cascade on an existing response file: confident arguments take the pre-screen label,
+# the rest keep the LLM labels of every run. No new LLM calls are made.
+# returns one row per threshold with the fraction of LLM calls saved and the accuracy against LLM-only
+def compute_cascade_report(prescreen, texts, all_runs, ground_truths, schema_name, thresholds=THRESHOLDS):
+    llm_codes = encode_runs(all_runs, schema_name)
+    n_args = llm_codes.shape[1]
+    gt = encode_ground_truth(round_ground_truths(ground_truths[:n_args], schema_name), schema_name)
+    pre_codes, confidence = prescreen.predict(texts[:n_args])
+
+    def accuracy(codes):
+        scored = (codes >= 0) & (gt >= 0)
+        return ((codes == gt) & scored).sum(axis=(0, 1)) / np.maximum(scored.sum(axis=(0, 1)), 1)
+
+    llm_accuracy = accuracy(llm_codes)
+    rows = []
+    for threshold in thresholds:
+        confident = (confidence >= threshold).all(axis=1)
+        cascade = np.where(confident[None, :, None], pre_codes[None], llm_codes)
+        prescreen_only = np.where(confident[:, None], pre_codes, -1)[None]
+        rows.append({
+            "threshold": threshold,
+            "calls_saved": float(confident.mean()) if n_args else 0.0,
+            "prescreen_accuracy": accuracy(prescreen_only),
+            "llm_accuracy": llm_accuracy,
+            "cascade_accuracy": accuracy(cascade),
+        })
+    return rows
+
+
+def print_cascade_report(rows):
+    print(f"\n{'threshold':>10}{'calls saved':>13}{'pre-screen':>12}" + "".join(f"{dim:>20}" for dim in dimensions))
+    print("-" * (35 + 20 * len(dimensions)))
+    print(f"{'LLM only':>10}{'0.00%':>13}{'':>12}" + "".join(f"{a:>20.2%}" for a in rows[0]["llm_accuracy"]))
+    for row in rows:
+        change = row["cascade_accuracy"] - row["llm_accuracy"]
+        cells = "".join(f"{f'{a:.2%} ({c:+.2%})':>20}" for a, c in zip(row["cascade_accuracy"], change))
+        prescreen = float(np.mean(row["prescreen_accuracy"]))
+        print(f"{row['threshold']:>10.2f}{row['calls_saved']:>13.2%}{prescreen:>12.2%}{cells}")
+    print("\npre-screen: mean accuracy of the pre-screen on the arguments it keeps from the LLM.")
+    print("Cascade accuracy per dimension, in brackets the change against LLM only.")
+
+
+def main():
+    from dataset_division import test_data
+
+    schemas_map = {
+        "1": "binary_good_bad",
+        "2": "ternary_bad_medium_good",
+        "3": "binary_effective_ineffective",
+        "4": "numeric_1_to_5",
+    }
+    print("Available schemas:")
+    for key, name in schemas_map.items():
+        print(f"{key}: {name}")
+    schema_option = input("Select the label schema (1-4): ").strip()
+    if schema_option not in schemas_map:
+        print("Invalid option. Finishing execution.")
+        sys.exit(1)
+    schema_name = schemas_map[schema_option]
+
+    response_dir = "model_responses"
+    response_files = sorted(f for f in os.listdir(response_dir) if f.startswith("model_responses_") and f.endswith(".json"))
+    if not response_files:
+        print("No model response files found in the 'model_responses' directory.")
+        sys.exit(1)
+
+    print("Response files available:")
+    for idx, file in enumerate(response_files):
+        print(f"{idx + 1}: {file}")
+    try:
+        selected_index = int(input("Select a file by number to compare against: ")) - 1
+    except ValueError:
+        print("Invalid input. Please enter a number.")
+        sys.exit(1)
+    if selected_index < 0 or selected_index >= len(response_files):
+        print("Invalid selection.")
+        sys.exit(1)
+
+    print(f"\nTraining the pre-screen on the train and val sets of split {SPLIT_ID} ...")
+    prescreen = train_prescreen(schema_name)
+
+    all_runs = load_runs(os.path.join(response_dir, response_files[selected_index]))
+    texts = [entry["text"] for entry in test_data]
+    ground_truth = [entry["labels"] for entry in test_data]
+    print(f"\n--- CASCADE REPORT: {response_files[selected_index]} ({len(all_runs)} runs) ---")
+    print_cascade_report(compute_cascade_report(prescreen, texts, all_runs, ground_truth, schema_name))
+
+
+if __name__ == "__main__":
+    if LOG_TO_FILE:
+        log_dir = "evaluation"
+        os.makedirs(log_dir, exist_ok=True)
+        date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+        log_filename = os.path.join(log_dir, f"prescreen_{date}.txt")
+        with Logger(log_filename) as logger, contextlib.redirect_stdout(logger):
+            main()
+    else:
+        main()
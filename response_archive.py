@@ -0,0 +1,255 @@
+import datetime
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from Logger import Logger
+from analyze_results_not_binary import dimensions
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARCHIVE_DIR = "response_archive"
+BLOCK_RECORDS = 64  # records compressed together; a crash loses at most the raw text of one unwritten block
+ZSTD_LEVEL = 9
+ZLIB_LEVEL = 6
+
+
+def _compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This archive is zstd-compressed, install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+# Append-only archive of the raw model responses of one campaign:
+#   <name>.blocks       compressed blocks one after another, each holds up to BLOCK_RECORDS JSON lines
+#   <name>.index.jsonl  one line per response: run, argument, dimension, attempt (part for chunked
+#                       arguments) and where it is: block offset, block length, line in the block, codec
+# Blocks are zstd when zstandard is installed, zlib otherwise; every index line says which one.
+# fields (split, dataset, prompt_version, ...) are kept with every record, reparse saves them with the runs.
+# Nothing is rewritten, reopening an archive appends to it
+class ResponseArchive:
+    def __init__(self, name, archive_dir=ARCHIVE_DIR, **fields):
+        os.makedirs(archive_dir, exist_ok=True)
+        self.name = name
+        self.fields = fields
+        self.blocks_path = os.path.join(archive_dir, f"{name}.blocks")
+        self.index_path = os.path.join(archive_dir, f"{name}.index.jsonl")
+        self.codec = "zstd" if zstandard is not None else "zlib"
+        self.lock = threading.Lock()
+        self.pending = []  # (index entry, record) not written yet
+        self.blocks = None
+        self.index = None
+
+    def _open(self):
+        if self.blocks is None:
+            self.blocks = open(self.blocks_path, "ab")
+            self.index = open(self.index_path, "a", encoding="utf-8")
+
+    # Stores one raw response. dimension is '' for prompts that score the four dimensions, attempt is the
+    # retry number (0 = first request); extra fields (model, version, seconds, ...) are kept with the text
+    def write(self, run, argument, text, dimension="", attempt=0, part=0, **fields):
+        entry = {"run": run, "argument": argument, "dimension": dimension, "attempt": attempt}
+        if part:
+            entry["part"] = part
+        record = {**entry, "text": text, "time": time.time(), **self.fields, **fields}
+        with self.lock:
+            self.pending.append((entry, record))
+            if len(self.pending) >= BLOCK_RECORDS:
+                self._write_block()
+
+    def _write_block(self):
+        if not self.pending:
+            return
+        self._open()
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for _, record in self.pending).encode("utf-8")
+        block = _compress(data, self.codec)
+        offset = self.blocks.seek(0, os.SEEK_END)
+        self.blocks.write(block)
+        self.blocks.flush()
+        self.index.write("".join(
+            json.dumps({**entry, "offset": offset, "length": len(block), "line": line, "codec": self.codec}) + "\n"
+            for line, (entry, _) in enumerate(self.pending)))
+        self.index.flush()
+        self.pending = []
+
+    def flush(self):
+        with self.lock:
+            self._write_block()
+
+    def close(self):
+        self.flush()
+        if self.blocks is not None:
+            self.blocks.close()
+            self.index.close()
+            self.blocks = self.index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def entries(self):
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    # Every archived record in write order (or only those of entries, a subset of entries()),
+    # each block is read and decompressed once
+    def records(self, entries=None):
+        self.flush()
+        if entries is None:
+            entries = self.entries()
+        if not entries:
+            return
+        with open(self.blocks_path, "rb") as f:
+            current, lines = None, []
+            for entry in entries:
+                if entry["offset"] != current:
+                    f.seek(entry["offset"])
+                    lines = _decompress(f.read(entry["length"]), entry["codec"]).decode("utf-8").splitlines()
+                    current = entry["offset"]
+                yield json.loads(lines[entry["line"]])
+
+    # Records of one argument (optionally one run / dimension), sorted by part and attempt.
+    # The index is filtered first, only the blocks holding a matching record are read
+    def get(self, argument, run=None, dimension=None):
+        self.flush()
+        entries = [e for e in self.entries()
+                   if e["argument"] == argument and (run is None or e["run"] == run)
+                   and (dimension is None or e["dimension"] == dimension)]
+        return sorted(self.records(entries), key=lambda r: (r["run"], r["dimension"], r.get("part", 0), r["attempt"]))
+
+
+# Rebuilds the all_runs of an archive with another extractor, no LLM calls: like the runner, each
+# (run, argument, dimension, part) keeps the first attempt the extractor accepts. Prompts per dimension
+# (model_1by1.py) are merged into one label dict, chunked arguments are aggregated with aggregate_chunks,
+# a batched response (BATCH_SIZE > 1) is split with parse_label_array and gives the object of its argument.
+# extractor(text) returns a label dict or None
+def reparse(archive, extractor, schema_name=None):
+    attempts = {}
+    for record in archive.records():
+        key = (record["run"], record["argument"], record["dimension"], record.get("part", 0))
+        attempts.setdefault(key, []).append(record)
+
+    labels = {}
+    for (run, argument, dimension, part), records in attempts.items():
+        parsed = None
+        for record in sorted(records, key=lambda r: r["attempt"]):
+            if "batch_size" in record:
+                from batched_prompts import parse_label_array
+                parsed = parse_label_array(record["text"], record["batch_size"], extractor)[record["batch_position"]]
+            else:
+                parsed = extractor(record["text"])
+            if parsed is not None and (dimension in parsed if dimension else all(dim in parsed for dim in dimensions)):
+                break
+            parsed = None
+        labels.setdefault((run, argument), {}).setdefault(part, {})
+        if dimension:
+            labels[(run, argument)][part][dimension] = parsed[dimension] if parsed else None
+        else:
+            labels[(run, argument)][part] = parsed
+
+    n_runs = max((run for run, _ in labels), default=-1) + 1
+    n_args = max((argument for _, argument in labels), default=-1) + 1
+    all_runs = [[None] * n_args for _ in range(n_runs)]
+    for (run, argument), parts in labels.items():
+        if len(parts) == 1:
+            all_runs[run][argument] = next(iter(parts.values()))
+        else:
+            from context_window import aggregate_chunks
+            all_runs[run][argument] = aggregate_chunks([parts[p] for p in sorted(parts)], schema_name)
+    return all_runs
+
+
+def list_archives(archive_dir=ARCHIVE_DIR):
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(f.removesuffix(".index.jsonl") for f in os.listdir(archive_dir) if f.endswith(".index.jsonl"))
+
+
+# Extractor given as "module:function", e.g. "my_parsers:lenient_labels"; empty = the model.py parser
+def load_extractor(spec, version):
+    if spec:
+        module_name, function_name = spec.split(":")
+        return getattr(importlib.import_module(module_name), function_name)
+    import model
+    model.configure(version, Logger(None, level="ERROR"))
+    return model.extract_labels
+
+
+def main():
+    archives = list_archives()
+    if not archives:
+        print(f"No archives found in '{ARCHIVE_DIR}'.")
+        sys.exit(1)
+    print("Archives available:")
+    for idx, name in enumerate(archives):
+        print(f"{idx + 1}: {name}")
+    try:
+        name = archives[int(input("Select an archive by number to re-parse: ")) - 1]
+    except (ValueError, IndexError):
+        print("Invalid selection.")
+        sys.exit(1)
+
+    import model
+    from dataset_division import split_meta
+    archive = ResponseArchive(name)
+    first = next(archive.records(), None)
+    if first is None:
+        print(f"Archive '{name}' holds no responses.")
+        sys.exit(1)
+    # the runners record the prompt version with every response, archives of model_1by1.py and model_ft.py do not
+    version = first.get("version")
+    if version is None:
+        try:
+            version = int(input("Prompt version of the archive (1 to 5): "))
+        except ValueError:
+            version = None
+    if version not in model.version_schemas:
+        print("Invalid version.")
+        sys.exit(1)
+    spec = input("Extractor as module:function (empty = model.extract_labels): ").strip()
+    extractor = load_extractor(spec, version)
+
+    # split, model and prompt version of the campaign, like the response file of the runner
+    if "split" in first:
+        meta = {"split": first["split"], "dataset": first.get("dataset")}
+    else:
+        print("This archive does not record its split, the active split is saved with the runs.")
+        meta = split_meta()
+    meta["model"] = first.get("model", "unknown")
+    meta["prompt_version"] = first.get("prompt_version", f"v{version}")
+
+    start = time.time()
+    all_runs = reparse(archive, extractor, model.version_schemas[version])
+    date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+    output_filename = f"model_responses_{name}_reparsed_{date}.json"
+    with open(output_filename, "w") as f:
+        json.dump({**meta, "all_runs": all_runs}, f, indent=2)
+
+    n_items = sum(len(run) for run in all_runs)
+    n_missing = sum(item is None for run in all_runs for item in run)
+    print(f"Re-parsed {len(archive.entries())} responses into {len(all_runs)} runs x "
+          f"{len(all_runs[0]) if all_runs else 0} arguments in {time.time() - start:.2f} s, "
+          f"{n_missing} of {n_items} items without valid labels")
+    print(f"\n--- SAVED RESPONSES: {output_filename} ---")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from analyze_results_not_binary import dimensions, load_runs, normalize_for_dimension, response_meta
+
+WAREHOUSE_PATH = "results_warehouse.sqlite"
+RESPONSE_DIR = "model_responses"
+MODEL_FAMILIES = ["llama", "qwen", "gemma", "mistral", "phi", "deepseek"]  # model names recognised in file names
+# file name -> {"model", "prompt_version", "schema"} for old files that do not record them and whose name does not say it
+EXPERIMENT_META = {}
+MIN_MODELS = 2  # an argument is "wrong for every model" only when at least this many models scored it
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiments (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    schema TEXT NOT NULL,
+    split TEXT NOT NULL,
+    n_runs INTEGER NOT NULL,
+    n_arguments INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    ingested REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS labels (
+    experiment INTEGER NOT NULL REFERENCES experiments (id) ON DELETE CASCADE,
+    run INTEGER NOT NULL,
+    argument_id INTEGER NOT NULL,
+    dimension TEXT NOT NULL,
+    label TEXT,
+    gt_score REAL,
+    correct INTEGER,
+    PRIMARY KEY (experiment, run, argument_id, dimension)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS labels_argument ON labels (argument_id, dimension);
+CREATE TABLE IF NOT EXISTS argument_scores (
+    experiment INTEGER NOT NULL REFERENCES experiments (id) ON DELETE CASCADE,
+    model TEXT NOT NULL,
+    argument_id INTEGER NOT NULL,
+    dimension TEXT NOT NULL,
+    n_valid INTEGER NOT NULL,
+    n_correct INTEGER NOT NULL,
+    gt_score REAL,
+    PRIMARY KEY (experiment, dimension, argument_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS argument_scores_argument
+    ON argument_scores (dimension, argument_id, model, n_valid, n_correct, gt_score);
+CREATE TABLE IF NOT EXISTS experiment_scores (
+    experiment INTEGER NOT NULL REFERENCES experiments (id) ON DELETE CASCADE,
+    dimension TEXT NOT NULL,
+    n_valid INTEGER NOT NULL,
+    n_correct INTEGER NOT NULL,
+    PRIMARY KEY (experiment, dimension)
+) WITHOUT ROWID;
+CREATE VIEW IF NOT EXISTS results AS
+    SELECT e.name AS experiment, e.model, e.prompt_version, l.run, l.argument_id, l.dimension, l.label, l.gt_score,
+           l.correct
+    FROM labels l JOIN experiments e ON e.id = l.experiment;
+"""
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# Model and prompt version of a response file: the ones the runners save in it (file_meta, see response_meta),
+# else guessed from the name of old files, e.g. model_responses_ft_qwen2.5_81a_v2.json -> ("qwen2.5", "ft_v2");
+# EXPERIMENT_META overrides both
+def experiment_meta(filename, file_meta=None):
+    base = os.path.splitext(filename)[0].replace("model_responses_", "")
+    parts = base.split("_")
+    model = next((p for p in parts if any(p.lower().startswith(family) for family in MODEL_FAMILIES)), "unknown")
+    version = [p for p in parts if re.fullmatch(r"v\d+|prompt\w*|oldprompt|1by1|ft|promptft", p)]
+    meta = {"model": model, "prompt_version": "_".join(version) or "default"}
+    saved = {k: file_meta[k] for k in ("model", "prompt_version") if file_meta and k in file_meta}
+    return {**meta, **saved, **EXPERIMENT_META.get(filename, {})}
+
+
+# Dataset rows of the test arguments of a split and their annotated scores
+def split_truth(split_id):
+    from dataset_division import get_split, store
+    test_positions = get_split(split_id)[2]
+    return test_positions, [{dim: float(v) for dim, v in zip(dimensions, store.labels[p])} for p in test_positions]
+
+
+# Local analytical store of every run of every response file, one row per
+# (experiment, run, argument_id, dimension) with the label, the ground-truth score and whether they agree.
+# argument_id is the dataset row of the argument, so experiments on different splits line up.
+# argument_scores and experiment_scores keep the counts per (experiment, argument, dimension) and per
+# (experiment, dimension) the queries aggregate (with the model copied in), so no query reads the labels table
+class ResultsWarehouse:
+    def __init__(self, path=WAREHOUSE_PATH):
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # Loads one response file against the test arguments of the split it was scored on (the active SPLIT_ID
+    # for the files that do not record it); a file already ingested with the same content and split is skipped,
+    # a changed one replaces its rows. Returns the number of label rows written, None for a file scored on
+    # another dataset version
+    def ingest_file(self, path, truths):
+        from analysis_pipeline import detect_schema
+        from dataset_division import SPLIT_ID, dataset_hash
+        from prescreen import round_ground_truths
+
+        name = os.path.basename(path)
+        file_meta = response_meta(path)
+        if file_meta.get("dataset", dataset_hash()) != dataset_hash():
+            return None
+        split = file_meta.get("split", SPLIT_ID)
+        sha = _sha256(path)
+        row = self.conn.execute("SELECT sha256, split FROM experiments WHERE name = ?", (name,)).fetchone()
+        if row is not None and row["sha256"] == sha and row["split"] == split:
+            return 0
+
+        if split not in truths:
+            truths[split] = split_truth(split)
+        test_positions, gt_scores = truths[split]
+        all_runs = load_runs(path, check_split=False)
+        meta = experiment_meta(name, file_meta)
+        schema = meta.get("schema") or detect_schema(all_runs)
+        n_args = min(len(all_runs[0]) if all_runs else 0, len(test_positions))
+        gt = gt_scores[:n_args]
+        gt_codes = [{dim: normalize_for_dimension(labels[dim], schema, dim, verbose=False) for dim in dimensions}
+                    for labels in round_ground_truths(gt, schema)]
+
+        rows = []
+        for r, run in enumerate(all_runs):
+            for i, item in enumerate(run[:n_args]):
+                for dim in dimensions:
+                    label = item.get(dim) if isinstance(item, dict) else None
+                    code = normalize_for_dimension(label, schema, dim, verbose=False) if label is not None else None
+                    correct = None if code is None or gt_codes[i][dim] is None else int(code == gt_codes[i][dim])
+                    rows.append((r, int(test_positions[i]), dim, None if label is None else str(label),
+                                 float(gt[i][dim]), correct))
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute("DELETE FROM experiments WHERE name = ?", (name,))
+            experiment = self.conn.execute(
+                "INSERT INTO experiments (name, model, prompt_version, schema, split, n_runs, n_arguments, sha256, ingested) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, meta["model"], meta["prompt_version"], schema, split, len(all_runs), n_args, sha, time.time())).lastrowid
+            self.conn.executemany(
+                "INSERT INTO labels (experiment, run, argument_id, dimension, label, gt_score, correct) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", [(experiment, *row) for row in rows])
+            self.conn.execute(
+                "INSERT INTO argument_scores (experiment, model, argument_id, dimension, n_valid, n_correct, gt_score) "
+                "SELECT experiment, ?, argument_id, dimension, COUNT(correct), COALESCE(SUM(correct), 0), MAX(gt_score) "
+                "FROM labels WHERE experiment = ? GROUP BY argument_id, dimension", (meta["model"], experiment))
+            self.conn.execute(
+                "INSERT INTO experiment_scores (experiment, dimension, n_valid, n_correct) "
+                "SELECT experiment, dimension, SUM(n_valid), SUM(n_correct) FROM argument_scores "
+                "WHERE experiment = ? GROUP BY dimension", (experiment,))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    # Every model_responses_*.json of response_dir, each against the test arguments of its own split.
+    # Returns {file name: rows written} (0 for the files already up to date, None for the skipped ones)
+    def ingest_dir(self, response_dir=RESPONSE_DIR):
+        truths = {}  # split ID -> split_truth, computed once per split
+        written = {}
+        for filename in sorted(f for f in os.listdir(response_dir) if f.startswith("model_responses_") and f.endswith(".json")):
+            written[filename] = self.ingest_file(os.path.join(response_dir, filename), truths)
+        return written
+
+    def experiments(self):
+        return [dict(row) for row in self.conn.execute(
+            "SELECT id, name, model, prompt_version, schema, split, n_runs, n_arguments FROM experiments ORDER BY name")]
+
+    # Accuracy of every experiment on one dimension (or over the four), best first
+    def leaderboard(self, dimension=None):
+        where, params = ("WHERE s.dimension = ?", [dimension]) if dimension else ("", [])
+        return [dict(row) for row in self.conn.execute(
+            "SELECT e.name AS experiment, e.model, e.prompt_version, "
+            "       CAST(SUM(s.n_correct) AS REAL) / SUM(s.n_valid) AS accuracy, SUM(s.n_valid) AS n_labels "
+            f"FROM experiment_scores s JOIN experiments e ON e.id = s.experiment {where} "
+            "GROUP BY s.experiment HAVING SUM(s.n_valid) > 0 ORDER BY accuracy DESC", params)]
+
+    # Arguments of one dimension ordered from the hardest: share of correct labels over every experiment,
+    # with the number of models and experiments that scored them
+    def argument_difficulty(self, dimension, limit=20):
+        return [dict(row) for row in self.conn.execute(
+            "SELECT argument_id, MAX(gt_score) AS gt_score, "
+            "       CAST(SUM(n_correct) AS REAL) / SUM(n_valid) AS accuracy, SUM(n_valid) AS n_labels, "
+            "       COUNT(DISTINCT model) AS n_models, COUNT(*) AS n_experiments "
+            "FROM argument_scores WHERE dimension = ? AND n_valid > 0 "
+            "GROUP BY argument_id ORDER BY accuracy, n_labels DESC LIMIT ?", (dimension, limit))]
+
+    # Arguments of one dimension that every model gets wrong: for each model the majority of its labels
+    # (over its runs and experiments) disagree with the ground truth, and at least min_models models scored it
+    def wrong_for_every_model(self, dimension, min_models=MIN_MODELS):
+        return [dict(row) for row in self.conn.execute(
+            "SELECT argument_id, MAX(gt_score) AS gt_score, COUNT(*) AS n_models, MAX(accuracy) AS best_accuracy "
+            "FROM ("
+            "    SELECT argument_id, model, MAX(gt_score) AS gt_score, "
+            "           CAST(SUM(n_correct) AS REAL) / SUM(n_valid) AS accuracy "
+            "    FROM argument_scores WHERE dimension = ? AND n_valid > 0 GROUP BY argument_id, model"
+            ") GROUP BY argument_id HAVING MAX(accuracy) < 0.5 AND COUNT(*) >= ? "
+            "ORDER BY best_accuracy, argument_id", (dimension, min_models))]
+
+
+def print_rows(rows, columns):
+    print("\n" + "".join(f"{c:>{w}}" if w > 0 else f"{c:<{-w}}" for c, w in columns))
+    for row in rows:
+        cells = ""
+        for c, w in columns:
+            v = row[c]
+            v = f"{v:.3f}" if isinstance(v, float) else str(v)
+            cells += f"{v:>{w}}" if w > 0 else f"{v:<{-w}}"
+        print(cells)
+
+
+def select_dimension(allow_all=False):
+    for idx, dim in enumerate(dimensions):
+        print(f"{idx + 1}: {dim}")
+    choice = input(f"Select a dimension (1-4{', empty = all' if allow_all else ''}): ").strip()
+    if allow_all and not choice:
+        return None
+    if choice not in ("1", "2", "3", "4"):
+        print("Invalid option. Finishing execution.")
+        sys.exit(1)
+    return dimensions[int(choice) - 1]
+
+
+def main():
+    warehouse = ResultsWarehouse()
+    print("1: ingest model_responses/\n2: list experiments\n3: leaderboard\n4: hardest arguments\n"
+          "5: arguments every model gets wrong")
+    option = input("Select an option (1-5): ").strip()
+    start = time.time()
+
+    if option == "1":
+        written = warehouse.ingest_dir()
+        for name, n in written.items():
+            status = "other dataset" if n is None else f"{n} rows" if n else "up to date"
+            print(f"{name:<60}{status:>14}")
+        print(f"\nIngested {sum(1 for n in written.values() if n)} of {len(written)} files "
+              f"in {time.time() - start:.2f} seconds")
+
+    elif option == "2":
+        print_rows(warehouse.experiments(), [("name", -50), ("model", -14), ("prompt_version", -18),
+                                             ("schema", -30), ("n_runs", 8), ("n_arguments", 13)])
+
+    elif option == "3":
+        dimension = select_dimension(allow_all=True)
+        start = time.time()
+        print(f"\n--- LEADERBOARD: {dimension or 'all dimensions'} ---")
+        print_rows(warehouse.leaderboard(dimension), [("experiment", -50), ("model", -14), ("prompt_version", -18),
+                                                      ("accuracy", 10), ("n_labels", 10)])
+
+    elif option == "4":
+        dimension = select_dimension()
+        start = time.time()
+        print(f"\n--- HARDEST ARGUMENTS: {dimension} ---")
+        print_rows(warehouse.argument_difficulty(dimension), [("argument_id", 12), ("gt_score", 10), ("accuracy", 10),
+                                                              ("n_labels", 10), ("n_models", 10), ("n_experiments", 15)])
+
+    elif option == "5":
+        dimension = select_dimension()
+        start = time.time()
+        rows = warehouse.wrong_for_every_model(dimension)
+        print(f"\n--- {len(rows)} ARGUMENTS WRONG FOR EVERY MODEL ({MIN_MODELS}+ models): {dimension} ---")
+        print_rows(rows, [("argument_id", 12), ("gt_score", 10), ("n_models", 10), ("best_accuracy", 15)])
+
+    else:
+        print("Invalid option. Finishing execution.")
+        sys.exit(1)
+
+    if option != "1":
+        print(f"\nQuery time: {(time.time() - start) * 1000:.1f} ms")
+    warehouse.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import datetime
+import json
+import math
+import os
+import re
+import sys
+import contextlib
+import numpy as np
+from Logger import Logger
+from analyze_results_not_binary import dimensions, encode_ground_truth
+from aggregate_runs import schema_decoders
+
+N_BINS = 10  # calibration bins for the ECE and the reliability table
+THRESHOLDS = np.round(np.arange(0.05, 1.0, 0.05), 2)
+LOG_TO_FILE = True
+
+
+# Character offset where the value of each dimension starts in the generated JSON ("cogency": "Good" -> G)
+def value_offsets(text):
+    offsets = {}
+    for dim in dimensions:
+        match = re.search(rf'"{dim}"\s*:\s*"?', text)
+        if match:
+            offsets[dim] = match.end()
+    return offsets
+
+
+# P(label) of one dimension from the top logprobs of the token where its value starts.
+# Candidate tokens are matched to the labels whose text they start ("G" and " Good" both count for Good),
+# and the probabilities are renormalized over the labels of the schema
+def label_distribution(top_logprobs, labels):
+    mass = {str(label): 0.0 for label in labels}
+    for token, logprob in top_logprobs.items():
+        piece = token.strip().strip('"').strip().lower()
+        if not piece:
+            continue
+        matches = [label for label in mass if label.lower().startswith(piece)]
+        if len(matches) == 1:
+            mass[matches[0]] += math.exp(logprob)
+    total = sum(mass.values())
+    if total == 0:
+        return None
+    return {label: p / total for label, p in mass.items()}
+
+
+# Soft labels from one generation with logprobs ({"response", "logprobs"} of backend.generate_logprobs)
+# returns {dim: {label: probability}}, None for the dimensions whose value token was not found
+def soft_labels(generation, schema_name):
+    text = generation["response"]
+    tokens = generation["logprobs"]
+    labels = list(schema_decoders[schema_name].values())
+
+    # the generated tokens concatenate to the response text, so token i covers [starts[i], starts[i + 1])
+    starts = np.cumsum([0] + [len(t["token"]) for t in tokens])
+    probabilities = {dim: None for dim in dimensions}
+    for dim, offset in value_offsets(text).items():
+        i = int(np.searchsorted(starts, offset, side="right")) - 1
+        if 0 <= i < len(tokens):
+            top = dict(tokens[i]["top_logprobs"]) or {tokens[i]["token"]: tokens[i]["logprob"]}
+            probabilities[dim] = label_distribution(top, labels)
+    return probabilities
+
+
+# Reads a soft-label response file: returns (all_runs, probabilities), probabilities[i][dim] = {label: p}
+def load_probabilities(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or "probabilities" not in data:
+        raise ValueError(f"{path} is not a soft-label file (no 'probabilities')")
+    return data["all_runs"], data["probabilities"]
+
+
+# Probability matrix (n_args, n_classes) of one dimension, columns in normalize_for_dimension code order;
+# rows of arguments without probabilities are NaN
+def probability_matrix(probabilities, dim, schema_name):
+    decoder = schema_decoders[schema_name]
+    n_classes = max(decoder) + 1
+    matrix = np.full((len(probabilities), n_classes), np.nan)
+    for i, item in enumerate(probabilities):
+        probs = (item or {}).get(dim)
+        if probs is None:
+            continue
+        matrix[i] = 0.0
+        for code, label in decoder.items():
+            matrix[i, code] = probs.get(str(label), 0.0)
+    return matrix
+
+
+# Calibration of the soft labels of every dimension against the ground truth:
+# Brier score, log loss and expected calibration error of the predicted class, plus, for binary schemas,
+# the accuracy at every threshold on P(class 1) and the best one
+def compute_calibration(probabilities, ground_truths, schema_name, n_bins=N_BINS):
+    gt_codes = encode_ground_truth(ground_truths[:len(probabilities)], schema_name)
+    results = {}
+    for d, dim in enumerate(dimensions):
+        matrix = probability_matrix(probabilities, dim, schema_name)
+        gt = gt_codes[:, d]
+        valid = (gt >= 0) & ~np.isnan(matrix).any(axis=1)
+        if not valid.any():
+            results[dim] = None
+            continue
+        p, y = matrix[valid], gt[valid]
+        one_hot = np.eye(p.shape[1])[y]
+
+        confidence = p.max(axis=1)
+        correct = p.argmax(axis=1) == y
+        bins = np.minimum((confidence * n_bins).astype(int), n_bins - 1)
+        reliability = []
+        ece = 0.0
+        for b in range(n_bins):
+            in_bin = bins == b
+            if in_bin.any():
+                reliability.append((b / n_bins, (b + 1) / n_bins, int(in_bin.sum()),
+                                    float(confidence[in_bin].mean()), float(correct[in_bin].mean())))
+                ece += in_bin.mean() * abs(confidence[in_bin].mean() - correct[in_bin].mean())
+
+        res = {
+            "n_samples": int(valid.sum()),
+            "accuracy": float(correct.mean()),
+            "brier": float(((p - one_hot) ** 2).sum(axis=1).mean()),
+            "log_loss": float(-np.log(np.clip(p[np.arange(len(y)), y], 1e-12, 1)).mean()),
+            "ece": float(ece),
+            "reliability": reliability,
+        }
+        if p.shape[1] == 2:
+            accuracies = [float(((p[:, 1] >= t).astype(int) == y).mean()) for t in THRESHOLDS]
+            best = int(np.argmax(accuracies))
+            res["threshold_accuracy"] = list(zip(THRESHOLDS.tolist(), accuracies))
+            res["best_threshold"] = float(THRESHOLDS[best])
+            res["best_threshold_accuracy"] = accuracies[best]
+        results[dim] = res
+    return results
+
+
+def print_calibration(results):
+    for dim in dimensions:
+        res = results[dim]
+        print(f"\n --- {dim.upper()} ---")
+        if res is None:
+            print("No arguments with both probabilities and a valid ground truth.")
+            continue
+        print(f"Arguments: {res['n_samples']}, accuracy (argmax): {res['accuracy']:.2%}")
+        print(f"Brier score: {res['brier']:.4f}, log loss: {res['log_loss']:.4f}, ECE: {res['ece']:.4f}")
+        print(f"\n{'confidence':>14}{'n':>6}{'mean conf':>11}{'accuracy':>10}")
+        for low, high, n, conf, acc in res["reliability"]:
+            print(f"{f'{low:.1f}-{high:.1f}':>14}{n:>6}{conf:>11.2%}{acc:>10.2%}")
+        if "best_threshold" in res:
+            print(f"\nBest threshold on P(class 1): {res['best_threshold']:.2f} "
+                  f"-> accuracy {res['best_threshold_accuracy']:.2%}")
+
+
+def main():
+    from dataset_division import test_data
+    from prescreen import round_ground_truths
+
+    schemas_map = {
+        "1": "binary_good_bad",
+        "2": "ternary_bad_medium_good",
+        "3": "binary_effective_ineffective",
+        "4": "numeric_1_to_5",
+    }
+    print("Available schemas:")
+    for key, name in schemas_map.items():
+        print(f"{key}: {name}")
+    schema_option = input("Select the label schema (1-4): ").strip()
+    if schema_option not in schemas_map:
+        print("Invalid option. Finishing execution.")
+        sys.exit(1)
+    schema_name = schemas_map[schema_option]
+
+    response_dir = "model_responses"
+    response_files = []
+    for f in sorted(os.listdir(response_dir)):
+        if f.startswith("model_responses_") and f.endswith(".json"):
+            with open(os.path.join(response_dir, f)) as fh:
+                if '"probabilities"' in fh.read():
+                    response_files.append(f)
+    if not response_files:
+        print("No soft-label response files (SOFT_LABELS = True in model.py) found in 'model_responses'.")
+        sys.exit(1)
+
+    print("Soft-label files available:")
+    for idx, file in enumerate(response_files):
+        print(f"{idx + 1}: {file}")
+    try:
+        selected_index = int(input("Select a file by number to evaluate: ")) - 1
+    except ValueError:
+        print("Invalid input. Please enter a number.")
+        sys.exit(1)
+    if selected_index < 0 or selected_index >= len(response_files):
+        print("Invalid selection.")
+        sys.exit(1)
+
+    _, probabilities = load_probabilities(os.path.join(response_dir, response_files[selected_index]))
+    ground_truth = round_ground_truths([entry["labels"] for entry in test_data], schema_name)
+    print(f"\n--- CALIBRATION: {response_files[selected_index]} ---")
+    print_calibration(compute_calibration(probabilities, ground_truth, schema_name))
+
+
+if __name__ == "__main__":
+    if LOG_TO_FILE:
+        log_dir = "evaluation"
+        os.makedirs(log_dir, exist_ok=True)
+        date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+        log_filename = os.path.join(log_dir, f"soft_labels_{date}.txt")
+        with Logger(log_filename) as logger, contextlib.redirect_stdout(logger):
+            main()
+    else:
+        main()
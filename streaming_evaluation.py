@@ -0,0 +1,201 @@
+import datetime
+import math
+import os
+import sys
+import contextlib
+import numpy as np
+from Logger import Logger
+from analyze_results_not_binary import dimensions, normalize_for_dimension, encode_ground_truth, print_dynamic_cm
+from checkpoint import CHECKPOINT_DIR, tail_checkpoint, request_stop, stop_requested
+
+REPORT_EVERY = 50  # print a summary every N results
+IDLE_TIMEOUT = 600  # stop following a checkpoint after 10 minutes without new results
+POLL_INTERVAL = 1.0
+MIN_RESULTS = 30  # never call a prompt version losing before this many results
+Z = 1.96  # Wilson bound used for the early-stopping decision
+LOG_TO_FILE = True
+
+# largest code normalize_for_dimension returns for each schema, plus one
+schema_n_classes = {
+    "binary_good_bad": 2,
+    "ternary_bad_medium_good": 3,
+    "binary_effective_ineffective": 2,
+    "numeric_1_to_5": 6,
+}
+
+
+# Upper end of the Wilson score interval for a proportion
+def wilson_upper(successes, n, z=Z):
+    if n == 0:
+        return 1.0
+    p = successes / n
+    denom = 1 + z ** 2 / n
+    centre = p + z ** 2 / (2 * n)
+    margin = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2))
+    return (centre + margin) / denom
+
+
+# Keeps per-dimension confusion matrices, accuracy and inter-run disagreement up to date
+# as (run, argument) results arrive, without waiting for the final response file
+class StreamingEvaluator:
+    def __init__(self, ground_truths, schema_name):
+        self.schema_name = schema_name
+        self.gt = encode_ground_truth(ground_truths, schema_name)
+        n_args = self.gt.shape[0]
+        n_classes = max(schema_n_classes.get(schema_name, 2), int(self.gt.max(initial=0)) + 1)
+
+        self.cm = np.zeros((len(dimensions), n_classes, n_classes), dtype=np.int64)
+        self.first_pred = np.full((n_args, len(dimensions)), -1, dtype=np.int8)
+        self.disagree = np.zeros((n_args, len(dimensions)), dtype=bool)
+        self.invalid = np.zeros(len(dimensions), dtype=np.int64)
+        self.seen = set()
+        self.n_results = 0
+
+    # Adds one result, returns False when the (run, argument) pair was already counted
+    def update(self, run_idx, arg_idx, labels):
+        key = (run_idx, arg_idx)
+        if key in self.seen or arg_idx >= self.gt.shape[0]:
+            return False
+        self.seen.add(key)
+        self.n_results += 1
+
+        for d, dim in enumerate(dimensions):
+            code = None
+            if labels is not None:
+                code = normalize_for_dimension(labels.get(dim), self.schema_name, dim, verbose=False)
+            if code is None:
+                self.invalid[d] += 1
+                continue
+
+            gt = self.gt[arg_idx, d]
+            if gt >= 0:
+                self.cm[d, gt, code] += 1
+
+            first = self.first_pred[arg_idx, d]
+            if first < 0:
+                self.first_pred[arg_idx, d] = code
+            elif first != code:
+                self.disagree[arg_idx, d] = True
+        return True
+
+    def update_record(self, record):
+        return self.update(record["run"], record["argument"], record["labels"])
+
+    # Current metrics per dimension
+    def summary(self):
+        results = {}
+        for d, dim in enumerate(dimensions):
+            cm = self.cm[d]
+            n = int(cm.sum())
+            correct = int(np.trace(cm))
+            results[dim] = {
+                "n": n,
+                "correct": correct,
+                "accuracy": correct / n if n else 0.0,
+                "accuracy_upper": wilson_upper(correct, n),
+                "cm": cm.copy(),
+                "invalid": int(self.invalid[d]),
+                "n_args_seen": int((self.first_pred[:, d] >= 0).sum()),
+                "n_disagreements": int(self.disagree[:, d].sum()),
+            }
+        return results
+
+    # A prompt version is clearly losing when even the optimistic (Wilson upper) accuracy,
+    # pooled over the four dimensions, is below the target accuracy
+    def is_clearly_losing(self, target_accuracy, min_results=MIN_RESULTS):
+        if target_accuracy is None or self.n_results < min_results:
+            return False
+        n = int(self.cm.sum())
+        correct = int(sum(np.trace(cm) for cm in self.cm))
+        return wilson_upper(correct, n) < target_accuracy
+
+
+def print_streaming_summary(summary, n_results, show_cm=False):
+    print(f"\n--- {n_results} results ---")
+    print(f"{'Dimension':<16}{'n':>6}{'accuracy':>10}{'upper':>8}{'disagree':>10}{'invalid':>9}")
+    for dim in dimensions:
+        s = summary[dim]
+        disagree = f"{s['n_disagreements']}/{s['n_args_seen']}"
+        print(f"{dim:<16}{s['n']:>6}{s['accuracy']:>10.2%}{s['accuracy_upper']:>8.2%}{disagree:>10}{s['invalid']:>9}")
+        if show_cm:
+            labels = [str(c) for c in range(s["cm"].shape[0])]
+            print_dynamic_cm(s["cm"], labels)
+
+
+# Follows a runner checkpoint and reports as results stream in. When target_accuracy is given and
+# the prompt version is clearly below it, a stop file is written so the runner ends early
+def follow_checkpoint(path, ground_truths, schema_name, target_accuracy=None, follow=True):
+    evaluator = StreamingEvaluator(ground_truths, schema_name)
+    records = tail_checkpoint(path, follow=follow, poll_interval=POLL_INTERVAL, idle_timeout=IDLE_TIMEOUT,
+                              should_stop=lambda: stop_requested(path))
+    for record in records:
+        if not evaluator.update_record(record):
+            continue
+        if evaluator.n_results % REPORT_EVERY == 0:
+            print_streaming_summary(evaluator.summary(), evaluator.n_results)
+
+        if evaluator.is_clearly_losing(target_accuracy):
+            print(f"\nAccuracy is clearly below the target {target_accuracy:.2%}, requesting the runner to stop.")
+            request_stop(path, f"accuracy below {target_accuracy:.4f} after {evaluator.n_results} results")
+            break
+
+    print_streaming_summary(evaluator.summary(), evaluator.n_results, show_cm=True)
+    return evaluator
+
+
+def main():
+    from dataset_division import test_data
+
+    schemas_map = {
+        "1": "binary_good_bad",
+        "2": "ternary_bad_medium_good",
+        "3": "binary_effective_ineffective",
+        "4": "numeric_1_to_5",
+    }
+    print("Available schemas:")
+    for key, name in schemas_map.items():
+        print(f"{key}: {name}")
+    schema_option = input("Select the label schema (1-4): ").strip()
+    if schema_option not in schemas_map:
+        print("Invalid option. Finishing execution.")
+        sys.exit(1)
+    schema_name = schemas_map[schema_option]
+
+    if not os.path.isdir(CHECKPOINT_DIR):
+        print(f"No '{CHECKPOINT_DIR}' directory found.")
+        sys.exit(1)
+    checkpoint_files = sorted(f for f in os.listdir(CHECKPOINT_DIR) if f.endswith(".jsonl"))
+    if not checkpoint_files:
+        print("No checkpoint files found.")
+        sys.exit(1)
+
+    print("Checkpoint files available:")
+    for idx, file in enumerate(checkpoint_files):
+        print(f"{idx + 1}: {file}")
+    try:
+        selected_index = int(input("Select a file by number to follow: ")) - 1
+    except ValueError:
+        print("Invalid input. Please enter a number.")
+        sys.exit(1)
+    if selected_index < 0 or selected_index >= len(checkpoint_files):
+        print("Invalid selection.")
+        sys.exit(1)
+
+    target = input("Target accuracy to beat (e.g. 0.65, empty for none): ").strip()
+    target_accuracy = float(target) if target else None
+
+    ground_truth = [entry["labels"] for entry in test_data]
+    path = os.path.join(CHECKPOINT_DIR, checkpoint_files[selected_index])
+    follow_checkpoint(path, ground_truth, schema_name, target_accuracy)
+
+
+if __name__ == "__main__":
+    if LOG_TO_FILE:
+        log_dir = "evaluation"
+        os.makedirs(log_dir, exist_ok=True)
+        date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+        log_filename = os.path.join(log_dir, f"streaming_evaluation_{date}.txt")
+        with Logger(log_filename) as logger, contextlib.redirect_stdout(logger):
+            main()
+    else:
+        main()
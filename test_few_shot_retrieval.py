@@ -0,0 +1,21 @@
+import numpy as np
+from analyze_results_not_binary import dimensions
+import few_shot_retrieval
+from few_shot_retrieval import FewShotRetriever
+
+
+class FakeEmbedBackend:
+    def embed(self, texts, model=None):
+        return [np.ones(4) for _ in texts]
+
+
+def test_score_5_training_argument_is_shown_as_effective(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ground_truths = [{dim: 5.0 for dim in dimensions}, {dim: 1.0 for dim in dimensions}]
+    monkeypatch.setattr(few_shot_retrieval, "load_training_data",
+                        lambda include_val=True: (["A strong argument.", "A weak argument."], ground_truths))
+
+    retriever = FewShotRetriever("binary_effective_ineffective", k=1, backend=FakeEmbedBackend())
+
+    assert '"overall": "Effective"' in retriever.format_example(0)
+    assert '"overall": "Ineffective"' in retriever.format_example(1)
@@ -0,0 +1,177 @@
+import contextlib
+import csv
+import datetime
+import os
+import sys
+import time
+import numpy as np
+from Logger import Logger
+from analyze_results_not_binary import dimensions, encode_runs, load_runs
+from bootstrap_ci import metrics_from_confusion
+
+RESPONSE_DIR = "model_responses"
+OUTPUT_DIR = os.path.join("evaluation", "threshold_sweep")  # one CSV of curves per response file, and the plot
+# the hard-coded Good/Bad cutoffs, for comparison: analyze_results_not_binary and evaluation_ft use 3.3,
+# error_analysis and fine_tuning 3.33, all of them 3 for reasonableness
+CURRENT_CUTOFFS = {"cogency": 3.3, "effectiveness": 3.3, "reasonableness": 3.0, "overall": 3.3}
+CURVE_METRICS = ["accuracy", "macro_f1", "kappa"]
+LOG_TO_FILE = True
+
+
+# Confusion matrices of one dimension at every cutoff, for every run at once: (n_runs, n_cutoffs, 2, 2).
+# A ground-truth score >= cutoff is Good (1). The arguments are sorted by score once; with k(c) the number of
+# scores below cutoff c, cumulative counts over the sorted order give the Bad side of every cutoff and the
+# totals minus them the Good side, so no cutoff re-encodes the labels.
+# pred_codes: (n_runs, n_args) Good/Bad codes, -1 for invalid; gt_scores: (n_args,) annotated means
+def sweep_confusion(pred_codes, gt_scores, cutoffs):
+    order = np.argsort(gt_scores, kind="stable")
+    sorted_scores = gt_scores[order]
+    preds = pred_codes[:, order]
+    valid = (preds >= 0).astype(np.int64)
+    good = (preds == 1).astype(np.int64)
+
+    zero = np.zeros((preds.shape[0], 1), dtype=np.int64)
+    cum_valid = np.concatenate([zero, np.cumsum(valid, axis=1)], axis=1)
+    cum_good = np.concatenate([zero, np.cumsum(good, axis=1)], axis=1)
+    below = np.searchsorted(sorted_scores, cutoffs, side="left")
+
+    fp = cum_good[:, below]  # ground truth Bad, predicted Good
+    tn = cum_valid[:, below] - fp
+    tp = cum_good[:, -1:] - fp
+    fn = cum_valid[:, -1:] - cum_valid[:, below] - tp
+    return np.stack([np.stack([tn, fp], axis=-1), np.stack([fn, tp], axis=-1)], axis=-2)
+
+
+# Curves of one response file: {dim: {metric: (n_cutoffs,) mean over runs, metric + "_std": std over runs}}
+# The metrics come from the same vectorized formulas as bootstrap_ci.py
+def compute_threshold_curves(all_runs, gt_scores, cutoffs):
+    codes = encode_runs(all_runs, "binary_good_bad")
+    n_args = min(codes.shape[1], gt_scores.shape[0])
+    curves = {}
+    for d, dim in enumerate(dimensions):
+        cm = sweep_confusion(codes[:, :n_args, d], gt_scores[:n_args, d], cutoffs[dim])
+        n_runs, n_cutoffs = cm.shape[:2]
+        metrics = metrics_from_confusion(cm.reshape(n_runs * n_cutoffs, 2, 2).astype(float))
+        curves[dim] = {}
+        for name in CURVE_METRICS:
+            values = metrics[name].reshape(n_runs, n_cutoffs)
+            curves[dim][name] = np.nanmean(values, axis=0)
+            curves[dim][f"{name}_std"] = np.nanstd(values, axis=0)
+        curves[dim]["good_share"] = (gt_scores[:n_args, d][None, :] >= cutoffs[dim][:, None]).mean(axis=1)
+    return curves
+
+
+# Candidate cutoffs of every dimension: each distinct annotated score of the test arguments, plus the
+# current cutoff so the curves hold its value
+def candidate_cutoffs(gt_scores):
+    return {dim: np.union1d(np.unique(gt_scores[:, d]), [CURRENT_CUTOFFS[dim]]) for d, dim in enumerate(dimensions)}
+
+
+# Mean of the curves of several files (nan where a file has no valid labels)
+def pool_curves(file_curves):
+    pooled = {}
+    for dim in dimensions:
+        pooled[dim] = {name: np.nanmean([curves[dim][name] for curves in file_curves], axis=0)
+                       for name in CURVE_METRICS}
+    return pooled
+
+
+# Best cutoff of every metric and the value at the current cutoff
+def best_cutoffs(curves, cutoffs):
+    summary = {}
+    for dim in dimensions:
+        current = int(np.searchsorted(cutoffs[dim], CURRENT_CUTOFFS[dim]))
+        summary[dim] = {}
+        for name in CURVE_METRICS:
+            values = curves[dim][name]
+            best = int(np.nanargmax(values)) if not np.all(np.isnan(values)) else current
+            summary[dim][name] = {"best_cutoff": float(cutoffs[dim][best]), "best": float(values[best]),
+                                  "current": float(values[current])}
+    return summary
+
+
+def print_summary(summary):
+    print(f"\n{'Dimension':<16}{'Metric':<10}{'current':>10}{'at':>7}{'best':>10}{'at':>7}{'gain':>9}")
+    print("-" * 69)
+    for dim in dimensions:
+        for name in CURVE_METRICS:
+            s = summary[dim][name]
+            print(f"{dim:<16}{name:<10}{s['current']:>10.3f}{CURRENT_CUTOFFS[dim]:>7.2f}"
+                  f"{s['best']:>10.3f}{s['best_cutoff']:>7.2f}{s['best'] - s['current']:>+9.3f}")
+
+
+def write_curves_csv(path, curves, cutoffs):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        columns = ["good_share"] + [c for name in CURVE_METRICS for c in (name, f"{name}_std")]
+        writer.writerow(["dimension", "cutoff"] + columns)
+        for dim in dimensions:
+            for j, cutoff in enumerate(cutoffs[dim]):
+                writer.writerow([dim, f"{cutoff:.4f}"] + [f"{curves[dim][c][j]:.4f}" for c in columns])
+
+
+def plot_curves(path, pooled, cutoffs):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, axs = plt.subplots(1, len(dimensions), figsize=(20, 4.5), sharey=True)
+    for ax, dim in zip(axs, dimensions):
+        for name in CURVE_METRICS:
+            ax.plot(cutoffs[dim], pooled[dim][name], marker=".", label=name)
+        ax.axvline(CURRENT_CUTOFFS[dim], color="grey", linestyle="--", linewidth=1)
+        ax.set_title(dim.upper())
+        ax.set_xlabel("Good/Bad cutoff on the annotated score")
+    axs[0].legend()
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close(fig)
+
+
+# Sweeps every binary_good_bad response file of model_responses/ against the test arguments
+def main():
+    from dataset_division import test_data
+    from analysis_pipeline import detect_schema
+
+    start = time.time()
+    gt_scores = np.array([[float(entry["labels"][dim]) for dim in dimensions] for entry in test_data])
+    cutoffs = candidate_cutoffs(gt_scores)
+
+    response_files = sorted(f for f in os.listdir(RESPONSE_DIR) if f.startswith("model_responses_") and f.endswith(".json"))
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    file_curves = []
+    for filename in response_files:
+        try:
+            all_runs = load_runs(os.path.join(RESPONSE_DIR, filename))
+        except ValueError as e:
+            print(f"\nSkipping {e}")
+            continue
+        if detect_schema(all_runs) != "binary_good_bad":
+            print(f"\nSkipping {filename}: not a Good/Bad file")
+            continue
+        curves = compute_threshold_curves(all_runs, gt_scores, cutoffs)
+        file_curves.append(curves)
+        base = os.path.splitext(filename)[0].replace("model_responses_", "")
+        write_curves_csv(os.path.join(OUTPUT_DIR, f"curves_{base}.csv"), curves, cutoffs)
+        print(f"\n=== {filename} ({len(all_runs)} runs, {len(all_runs[0]) if all_runs else 0} arguments) ===")
+        print_summary(best_cutoffs(curves, cutoffs))
+
+    if not file_curves:
+        print("No Good/Bad response files found.")
+        sys.exit(1)
+    pooled = pool_curves(file_curves)
+    plot_curves(os.path.join(OUTPUT_DIR, "threshold_curves.png"), pooled, cutoffs)
+    print(f"\n=== ALL FILES (mean of {len(file_curves)} files) ===")
+    print_summary(best_cutoffs(pooled, cutoffs))
+    print(f"\nCurves saved in {OUTPUT_DIR} ({time.time() - start:.2f} seconds)")
+
+
+if __name__ == "__main__":
+    if LOG_TO_FILE:
+        log_dir = "evaluation"
+        os.makedirs(log_dir, exist_ok=True)
+        date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+        with Logger(os.path.join(log_dir, f"threshold_sweep_{date}.txt")) as logger, contextlib.redirect_stdout(logger):
+            main()
+    else:
+        main()
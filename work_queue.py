@@ -0,0 +1,255 @@
+import datetime
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+import requests
+from Logger import Logger
+from backends import get_backend, BackendError
+
+QUEUE_PATH = "work_queue.sqlite"
+BACKEND = "ollama"
+API_URL = None  # None = the default of BACKEND (ollama http://localhost:11434, openai http://localhost:8080/v1)
+MODEL_NAME = "llama3.1"
+LEASE_SECONDS = 300  # a leased job that is not completed in time goes back to the queue
+MAX_ATTEMPTS = 5
+LOG_LEVEL = "INFO"
+LOG_DIR = "logs"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    model TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    split TEXT NOT NULL,
+    argument INTEGER NOT NULL,
+    run INTEGER NOT NULL,
+    dimension TEXT NOT NULL DEFAULT '',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT,
+    finished REAL,
+    UNIQUE (model, version, split, argument, run, dimension)
+);
+CREATE INDEX IF NOT EXISTS jobs_pull ON jobs (status, priority DESC, id);
+"""
+
+
+# Durable queue of annotation jobs: one row per (model, prompt version, split, argument, run, dimension).
+# dimension is '' for jobs that score the four dimensions with one prompt.
+# status goes pending -> leased -> done, or back to pending when the lease expires or the job fails
+# (until MAX_ATTEMPTS, then failed). Any number of workers can share the file
+class WorkQueue:
+    def __init__(self, path=QUEUE_PATH):
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    # Adds jobs, the ones already in the queue are left as they are. Returns the number of new jobs
+    def enqueue(self, jobs, priority=0):
+        before = self.conn.total_changes
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO jobs (model, version, split, argument, run, dimension, priority) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(j["model"], j["version"], j["split"], j["argument"], j["run"], j.get("dimension", ""), priority)
+                 for j in jobs])
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return self.conn.total_changes - before
+
+    # Every (argument, run) of a campaign, optionally one job per dimension
+    def enqueue_campaign(self, model, version, split, n_args, n_runs, priority=0, dimensions=None):
+        jobs = [
+            {"model": model, "version": version, "split": split, "argument": i, "run": r, "dimension": dim}
+            for r in range(n_runs) for i in range(n_args) for dim in (dimensions or [""])
+        ]
+        return self.enqueue(jobs, priority)
+
+    # Leases up to n jobs for a worker, highest priority first. Expired leases count as pending, unless the
+    # job already used its MAX_ATTEMPTS (a worker that keeps dying on it): those are marked failed
+    def lease(self, worker, n=1, model=None, split=None, lease_seconds=LEASE_SECONDS):
+        now = time.time()
+        filters, params = "", []
+        if model is not None:
+            filters += " AND model = ?"
+            params.append(model)
+        if split is not None:
+            filters += " AND split = ?"
+            params.append(split)
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease expired', lease_owner = NULL, lease_expires = NULL "
+                f"WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?{filters}",
+                [now, MAX_ATTEMPTS] + params)
+            rows = self.conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?))"
+                f"{filters} ORDER BY priority DESC, id LIMIT ?", [now] + params + [n]).fetchall()
+            self.conn.executemany(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?", [(worker, now + lease_seconds, row["id"]) for row in rows])
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return [dict(row) for row in rows]
+
+    # Idempotent: the first result of a job is kept, later writes (e.g. after a lease expired and
+    # another worker redid the job) change nothing. Returns True when this write was the one kept
+    def complete(self, job_id, result):
+        cur = self.conn.execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished = ?, lease_owner = NULL "
+            "WHERE id = ? AND status != 'done'", (json.dumps(result), time.time(), job_id))
+        return cur.rowcount == 1
+
+    # Releases a job after a failed attempt, only while worker still holds its lease
+    def fail(self, job_id, worker, error):
+        self.conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, lease_owner = NULL, lease_expires = NULL WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+            (MAX_ATTEMPTS, error, job_id, worker))
+
+    # Puts failed jobs back in the queue with a fresh attempt count
+    def retry_failed(self):
+        return self.conn.execute(
+            "UPDATE jobs SET status = 'pending', attempts = 0 WHERE status = 'failed'").rowcount
+
+    # Job counts per (model, version, split) and status
+    def progress(self):
+        rows = self.conn.execute(
+            "SELECT model, version, split, status, COUNT(*) AS n FROM jobs "
+            "GROUP BY model, version, split, status ORDER BY model, version, split").fetchall()
+        progress = {}
+        for row in rows:
+            progress.setdefault((row["model"], row["version"], row["split"]), {})[row["status"]] = row["n"]
+        return progress
+
+    # The list-of-runs layout of the model response files, built from the done jobs of a campaign.
+    # Per-dimension jobs are merged into one label dict per (run, argument); missing jobs are None
+    def materialize(self, model, version, split):
+        rows = self.conn.execute(
+            "SELECT argument, run, dimension, status, result FROM jobs WHERE model = ? AND version = ? AND split = ?",
+            (model, version, split)).fetchall()
+        n_runs = max((row["run"] for row in rows), default=-1) + 1
+        n_args = max((row["argument"] for row in rows), default=-1) + 1
+        all_runs = [[None] * n_args for _ in range(n_runs)]
+        for row in rows:
+            if row["status"] != "done":
+                continue
+            result = json.loads(row["result"])
+            if not row["dimension"]:
+                all_runs[row["run"]][row["argument"]] = result
+            elif result is not None:
+                labels = all_runs[row["run"]][row["argument"]] or {}
+                labels[row["dimension"]] = result.get(row["dimension"])
+                all_runs[row["run"]][row["argument"]] = labels
+        return all_runs
+
+
+# Pulls and scores jobs of MODEL_NAME with the model.py prompts until the queue has nothing left for it
+# per-dimension jobs take their dimension from the four-dimension prompt
+def run_worker(queue, worker_id, logger, batch_size=1):
+    import model
+    from dataset_division import SPLIT_ID
+
+    backend = get_backend(BACKEND, MODEL_NAME, API_URL)
+    done = 0
+    while True:
+        jobs = queue.lease(worker_id, batch_size, model=MODEL_NAME, split=SPLIT_ID)
+        if not jobs:
+            break
+        for job in jobs:
+            model.configure(job["version"], logger, backend)
+            start = time.time()
+            try:
+                labels = model.extract_labels(backend.generate(model.build_prompt(model.arguments[job["argument"]])))
+            except (BackendError, requests.exceptions.RequestException) as e:
+                queue.fail(job["id"], worker_id, str(e))
+                logger.error(f"Job {job['id']} failed: {e}", job=job["id"])
+                continue
+            if labels is None:
+                queue.fail(job["id"], worker_id, "invalid response")
+                continue
+            result = {job["dimension"]: labels[job["dimension"]]} if job["dimension"] else labels
+            queue.complete(job["id"], result)
+            done += 1
+            logger.info(f"Job {job['id']} (v{job['version']} run {job['run'] + 1} argument {job['argument'] + 1}"
+                        f"{' ' + job['dimension'] if job['dimension'] else ''}): {result} ({time.time() - start:.2f} seconds)",
+                        job=job["id"], version=job["version"], run=job["run"] + 1, argument=job["argument"] + 1,
+                        labels=result)
+    return done
+
+
+def print_progress(progress):
+    statuses = ["pending", "leased", "done", "failed"]
+    print(f"\n{'model':<20}{'version':>8}{'split':>16}" + "".join(f"{s:>9}" for s in statuses))
+    for (model_name, version, split), counts in progress.items():
+        print(f"{model_name:<20}{version:>8}{split:>16}" + "".join(f"{counts.get(s, 0):>9}" for s in statuses))
+
+
+def main():
+    queue = WorkQueue()
+    print("1: enqueue a campaign\n2: run a worker\n3: show progress\n4: materialize a response file\n5: retry failed jobs")
+    option = input("Select an option (1-5): ").strip()
+
+    if option == "1":
+        from dataset_division import SPLIT_ID, test_data
+        version = int(input("Prompt version (1-5): "))
+        n_runs = int(input("Number of runs: "))
+        priority = int(input("Priority (higher goes first) [0]: ").strip() or 0)
+        added = queue.enqueue_campaign(MODEL_NAME, version, SPLIT_ID, len(test_data), n_runs, priority)
+        print(f"Added {added} jobs for {MODEL_NAME} v{version} on split {SPLIT_ID}")
+
+    elif option == "2":
+        date = datetime.datetime.now().strftime("%Y-%m-%d-%H-%M")
+        worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        os.makedirs(LOG_DIR, exist_ok=True)
+        with Logger(os.path.join(LOG_DIR, f"worker_{worker_id}_{date}.log"), level=LOG_LEVEL) as logger:
+            done = run_worker(queue, worker_id, logger)
+            logger.info(f"Worker {worker_id} finished, {done} jobs done")
+
+    elif option == "3":
+        print_progress(queue.progress())
+
+    elif option == "4":
+        from dataset_division import split_meta
+        campaigns = list(queue.progress())
+        for idx, (model_name, version, split) in enumerate(campaigns):
+            print(f"{idx + 1}: {model_name} v{version} {split}")
+        try:
+            model_name, version, split = campaigns[int(input("Select a campaign by number: ")) - 1]
+        except (ValueError, IndexError):
+            print("Invalid selection.")
+            sys.exit(1)
+        output_filename = f"model_responses_{model_name.replace(':', '_')}_v{version}_{split}_queue.json"
+        with open(output_filename, "w") as f:
+            json.dump({**split_meta(split), "model": model_name, "prompt_version": f"v{version}",
+                       "all_runs": queue.materialize(model_name, version, split)}, f, indent=2)
+        print(f"\n--- SAVED RESPONSES: {output_filename} ---")
+
+    elif option == "5":
+        print(f"{queue.retry_failed()} failed jobs back in the queue")
+
+    else:
+        print("Invalid option. Finishing execution.")
+        sys.exit(1)
+    queue.close()
+
+
+if __name__ == "__main__":
+    main()